@@ -1,3 +1,21 @@
 from django.contrib import admin
+from django.utils.timezone import now
+
+from .models import EmailSortant
 
 # Register your models here.
+
+
+@admin.action(description="Remettre en file d'envoi")
+def remettre_en_file(modeladmin, request, queryset):
+    queryset.update(statut=EmailSortant.EN_ATTENTE, tentatives=0, prochain_essai=now())
+
+
+class EmailSortantAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sujet', 'destinataires', 'statut', 'tentatives', 'prochain_essai', 'date_add', 'date_envoi')
+    list_filter = ('statut', 'date_add')
+    search_fields = ('sujet', 'destinataires')
+    actions = [remettre_en_file]
+
+
+admin.site.register(EmailSortant, EmailSortantAdmin)
@@ -0,0 +1,27 @@
+from django_cron import CronJobBase, Schedule
+
+from base import images, outbox
+
+
+class SendOutboxCronJob(CronJobBase):
+    RUN_EVERY_MINS = 1
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'base.send_outbox'
+
+    def do(self):
+        envoyes, echecs = outbox.drain_all()
+        return f"{envoyes} e-mails envoyés, {echecs} en échec."
+
+
+class GenerateRenditionsCronJob(CronJobBase):
+    RUN_EVERY_MINS = 15
+    LOT = 200
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'base.generate_renditions'
+
+    def do(self):
+        noms = images.fichiers_a_traiter()[:self.LOT]
+        traites = sum(1 for nom in noms if images.generer_sans_erreur(nom) is not None)
+        return f"{traites} images traitées sur {len(noms)}."
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import ImageDerivee
+
+
+logger = logging.getLogger(__name__)
+
+# Rendus : (largeur, hauteur, recadrage). Sans recadrage, l'image tient dans le cadre.
+RENDUS = {
+    'thumb': (160, 160, True),
+    'card': (480, 360, True),
+    'detail': (1024, 768, False),
+}
+
+# Chaque rendu existe aussi en 2x pour les écrans haute densité (jamais agrandi)
+DENSITES = (1, 2)
+
+# Valeur par défaut de l'attribut sizes
+TAILLES = {
+    'thumb': '160px',
+    'card': '(max-width: 576px) 100vw, 480px',
+    'detail': '(max-width: 1024px) 100vw, 1024px',
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DOSSIER = 'rendus'
+
+# Champs image dont on produit les rendus
+CHAMPS = {
+    'shop.Produit': ('image', 'image_2', 'image_3'),
+    'shop.Etablissement': ('logo', 'couverture'),
+    'shop.CategorieEtablissement': ('couverture',),
+    'shop.CategorieProduit': ('couverture',),
+    'customer.Customer': ('photo',),
+    'website.Banniere': ('couverture',),
+    'website.About': ('image',),
+    'website.Galerie': ('image',),
+    'website.Partenaire': ('image',),
+}
+
+_CACHE_TIMEOUT = None
+
+# Une image sans rendus peut être traitée à tout moment par un autre processus (tâche
+# planifiée, autre worker) : son absence n'est gardée en cache que brièvement
+_CACHE_TIMEOUT_SANS_RENDUS = 60
+
+
+def _cle_cache(nom):
+    return 'images:rendus:%s' % hashlib.md5(nom.encode('utf-8')).hexdigest()
+
+
+def _nom_rendu(empreinte, rendu, largeur, format):
+    return '%s/%s/%s-%s-%d.%s' % (
+        DOSSIER, empreinte[:2], empreinte, rendu, largeur, 'jpg' if format == 'jpeg' else format)
+
+
+def _redimensionner(image, largeur, hauteur, recadrer):
+    if recadrer:
+        return ImageOps.fit(image, (largeur, hauteur), Image.LANCZOS)
+    copie = image.copy()
+    copie.thumbnail((largeur, hauteur), Image.LANCZOS)
+    return copie
+
+
+def _encoder(image, format):
+    pil_format, options = FORMATS[format]
+    if image.mode not in ('RGB', 'RGBA') or (format == 'jpeg' and image.mode == 'RGBA'):
+        fond = Image.new('RGB', image.size, 'white')
+        fond.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        image = fond
+    sortie = BytesIO()
+    image.save(sortie, pil_format, **options)
+    return sortie.getvalue()
+
+
+def generer(nom, storage=default_storage):
+    """Produit (si besoin) les rendus du fichier `nom` et enregistre leur manifeste.
+
+    Les rendus sont nommés d'après l'empreinte du contenu : un même fichier n'est
+    traité qu'une fois et un fichier remplacé obtient de nouveaux noms.
+    """
+    with storage.open(nom, 'rb') as fichier:
+        contenu = fichier.read()
+    empreinte = hashlib.sha256(contenu).hexdigest()[:24]
+
+    derivee = ImageDerivee.objects.filter(original=nom).first()
+    if derivee is not None and derivee.empreinte == empreinte:
+        return derivee
+
+    image = Image.open(BytesIO(contenu))
+    image = ImageOps.exif_transpose(image)
+    rendus = {}
+    for rendu, (largeur, hauteur, recadrer) in RENDUS.items():
+        rendus[rendu] = {format: [] for format in FORMATS}
+        for densite in DENSITES:
+            if densite > 1 and image.width < largeur * densite:
+                break
+            redimensionnee = _redimensionner(image, largeur * densite, hauteur * densite, recadrer)
+            for format in FORMATS:
+                chemin = _nom_rendu(empreinte, rendu, redimensionnee.width, format)
+                if not storage.exists(chemin):
+                    chemin = storage.save(chemin, ContentFile(_encoder(redimensionnee, format)))
+                rendus[rendu][format].append(
+                    {'nom': chemin, 'largeur': redimensionnee.width, 'hauteur': redimensionnee.height})
+
+    derivee, _ = ImageDerivee.objects.update_or_create(
+        original=nom,
+        defaults={'empreinte': empreinte, 'largeur': image.width, 'hauteur': image.height, 'rendus': rendus},
+    )
+    cache.delete(_cle_cache(nom))
+    return derivee
+
+
+def generer_sans_erreur(nom):
+    try:
+        return generer(nom)
+    except Exception:
+        logger.exception("Rendus impossibles pour %s", nom)
+
+
+def manifeste(nom):
+    """Rendus connus du fichier `nom` ({} s'il n'a pas encore été traité), mis en cache."""
+    cle = _cle_cache(nom)
+    rendus = cache.get(cle)
+    if rendus is None:
+        rendus = ImageDerivee.objects.filter(original=nom).values_list('rendus', flat=True).first() or {}
+        cache.set(cle, rendus, _CACHE_TIMEOUT if rendus else _CACHE_TIMEOUT_SANS_RENDUS)
+    return rendus
+
+
+def precharger(fichiers):
+    """Met en cache, en une requête, les manifestes d'une liste de champs image :
+    le tag {% image %} n'interroge alors plus la base image par image."""
+    noms = {fichier.name for fichier in fichiers if fichier}
+    if not noms:
+        return
+    cles = {_cle_cache(nom): nom for nom in noms}
+    manquants = {cles[cle] for cle in set(cles) - set(cache.get_many(list(cles)))}
+    if manquants:
+        connus = dict(ImageDerivee.objects.filter(original__in=manquants).values_list('original', 'rendus'))
+        cache.set_many({_cle_cache(nom): rendus for nom, rendus in connus.items()}, _CACHE_TIMEOUT)
+        cache.set_many({_cle_cache(nom): {} for nom in manquants - set(connus)}, _CACHE_TIMEOUT_SANS_RENDUS)
+
+
+def fichiers_a_traiter():
+    """Noms des fichiers image référencés en base qui n'ont pas encore de rendus."""
+    noms = set()
+    for label, champs in CHAMPS.items():
+        model = apps.get_model(label)
+        for champ in champs:
+            noms.update(model.objects.exclude(**{champ: ''}).exclude(**{champ + '__isnull': True})
+                        .values_list(champ, flat=True).distinct())
+    traites = set(ImageDerivee.objects.filter(original__in=noms).values_list('original', flat=True))
+    return sorted(noms - traites)
+
+
+def _generer_si_absent(nom):
+    if not ImageDerivee.objects.filter(original=nom).exists():
+        generer_sans_erreur(nom)
+
+
+def image_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Après le commit seulement : le fichier et la ligne sont alors bien enregistrés
+    if raw:
+        return
+    for champ in CHAMPS[sender._meta.label]:
+        if update_fields is not None and champ not in update_fields:
+            continue
+        fichier = getattr(instance, champ)
+        if fichier and fichier.name:
+            transaction.on_commit(lambda nom=fichier.name: _generer_si_absent(nom))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base import plans
+
+
+class Command(BaseCommand):
+    help = ("Vérifie par EXPLAIN (SQLite ou PostgreSQL) que les requêtes chaudes de base.plans utilisent "
+            "un index. Les données de test sont créées dans une transaction annulée à la fin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('requetes', nargs='*', help='Requêtes à vérifier (toutes par défaut).')
+        parser.add_argument('--produits', type=int, default=500, help='Produits créés pour le jeu de données.')
+        parser.add_argument('--plans', action='store_true', help='Affiche le plan de chaque requête.')
+
+    def handle(self, *args, **options):
+        inconnues = set(options['requetes']) - set(plans.REQUETES)
+        if inconnues:
+            raise CommandError('Requêtes inconnues : %s' % ', '.join(sorted(inconnues)))
+
+        with transaction.atomic():
+            resultats = plans.verifier(plans.peupler(options['produits']), options['requetes'])
+            transaction.set_rollback(True)
+
+        echecs = []
+        for nom, (plan, tables) in resultats.items():
+            self.stdout.write('%s : %s' % (nom, 'parcours complet de %s' % ', '.join(tables) if tables else 'ok'))
+            if options['plans']:
+                self.stdout.write(plan)
+            if tables:
+                echecs.append(nom)
+        if echecs:
+            raise CommandError('%d requête(s) sans index : %s' % (len(echecs), ', '.join(echecs)))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from base import images
+
+
+class Command(BaseCommand):
+    help = "Produit les rendus (thumb, card, detail) des images déjà en base qui n'en ont pas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Nombre maximal de fichiers à traiter.')
+
+    def handle(self, *args, **options):
+        noms = images.fichiers_a_traiter()[:options['limit']]
+        traites = 0
+        for nom in noms:
+            if images.generer_sans_erreur(nom) is not None:
+                traites += 1
+        self.stdout.write('%d images traitées sur %d' % (traites, len(noms)))
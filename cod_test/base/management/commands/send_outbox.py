@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base import outbox
+
+
+class Command(BaseCommand):
+    help = "Envoie les e-mails en file d'attente (table EmailSortant) par lots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Vide la file puis s\'arrête.')
+        parser.add_argument('--interval', type=float, default=5, help='Pause entre deux passes, en secondes.')
+        parser.add_argument('--batch', type=int, default=None, help='E-mails par connexion SMTP.')
+        parser.add_argument(
+            '--backend', default=None,
+            help="Backend d'envoi (ex. django.core.mail.backends.filebased.EmailBackend pour tester hors ligne).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            envoyes, echecs = outbox.drain_all(options['batch'], options['backend'])
+            if envoyes or echecs:
+                self.stdout.write('%d e-mails envoyés, %d en échec' % (envoyes, echecs))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,186 @@
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.base import Template
+
+from . import routers
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """Compte les requêtes SQL et leur durée, par portée (vue, context processor, template)."""
+
+    def __init__(self):
+        self.scopes = ['view']
+        self.count = 0
+        self.duration = 0.0
+        self.by_scope = defaultdict(lambda: {'count': 0, 'duration': 0.0})
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.monotonic() - start
+            stats = self.by_scope[self.scopes[-1]]
+            stats['count'] += 1
+            stats['duration'] += elapsed
+            self.count += 1
+            self.duration += elapsed
+
+    def summary(self):
+        lines = ['%d requêtes, %.1f ms' % (self.count, self.duration * 1000)]
+        for scope, stats in sorted(self.by_scope.items(), key=lambda item: -item[1]['count']):
+            lines.append('  %-60s %4d requêtes %8.1f ms' % (scope, stats['count'], stats['duration'] * 1000))
+        return '\n'.join(lines)
+
+
+def _active_recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+@contextmanager
+def record_queries():
+    """Enregistre les requêtes exécutées sur toutes les connexions pendant le bloc."""
+    recorder = QueryRecorder()
+    recorders = _active_recorders()
+    recorders.append(recorder)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield recorder
+    finally:
+        recorders.remove(recorder)
+
+
+@contextmanager
+def scope(name):
+    recorders = list(_active_recorders())
+    for recorder in recorders:
+        recorder.scopes.append(name)
+    try:
+        yield
+    finally:
+        for recorder in recorders:
+            recorder.scopes.pop()
+
+
+def _wrap_context_processor(processor):
+    if getattr(processor, 'query_budget', False):
+        return processor
+    name = 'context_processor:%s.%s' % (processor.__module__, processor.__name__)
+
+    @functools.wraps(processor)
+    def wrapper(request):
+        with scope(name):
+            return processor(request)
+
+    wrapper.query_budget = True
+    return wrapper
+
+
+def instrument_templates():
+    """Attribue les requêtes aux context processors et aux templates qui les déclenchent."""
+    if not getattr(Template._render, 'query_budget', False):
+        original_render = Template._render
+
+        def _render(self, context):
+            with scope('template:%s' % self.name):
+                return original_render(self, context)
+
+        _render.query_budget = True
+        Template._render = _render
+
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates):
+            engine.engine.template_context_processors = tuple(
+                _wrap_context_processor(processor)
+                for processor in engine.engine.template_context_processors
+            )
+
+
+class QueryBudgetMiddleware:
+    """Mesure les requêtes SQL de chaque page et applique un budget par URL.
+
+    Réglages :
+      - QUERY_BUDGET_MODE : 'off', 'warn' (journalise) ou 'raise' (lève QueryBudgetExceeded)
+      - QUERY_BUDGETS : {nom d'URL: nombre maximal de requêtes}
+      - QUERY_BUDGET_DEFAULT : budget des URL absentes de QUERY_BUDGETS (None = illimité)
+    """
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if self.mode == 'off':
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        instrument_templates()
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        request.query_recorder = recorder
+        response['X-Query-Count'] = str(recorder.count)
+
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        budget = self.budgets.get(url_name, self.default_budget)
+        if budget is not None and recorder.count > budget:
+            message = 'Budget de requêtes dépassé pour %s (%s) : %d > %d\n%s' % (
+                request.path, url_name, recorder.count, budget, recorder.summary())
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class PrimaryStickinessMiddleware:
+    """Lit sur le primaire pendant les requêtes qui écrivent et, pour un visiteur qui vient
+    d'écrire, pendant DATABASE_STICKY_SECONDS (cookie) : il relit ce qu'il a écrit même si
+    les réplicas sont en retard. Inactif sans DATABASE_REPLICAS (voir base.routers).
+    """
+
+    cookie = 'db_primaire'
+    methodes_sures = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.delai = getattr(settings, 'DATABASE_STICKY_SECONDS', 10)
+
+    def _colle(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        primaire = request.method not in self.methodes_sures or self._colle(request)
+        with routers.requete(primaire=primaire) as etat:
+            response = self.get_response(request)
+        if etat.ecrit:
+            response.set_cookie(
+                self.cookie, '%d' % (time.time() + self.delai), max_age=self.delai, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sujet', models.CharField(max_length=254)),
+                ('corps', models.TextField()),
+                ('corps_html', models.TextField(blank=True, default='')),
+                ('expediteur', models.CharField(blank=True, default='', max_length=254)),
+                ('destinataires', models.JSONField(default=list)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('echec', 'Échec définitif')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('derniere_erreur', models.TextField(blank=True, default='')),
+                ('date_add', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'E-mail sortant',
+                'verbose_name_plural': 'E-mails sortants',
+                'indexes': [models.Index(fields=['statut', 'prochain_essai'], name='email_sortant_a_envoyer_idx')],
+            },
+        ),
+    ]
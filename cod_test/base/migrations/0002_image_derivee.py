@@ -0,0 +1,30 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original', models.CharField(max_length=255, unique=True)),
+                ('empreinte', models.CharField(max_length=64)),
+                ('largeur', models.PositiveIntegerField(default=0)),
+                ('hauteur', models.PositiveIntegerField(default=0)),
+                ('rendus', models.JSONField(default=dict)),
+                ('date_add', models.DateTimeField(auto_now_add=True)),
+                ('date_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Image dérivée',
+                'verbose_name_plural': 'Images dérivées',
+            },
+        ),
+    ]
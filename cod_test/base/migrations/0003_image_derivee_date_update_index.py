@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_image_derivee'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagederivee',
+            name='date_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -1,3 +1,61 @@
 from django.db import models
+from django.utils.timezone import now
 
 # Create your models here.
+
+
+class EmailSortant(models.Model):
+    """E-mail en file d'envoi, expédié par la commande send_outbox (voir base.outbox)."""
+
+    EN_ATTENTE = 'en_attente'
+    ENVOYE = 'envoye'
+    ECHEC = 'echec'
+    STATUTS = (
+        (EN_ATTENTE, 'En attente'),
+        (ENVOYE, 'Envoyé'),
+        (ECHEC, 'Échec définitif'),
+    )
+
+    sujet = models.CharField(max_length=254)
+    corps = models.TextField()
+    corps_html = models.TextField(blank=True, default='')
+    expediteur = models.CharField(max_length=254, blank=True, default='')
+    destinataires = models.JSONField(default=list)
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    tentatives = models.PositiveIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=now)
+    derniere_erreur = models.TextField(blank=True, default='')
+
+    date_add = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'E-mail sortant'
+        verbose_name_plural = 'E-mails sortants'
+        indexes = [
+            models.Index(fields=['statut', 'prochain_essai'], name='email_sortant_a_envoyer_idx'),
+        ]
+
+    def __str__(self):
+        return '%s -> %s' % (self.sujet, ', '.join(self.destinataires))
+
+
+class ImageDerivee(models.Model):
+    """Manifeste des rendus (miniatures WebP/JPEG) d'un fichier image, voir base.images."""
+
+    original = models.CharField(max_length=255, unique=True)
+    empreinte = models.CharField(max_length=64)
+    largeur = models.PositiveIntegerField(default=0)
+    hauteur = models.PositiveIntegerField(default=0)
+    rendus = models.JSONField(default=dict)
+
+    date_add = models.DateTimeField(auto_now_add=True)
+    # Empreinte des pages du catalogue (website.conditional) : COUNT/MAX depuis l'index seul
+    date_update = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Image dérivée'
+        verbose_name_plural = 'Images dérivées'
+
+    def __str__(self):
+        return self.original
@@ -0,0 +1,115 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.timezone import now
+
+from .models import EmailSortant
+
+
+logger = logging.getLogger(__name__)
+
+
+def _reglage(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def enqueue(sujet, corps, destinataires, expediteur=None, html=''):
+    """Met un e-mail en file d'envoi ; il sera expédié par la commande send_outbox."""
+    return EmailSortant.objects.create(
+        sujet=sujet,
+        corps=corps,
+        corps_html=html or '',
+        expediteur=expediteur or settings.DEFAULT_FROM_EMAIL,
+        destinataires=list(destinataires),
+    )
+
+
+def delai_avant_essai(tentatives):
+    """Backoff exponentiel : base, 2 x base, 4 x base... plafonné."""
+    base = _reglage('EMAIL_OUTBOX_BACKOFF', 60)
+    return timedelta(seconds=min(base * 2 ** (tentatives - 1), _reglage('EMAIL_OUTBOX_BACKOFF_MAX', 6 * 3600)))
+
+
+def _reserver(taille):
+    """Réserve jusqu'à `taille` e-mails dus : un bail repousse leur prochain essai, pour
+    qu'un autre worker ne les prenne pas en même temps."""
+    instant = now()
+    bail = instant + timedelta(seconds=_reglage('EMAIL_OUTBOX_LEASE', 300))
+    candidats = EmailSortant.objects.filter(
+        statut=EmailSortant.EN_ATTENTE, prochain_essai__lte=instant,
+    ).order_by('prochain_essai', 'id')[:taille]
+
+    reserves = []
+    for email in candidats:
+        if EmailSortant.objects.filter(pk=email.pk, prochain_essai=email.prochain_essai).update(prochain_essai=bail):
+            reserves.append(email)
+    return reserves
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        email.sujet, email.corps, email.expediteur, email.destinataires, connection=connection)
+    if email.corps_html:
+        message.attach_alternative(email.corps_html, 'text/html')
+    return message
+
+
+def _echec(email, erreur):
+    email.tentatives += 1
+    email.derniere_erreur = str(erreur)[:2000]
+    if email.tentatives >= _reglage('EMAIL_OUTBOX_MAX_ATTEMPTS', 6):
+        email.statut = EmailSortant.ECHEC
+        logger.error("E-mail %s abandonné après %d tentatives : %s", email.pk, email.tentatives, erreur)
+    else:
+        email.prochain_essai = now() + delai_avant_essai(email.tentatives)
+    email.save(update_fields=['tentatives', 'derniere_erreur', 'statut', 'prochain_essai'])
+
+
+def drain(taille=None, backend=None):
+    """Envoie un lot d'e-mails dus sur une seule connexion SMTP.
+
+    Renvoie (envoyés, échecs). Un e-mail en échec est reprogrammé avec un backoff
+    exponentiel, puis passe en ECHEC après EMAIL_OUTBOX_MAX_ATTEMPTS tentatives.
+    """
+    emails = _reserver(taille or _reglage('EMAIL_OUTBOX_BATCH_SIZE', 50))
+    if not emails:
+        return 0, 0
+
+    connection = get_connection(backend or _reglage('EMAIL_OUTBOX_BACKEND', None), fail_silently=False)
+    try:
+        connection.open()
+    except Exception as erreur:
+        for email in emails:
+            _echec(email, erreur)
+        return 0, len(emails)
+
+    envoyes = echecs = 0
+    try:
+        for email in emails:
+            try:
+                # Un message à la fois pour connaître le sort de chacun, sur la même connexion
+                connection.send_messages([_message(email, connection)])
+            except Exception as erreur:
+                _echec(email, erreur)
+                echecs += 1
+            else:
+                email.statut = EmailSortant.ENVOYE
+                email.date_envoi = now()
+                email.save(update_fields=['statut', 'date_envoi'])
+                envoyes += 1
+    finally:
+        connection.close()
+    return envoyes, echecs
+
+
+def drain_all(taille=None, backend=None):
+    """Vide la file des e-mails dus, lot par lot ; renvoie (envoyés, échecs)."""
+    total_envoyes = total_echecs = 0
+    while True:
+        envoyes, echecs = drain(taille, backend)
+        if not envoyes and not echecs:
+            return total_envoyes, total_echecs
+        total_envoyes += envoyes
+        total_echecs += echecs
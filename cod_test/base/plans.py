@@ -0,0 +1,169 @@
+import json
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from website.conditional import requete_empreinte
+
+
+def _modele(nom):
+    return apps.get_model(nom)
+
+
+# Requêtes des pages chaudes (shop, customer, client), reproduites telles que les vues
+# les construisent. Chacune reçoit les objets de peupler() et renvoie un QuerySet.
+REQUETES = {
+    'catalogue_recents': lambda d: (
+        _modele('shop.Produit').objects.filter(status=True).with_effective_price()
+        .order_by('-date_add', '-pk')[:25]
+    ),
+    'catalogue_page_suivante': lambda d: (
+        _modele('shop.Produit').objects.filter(status=True).with_effective_price()
+        .filter(Q(date_add__lt=d['produit'].date_add) | Q(date_add=d['produit'].date_add, pk__lt=d['produit'].pk))
+        .order_by('-date_add', '-pk')[:25]
+    ),
+    'catalogue_categorie': lambda d: (
+        d['produit'].categorie.produit.with_effective_price().order_by('-date_add', '-pk')[:25]
+    ),
+    'produit_detail': lambda d: _modele('shop.Produit').objects.filter(slug=d['produit'].slug),
+    'produits_similaires': lambda d: (
+        _modele('shop.Produit').objects.filter(categorie=d['produit'].categorie_id).exclude(id=d['produit'].id)[:3]
+    ),
+    'super_deals': lambda d: (
+        _modele('shop.Produit').objects.filter(super_deal=True).order_by('-date_add', '-id')[:3]
+    ),
+    'favori': lambda d: _modele('shop.Favorite').objects.filter(user=d['user'], produit=d['produit']),
+    'tableau_de_bord_articles': lambda d: (
+        _modele('shop.Produit').objects.filter(etablissement=d['etablissement']).order_by('-date_add', '-id')[:5]
+    ),
+    'tableau_de_bord_commandes': lambda d: d['etablissement'].sous_commandes.order_by('-date_add', '-pk')[:5],
+    'tableau_de_bord_ventes': lambda d: _modele('shop.VenteJournaliere').objects.filter(etablissement=d['etablissement']),
+    'commandes_marchand': lambda d: (
+        _modele('customer.SousCommande').objects.filter(etablissement=d['etablissement'], status=True)
+        .order_by('-date_add', '-pk')[:10]
+    ),
+    'panier_session': lambda d: _modele('customer.Panier').objects.filter(session_id=d['panier'].session_id_id),
+    'panier_client': lambda d: _modele('customer.Panier').objects.filter(customer__user=d['user']),
+    'ligne_panier': lambda d: (
+        _modele('customer.ProduitPanier').objects.filter(panier=d['panier'], produit=d['produit'])
+    ),
+    'lignes_panier': lambda d: _modele('customer.ProduitPanier').objects.filter(panier=d['panier']).avec_prix(),
+    'commande_transaction': lambda d: (
+        _modele('customer.Commande').objects.filter(transaction_id=d['commande'].transaction_id)
+    ),
+    'reservations_expirees': lambda d: (
+        _modele('customer.Reservation').objects.filter(expire_le__lte=now()).order_by('expire_le')[:1000]
+    ),
+    'jetons_expires': lambda d: (
+        _modele('customer.PasswordResetToken').objects.filter(created_at__lt=now() - timedelta(hours=1))
+    ),
+    'historique_commandes': lambda d: (
+        _modele('customer.Commande').objects.filter(customer=d['customer']).order_by('-date_add', '-id')[:11]
+    ),
+    'historique_lignes': lambda d: (
+        _modele('customer.ProduitPanier').objects.filter(commande__in=[d['commande'].pk]).au_prix_de_la_commande()
+    ),
+    'empreinte_catalogue': lambda d: requete_empreinte(_modele('shop.Produit').objects.all()),
+    'empreinte_categorie': lambda d: (
+        requete_empreinte(_modele('shop.Produit').objects.filter(categorie=d['produit'].categorie_id))
+    ),
+    'empreinte_categorie_etab': lambda d: (
+        requete_empreinte(_modele('shop.Produit').objects.filter(categorie_etab=d['produit'].categorie_etab_id))
+    ),
+    'empreinte_accueil': lambda d: requete_empreinte(_modele('shop.Produit').objects.all()).union(
+        requete_empreinte(_modele('website.About').objects.all(), 1),
+        requete_empreinte(_modele('website.Banniere').objects.all(), 2), all=True,
+    ),
+    'empreinte_images': lambda d: requete_empreinte(_modele('base.ImageDerivee').objects.all()),
+    'emails_a_envoyer': lambda d: (
+        _modele('base.EmailSortant').objects.filter(statut='en_attente', prochain_essai__lte=now())
+        .order_by('prochain_essai', 'id')[:100]
+    ),
+}
+
+# Petites tables de référence qu'un parcours complet ne pénalise pas
+TABLES_TOLEREES = ('shop_categorieetablissement', 'shop_categorieproduit')
+
+# SQLite : « SCAN table » sans index ; « SCAN table USING [COVERING] INDEX » est un parcours ordonné
+_SCAN_SQLITE = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)')
+
+
+def peupler(produits=50):
+    """Jeu de données minimal mais réaliste pour les requêtes de REQUETES ; renvoie les objets utiles."""
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.models import Session
+
+    Produit = _modele('shop.Produit')
+    Customer = _modele('customer.Customer')
+    Commande = _modele('customer.Commande')
+    Panier = _modele('customer.Panier')
+    ProduitPanier = _modele('customer.ProduitPanier')
+
+    vendeur = User.objects.create_user(username='plans-vendeur')
+    categorie_etab = _modele('shop.CategorieEtablissement').objects.create(nom='Plans', description='')
+    categorie = _modele('shop.CategorieProduit').objects.create(nom='Plans', description='', categorie=categorie_etab)
+    etablissement = _modele('shop.Etablissement').objects.create(
+        user=vendeur, nom='Plans', description='', categorie=categorie_etab,
+        nom_du_responsable='Plans', prenoms_duresponsable='Requetes',
+        adresse='', pays='', contact_1='', email='plans@example.com',
+    )
+    Produit.objects.bulk_create([
+        Produit(
+            nom='Produit %d' % i, description='', description_deal='', prix=100 + i, super_deal=not i % 10,
+            categorie=categorie, categorie_etab=categorie_etab, etablissement=etablissement,
+            slug='plans-produit-%d' % i,
+        )
+        for i in range(produits)
+    ])
+    produit = Produit.objects.filter(etablissement=etablissement).order_by('pk').first()
+
+    user = User.objects.create_user(username='plans-client', first_name='Plans', last_name='Client')
+    customer = Customer.objects.create(user=user)
+    session = Session.objects.create(session_key='plans-session', session_data='', expire_date=now() + timedelta(days=1))
+    panier = Panier.objects.create(customer=customer, session_id=session)
+    ProduitPanier.objects.create(panier=panier, produit=produit, quantite=1)
+    commande = Commande.objects.create(customer=customer, transaction_id='plans-transaction', prix_total=100)
+    ProduitPanier.objects.create(commande=commande, produit=produit, quantite=1)
+    _modele('customer.SousCommande').objects.create(
+        commande=commande, etablissement=etablissement, sous_total=100, nombre_articles=1, date_add=commande.date_add)
+    return {
+        'user': user, 'customer': customer, 'etablissement': etablissement,
+        'produit': produit, 'panier': panier, 'commande': commande,
+    }
+
+
+def _noeuds(plan):
+    yield plan
+    for sous_plan in plan.get('Plans', ()):
+        yield from _noeuds(sous_plan)
+
+
+def expliquer(queryset):
+    """Plan d'exécution de `queryset` et tables parcourues en entier : (plan, [tables]).
+
+    PostgreSQL : le plan est demandé avec enable_seqscan désactivé, pour qu'un Seq Scan
+    ne signale qu'une absence d'index utilisable et pas un choix dû au faible volume.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain(format='json')
+        racine = json.loads(plan)[0]['Plan']
+        tables = [n['Relation Name'] for n in _noeuds(racine) if n['Node Type'] == 'Seq Scan']
+        return plan, [t for t in tables if t not in TABLES_TOLEREES]
+    if connection.vendor == 'sqlite':
+        plan = queryset.explain()
+        tables = [m.group(1) for m in map(_SCAN_SQLITE.search, plan.splitlines()) if m]
+        return plan, [t for t in tables if t not in TABLES_TOLEREES]
+    raise NotImplementedError('EXPLAIN non pris en charge pour %s' % connection.vendor)
+
+
+def verifier(donnees, noms=None):
+    """Explique chaque requête de REQUETES (ou de `noms`) : {nom: (plan, [tables parcourues en entier])}."""
+    return {nom: expliquer(REQUETES[nom](donnees)) for nom in noms or REQUETES}
@@ -0,0 +1,80 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_local = threading.local()
+
+# Catalogue, contenu du site et cumuls de ventes : lectures acceptant quelques secondes de retard.
+# Paniers, commandes, comptes et sessions restent toujours sur le primaire.
+APPS_REPLIQUEES = ('shop', 'website', 'cities_light')
+
+
+def _repliques():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+class _Etat:
+    def __init__(self, primaire):
+        self.primaire = primaire
+        self.ecrit = False
+
+
+@contextmanager
+def requete(primaire=False):
+    """Portée d'une requête HTTP : `primaire` force ses lectures sur le primaire ;
+    l'état renvoyé indique à la sortie si elle a écrit."""
+    precedent = getattr(_local, 'etat', None)
+    _local.etat = etat = _Etat(primaire)
+    try:
+        yield etat
+    finally:
+        _local.etat = precedent
+
+
+def lire_sur_primaire():
+    """Force les lectures du bloc sur le primaire (relecture juste après une écriture, hors requête HTTP)."""
+    return requete(primaire=True)
+
+
+class ReplicaRouter:
+    """Envoie les lectures de APPS_REPLIQUEES sur un des DATABASE_REPLICAS, le reste sur le primaire.
+
+    Restent sur le primaire : les écritures, les lectures dans une transaction, et celles
+    d'une requête qui écrit ou qui suit de peu une écriture du même visiteur
+    (base.middleware.PrimaryStickinessMiddleware). Sans DATABASE_REPLICAS, le routeur est neutre.
+    """
+
+    def db_for_read(self, model, **hints):
+        repliques = _repliques()
+        if not repliques:
+            return None
+        etat = getattr(_local, 'etat', None)
+        if (
+            (etat is not None and etat.primaire)
+            or model._meta.app_label not in getattr(settings, 'DATABASE_REPLICA_APPS', APPS_REPLIQUEES)
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(repliques)
+
+    def db_for_write(self, model, **hints):
+        etat = getattr(_local, 'etat', None)
+        if etat is not None:
+            etat.ecrit = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas et primaire portent les mêmes données
+        bases = {DEFAULT_DB_ALIAS, *_repliques()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in _repliques():
+            return False
+        return None
@@ -0,0 +1,9 @@
+from django.apps import apps
+from django.db.models.signals import post_save
+
+from . import images
+
+
+for label in images.CHAMPS:
+    post_save.connect(images.image_changed, sender=apps.get_model(label),
+                      dispatch_uid='images_%s' % label.lower())
@@ -0,0 +1,54 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from base import images
+
+
+register = template.Library()
+
+
+def _srcset(variantes):
+    return ', '.join('%s %dw' % (default_storage.url(v['nom']), v['largeur']) for v in variantes)
+
+
+@register.simple_tag
+def image(fichier, rendu='card', alt='', sizes=None, css='', lazy=True):
+    """<picture> responsive d'un champ image : source WebP et <img> JPEG avec srcset.
+
+    Tant que les rendus n'existent pas (image pas encore traitée), renvoie l'original.
+        {% image produit.image 'card' alt=produit.nom %}
+    """
+    if not fichier:
+        return ''
+    attributs = [('alt', alt)]
+    if css:
+        attributs.append(('class', css))
+    if lazy:
+        attributs += [('loading', 'lazy'), ('decoding', 'async')]
+
+    variantes = images.manifeste(fichier.name).get(rendu)
+    if not variantes or not variantes.get('jpeg'):
+        return format_html('<img src="{}"{}>', fichier.url, format_html_join('', ' {}="{}"', attributs))
+
+    jpeg = variantes['jpeg']
+    sizes = sizes or images.TAILLES[rendu]
+    attributs = [('width', jpeg[0]['largeur']), ('height', jpeg[0]['hauteur'])] + attributs
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        _srcset(variantes['webp']), sizes,
+        default_storage.url(jpeg[0]['nom']), _srcset(jpeg), sizes,
+        format_html_join('', ' {}="{}"', attributs),
+    )
+
+
+@register.simple_tag
+def image_url(fichier, rendu='detail'):
+    """URL du plus grand JPEG d'un rendu (fonds CSS, zoom...), l'original à défaut."""
+    if not fichier:
+        return ''
+    variantes = images.manifeste(fichier.name).get(rendu)
+    if not variantes or not variantes.get('jpeg'):
+        return fichier.url
+    return default_storage.url(variantes['jpeg'][-1]['nom'])
@@ -0,0 +1,33 @@
+from django.test import TestCase
+
+from .middleware import instrument_templates, record_queries
+
+
+class QueryBudgetTestCase(TestCase):
+    """TestCase vérifiant que le nombre de requêtes d'une page ne dépend pas du volume de données."""
+
+    budget_sizes = (10, 100, 1000)
+
+    def assertQueryBudget(self, url, seed, budget, sizes=None):
+        """Appelle `seed(n)` pour chaque taille puis charge `url`.
+
+        Échoue si le nombre de requêtes varie d'une taille à l'autre ou
+        dépasse `budget`.
+        """
+        instrument_templates()
+        counts = []
+        for size in sizes or self.budget_sizes:
+            seed(size)
+            # Premier affichage hors mesure : remplit les caches (habillage, sessions...)
+            self.client.get(url)
+            with record_queries() as recorder:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(
+                recorder.count, budget,
+                '%s avec %d lignes :\n%s' % (url, size, recorder.summary()))
+            counts.append((size, recorder.count, recorder.summary()))
+
+        if len({count for _, count, _ in counts}) > 1:
+            self.fail('Le nombre de requêtes de %s varie avec le volume :\n%s' % (
+                url, '\n'.join('%d lignes -> %s' % (size, summary) for size, _, summary in counts)))
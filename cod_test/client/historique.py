@@ -0,0 +1,105 @@
+import datetime
+import re
+
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+
+from customer.models import ProduitPanier
+
+
+# Formats acceptés pour un jour, un mois ou une année
+_FORMATS = (
+    (re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$'), lambda j, m, a: _jour(a, m, j)),
+    (re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$'), lambda a, m, j: _jour(a, m, j)),
+    (re.compile(r'^(\d{1,2})[/.-](\d{4})$'), lambda m, a: _mois(a, m)),
+    (re.compile(r'^(\d{4})-(\d{1,2})$'), lambda a, m: _mois(a, m)),
+    (re.compile(r'^(\d{4})$'), lambda a: (datetime.date(int(a), 1, 1), datetime.date(int(a), 12, 31))),
+)
+
+_SEPARATEURS = re.compile(r'\s+(?:-|au|à|a)\s+|\.\.', re.IGNORECASE)
+
+
+def _jour(annee, mois, jour):
+    date = datetime.date(int(annee), int(mois), int(jour))
+    return date, date
+
+
+def _mois(annee, mois):
+    debut = datetime.date(int(annee), int(mois), 1)
+    suivant = (debut + datetime.timedelta(days=32)).replace(day=1)
+    return debut, suivant - datetime.timedelta(days=1)
+
+
+def _bornes(texte):
+    texte = texte.strip()
+    for motif, construire in _FORMATS:
+        correspondance = motif.match(texte)
+        if correspondance:
+            try:
+                return construire(*correspondance.groups())
+            except ValueError:
+                return None
+    return None
+
+
+def periode(texte):
+    """Période (premier jour, dernier jour) décrite par `texte`, ou None si ce n'est pas une date.
+
+    Un jour (12/03/2024, 2024-03-12), un mois (03/2024, 2024-03), une année (2024)
+    ou un intervalle entre deux de ces formes (« 01/03/2024 au 15/03/2024 », « 2024-01..2024-03 »).
+    """
+    texte = re.sub(r'^du\s+', '', texte.strip(), flags=re.IGNORECASE)
+    morceaux = _SEPARATEURS.split(texte)
+    if len(morceaux) > 2:
+        return None
+    bornes = [_bornes(morceau) for morceau in morceaux]
+    if None in bornes:
+        return None
+    debut, fin = bornes[0][0], bornes[-1][1]
+    return (debut, fin) if debut <= fin else (fin, debut)
+
+
+def rechercher(commandes, query):
+    """Filtre par période si `query` est une date, sinon par début de transaction_id ou nom de produit.
+
+    La période devient un intervalle sur date_add (index), sans conversion de la colonne ;
+    le produit est cherché par EXISTS, sans jointure ni distinct().
+    """
+    query = query.strip()
+    if not query:
+        return commandes
+    bornes = periode(query)
+    if bornes is not None:
+        zone = timezone.get_current_timezone()
+        debut = timezone.make_aware(datetime.datetime.combine(bornes[0], datetime.time.min), zone)
+        fin = timezone.make_aware(datetime.datetime.combine(bornes[1] + datetime.timedelta(days=1), datetime.time.min), zone)
+        return commandes.filter(date_add__gte=debut, date_add__lt=fin)
+    produit = ProduitPanier.objects.filter(commande=OuterRef('pk'), produit__nom__icontains=query)
+    return commandes.filter(transaction_id__startswith=query) | commandes.filter(Exists(produit))
+
+
+def serialiser(commande):
+    """Commande et lignes (préchargées par historique()) pour la réponse JSON."""
+    lignes = commande.lignes
+    return {
+        'id': commande.id,
+        'transaction_id': commande.transaction_id,
+        'id_paiment': commande.id_paiment,
+        'date_add': commande.date_add.isoformat(),
+        'status': commande.status,
+        'prix_total': commande.prix_total,
+        'sous_total': commande.sous_total,
+        'nombre_articles': commande.nombre_articles,
+        'detail_url': reverse('commande-detail', args=[commande.id]),
+        'recu_url': reverse('invoice_pdf', args=[commande.id]),
+        'lignes': [
+            {
+                'produit': ligne.produit.nom,
+                'quantite': ligne.quantite,
+                'prix_unitaire': ligne.prix_unitaire,
+                'total': ligne.total,
+            }
+            for ligne in lignes
+        ],
+    }
@@ -0,0 +1,197 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import threading
+
+from django.conf import settings
+from playwright.async_api import async_playwright
+
+
+logger = logging.getLogger(__name__)
+
+
+class PDFError(Exception):
+    pass
+
+
+class PDFTimeout(PDFError):
+    pass
+
+
+class PDFSaturated(PDFError):
+    pass
+
+
+class PDFRenderer:
+    """Service de rendu PDF partagé par le processus.
+
+    Un seul Chromium, démarré au premier rendu dans un thread dédié (boucle asyncio),
+    et un nombre borné de pages (chacune dans son propre contexte) réutilisées d'un
+    rendu à l'autre. Les demandes au-delà de la taille du pool attendent leur tour ;
+    un navigateur qui plante est relancé au rendu suivant.
+
+    Réglages :
+      - PDF_POOL_SIZE : rendus simultanés (pages ouvertes)
+      - PDF_TIMEOUT : durée maximale d'un rendu, en secondes
+      - PDF_QUEUE_TIMEOUT : attente maximale d'une page libre, en secondes
+      - PDF_MAX_QUEUE : nombre maximal de demandes en attente
+      - PDF_PAGE_REUSE : rendus par page avant recyclage de son contexte
+    """
+
+    # Délai (s) laissé à la coroutine au-delà de ses propres attente et timeout
+    marge = 5
+
+    def __init__(self, taille=None, timeout=None, attente=None, file_max=None, reutilisations=None):
+        self.taille = taille or getattr(settings, 'PDF_POOL_SIZE', 2)
+        self.timeout = timeout or getattr(settings, 'PDF_TIMEOUT', 30)
+        self.attente = attente or getattr(settings, 'PDF_QUEUE_TIMEOUT', 10)
+        self.file_max = file_max or getattr(settings, 'PDF_MAX_QUEUE', 20)
+        self.reutilisations = reutilisations or getattr(settings, 'PDF_PAGE_REUSE', 100)
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._playwright = None
+        self._browser = None
+        self._pages = []  # (contexte, page, nombre de rendus) libres
+        self._en_attente = 0
+        self._semaphore = None
+
+    @property
+    def demarre(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def render(self, html, **options):
+        """Rend `html` en PDF (options de Page.pdf) et renvoie les octets."""
+        self._demarrer()
+        future = asyncio.run_coroutine_threadsafe(self._rendre(html, options), self._loop)
+        # Filet de sécurité : la coroutine applique elle-même attente et timeout
+        try:
+            return future.result(self.attente + self.timeout + self.marge)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise PDFTimeout('Rendu PDF sans réponse après %s s' % (self.attente + self.timeout + self.marge))
+
+    def close(self):
+        with self._lock:
+            if not self.demarre:
+                return
+            asyncio.run_coroutine_threadsafe(self._fermer_navigateur(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+            self._thread = None
+
+    def _demarrer(self):
+        with self._lock:
+            if self.demarre:
+                return
+            self._loop = asyncio.new_event_loop()
+            pret = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(pret,), name='pdf-renderer', daemon=True)
+            self._thread.start()
+            pret.wait()
+
+    def _run(self, pret):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.taille)
+        pret.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _rendre(self, html, options):
+        if self._en_attente >= self.file_max:
+            raise PDFSaturated('%d rendus PDF en attente' % self._en_attente)
+        self._en_attente += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.attente)
+        except asyncio.TimeoutError:
+            raise PDFSaturated('Aucune page libre après %s s' % self.attente)
+        finally:
+            self._en_attente -= 1
+
+        try:
+            # Lancement de Chromium compris : une erreur devient PDFError (503), pas une 500
+            try:
+                contexte, page, rendus = await asyncio.wait_for(self._prendre_page(), self.timeout)
+            except asyncio.TimeoutError:
+                raise PDFTimeout('Chromium indisponible après %s s' % self.timeout)
+            except Exception as exc:
+                raise PDFError('Chromium indisponible : %s' % exc) from exc
+            try:
+                pdf = await asyncio.wait_for(self._imprimer(page, html, options), self.timeout)
+            except asyncio.TimeoutError:
+                await self._fermer_page(contexte)
+                raise PDFTimeout('Rendu PDF interrompu après %s s' % self.timeout)
+            except Exception as exc:
+                await self._fermer_page(contexte)
+                raise PDFError(str(exc)) from exc
+            self._liberer_page(contexte, page, rendus + 1)
+            return pdf
+        finally:
+            self._semaphore.release()
+
+    async def _imprimer(self, page, html, options):
+        await page.set_content(html, wait_until='load')
+        return await page.pdf(**options)
+
+    async def _navigateur(self):
+        if self._browser is None or not self._browser.is_connected():
+            if self._browser is not None:
+                logger.warning('Chromium ne répond plus, redémarrage du navigateur PDF')
+            await self._fermer_navigateur()
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(timeout=self.timeout * 1000)
+        return self._browser
+
+    async def _prendre_page(self):
+        navigateur = await self._navigateur()
+        while self._pages:
+            contexte, page, rendus = self._pages.pop()
+            if not page.is_closed():
+                return contexte, page, rendus
+        contexte = await navigateur.new_context()
+        return contexte, await contexte.new_page(), 0
+
+    def _liberer_page(self, contexte, page, rendus):
+        if rendus >= self.reutilisations:
+            asyncio.ensure_future(self._fermer_page(contexte))
+        else:
+            self._pages.append((contexte, page, rendus))
+
+    async def _fermer_page(self, contexte):
+        try:
+            await contexte.close()
+        except Exception:
+            pass
+
+    async def _fermer_navigateur(self):
+        self._pages = []
+        for ressource, methode in ((self._browser, 'close'), (self._playwright, 'stop')):
+            if ressource is not None:
+                try:
+                    await getattr(ressource, methode)()
+                except Exception:
+                    pass
+        self._browser = None
+        self._playwright = None
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = PDFRenderer()
+            atexit.register(_renderer.close)
+        return _renderer
+
+
+def render_pdf(html, **options):
+    """Rend une page HTML en PDF avec le pool Chromium du processus (démarré au premier appel)."""
+    return get_renderer().render(html, **options)
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+
+from customer.models import Commande
+from website.models import SiteInfo
+
+from .pdf import render_pdf
+from .utils import qrcode_base64
+
+
+TEMPLATE = "receipt.html"
+
+# À incrémenter si la mise en page change ailleurs que dans le template (options PDF...)
+FORMAT_VERSION = 1
+
+PDF_OPTIONS = {
+    "format": "A4",
+    "print_background": True,
+    "margin": {"top": "10mm", "right": "10mm", "bottom": "10mm", "left": "10mm"},
+}
+
+_template_versions = {}
+
+
+def template_version():
+    """Empreinte du source de receipt.html : une modification du template invalide les reçus."""
+    source = get_template(TEMPLATE).template.source
+    if source not in _template_versions:
+        _template_versions.clear()
+        _template_versions[source] = hashlib.md5(source.encode("utf-8")).hexdigest()[:12]
+    return _template_versions[source]
+
+
+def receipt_key(commande, request):
+    """Clé de contenu du reçu : commande, dernière modification, version du rendu et hôte (QR code)."""
+    parts = (
+        str(commande.pk),
+        commande.date_update.isoformat(),
+        template_version(),
+        str(FORMAT_VERSION),
+        request.get_host(),
+    )
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()[:20]
+
+
+def receipt_etag(commande, request):
+    return '"%s"' % receipt_key(commande, request)
+
+
+def render_receipt(commande, request):
+    detail_url = request.build_absolute_uri(reverse("commande-reçu-detail", args=[commande.id]))
+    html = render_to_string(TEMPLATE, {
+        "order_id": commande,
+        "produits_commande": commande.produit_commande.all(),
+        "qr_code": qrcode_base64(detail_url),
+        "logo": request.build_absolute_uri(SiteInfo.objects.latest('date_add').logo.url)
+    }, request=request)
+    return render_pdf(html, **PDF_OPTIONS)
+
+
+def get_receipt(commande, request):
+    """Fichier PDF du reçu, ouvert en lecture ; rendu et enregistré seulement si la clé a changé."""
+    champ = commande.recu_paiement
+    nom = champ.field.generate_filename(commande, "recu-%d-%s.pdf" % (commande.pk, receipt_key(commande, request)))
+    storage = champ.storage
+
+    if champ.name != nom or not storage.exists(nom):
+        if not storage.exists(nom):
+            nom = storage.save(nom, ContentFile(render_receipt(commande, request)))
+        ancien = champ.name
+        # update() plutôt que save() : date_update (auto_now) fait partie de la clé
+        Commande.objects.filter(pk=commande.pk).update(recu_paiement=nom)
+        champ.name = nom
+        if ancien and ancien != nom and storage.exists(ancien):
+            storage.delete(ancien)
+
+    return champ.open("rb")
@@ -1,11 +1,27 @@
-from django.test import TestCase, Client
-from django.urls import reverse
+import asyncio
+import datetime
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, Client, override_settings
+from django.urls import include, path, reverse
 from django.contrib.auth.models import User
 from customer.models import Customer, Commande, Panier, ProduitPanier
 from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch, MagicMock
 from website.models import SiteInfo
+from client import historique, receipts
+from client.pdf import PDFError, PDFRenderer, PDFTimeout
+from base.testing import QueryBudgetTestCase
+from cooldeal import urls_test
+
+MEDIA_TEST = tempfile.mkdtemp(prefix="cooldeal-recus-")
+
+# URLs de test complétées par celles du compte client
+urlpatterns = urls_test.urlpatterns + [path("client/", include("client.urls"))]
+
 
 def _make_etablissement(user):
     user.save()
@@ -17,6 +33,153 @@ def _make_etablissement(user):
     )
     return etab, cat_prod
 
+@override_settings(ROOT_URLCONF=__name__)
+class ClientHistoriqueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="histo", password="pass", email="h@h.com")
+        self.customer = Customer.objects.create(user=self.user, contact_1="0000", adresse="home")
+        seller = User.objects.create_user(username="seller_histo", password="pass")
+        cat_etab = CategorieEtablissement.objects.create(nom="CatE", description="d")
+        cat_prod = CategorieProduit.objects.create(nom="CatP", description="d", categorie=cat_etab)
+        etab = Etablissement.objects.create(
+            user=seller, nom="Etab", description="d", categorie=cat_etab,
+            nom_du_responsable="Kone", prenoms_duresponsable="Awa",
+            adresse="addr", pays="CI", contact_1="01020304", email="etab@example.com",
+        )
+        self.produits = [
+            Produit.objects.create(nom="Pizza %d" % i, description="d", prix=100 * (i + 1),
+                                   categorie=cat_prod, etablissement=etab)
+            for i in range(3)
+        ]
+
+    def _commandes(self, nombre):
+        deja = Commande.objects.count()
+        for i in range(deja, deja + nombre):
+            commande = Commande.objects.create(customer=self.customer, transaction_id="TRX%03d" % i, prix_total=0)
+            ProduitPanier.objects.bulk_create([
+                ProduitPanier(commande=commande, produit=produit, quantite=2) for produit in self.produits
+            ])
+
+    def test_periode(self):
+        self.assertEqual(historique.periode("12/03/2024"), (datetime.date(2024, 3, 12),) * 2)
+        self.assertEqual(historique.periode("2024-03"), (datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)))
+        self.assertEqual(historique.periode("2024"), (datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)))
+        self.assertEqual(
+            historique.periode("du 01/02/2024 au 03/2024"),
+            (datetime.date(2024, 2, 1), datetime.date(2024, 3, 31)),
+        )
+        self.assertIsNone(historique.periode("TRX001"))
+        self.assertIsNone(historique.periode("31/02/2024"))
+
+    def test_rechercher(self):
+        self._commandes(2)
+        ancienne = Commande.objects.get(transaction_id="TRX000")
+        Commande.objects.filter(pk=ancienne.pk).update(date_add=datetime.datetime(2023, 5, 10, 12, tzinfo=datetime.timezone.utc))
+        commandes = Commande.objects.all()
+
+        self.assertEqual(list(historique.rechercher(commandes, "2023-05")), [ancienne])
+        self.assertEqual(historique.rechercher(commandes, "TRX001").get().transaction_id, "TRX001")
+        # Un produit présent plusieurs fois ne duplique pas la commande
+        self.assertEqual(historique.rechercher(commandes, "pizza").count(), 2)
+        self.assertFalse(historique.rechercher(commandes, "sushi").exists())
+
+    def test_json_page(self):
+        self._commandes(12)
+        self.client.force_login(self.user)
+
+        data = self.client.get(reverse("commande_json")).json()
+        self.assertEqual((data["page"], data["pages"], data["total"], data["suivant"]), (1, 2, 12, 2))
+        self.assertEqual(len(data["commandes"]), 10)
+        premiere = data["commandes"][0]
+        self.assertEqual(premiere["transaction_id"], "TRX011")
+        self.assertEqual(premiere["nombre_articles"], 6)
+        self.assertEqual(premiere["sous_total"], 1200)
+        self.assertEqual([l["produit"] for l in premiere["lignes"]], ["Pizza 0", "Pizza 1", "Pizza 2"])
+
+        data = self.client.get(reverse("commande_json"), {"page": 2, "q": "TRX00"}).json()
+        self.assertEqual((data["total"], data["suivant"]), (10, None))
+
+    def test_past_order_keeps_the_price_of_its_day(self):
+        # Pizza 0 était en promotion le jour de la commande, plus maintenant
+        self._commandes(1)
+        jour = datetime.date.today() - datetime.timedelta(days=30)
+        Commande.objects.update(date_add=datetime.datetime.combine(jour, datetime.time(12), datetime.timezone.utc))
+        Produit.objects.filter(pk=self.produits[0].pk).update(
+            prix_promotionnel=50, date_debut_promo=jour, date_fin_promo=jour + datetime.timedelta(days=1),
+        )
+        self.client.force_login(self.user)
+
+        commande = self.client.get(reverse("commande_json")).json()["commandes"][0]
+        self.assertEqual([l["prix_unitaire"] for l in commande["lignes"]], [50, 200, 300])
+        self.assertEqual(commande["sous_total"], 1100)
+
+    def test_json_queries_do_not_grow_with_orders(self):
+        self._commandes(2)
+        self.client.force_login(self.user)
+        # session, utilisateur, client, count, page, lignes préchargées
+        with self.assertNumQueries(6):
+            self.client.get(reverse("commande_json"))
+        self._commandes(8)
+        with self.assertNumQueries(6):
+            self.client.get(reverse("commande_json"))
+
+    def test_json_requires_customer(self):
+        self.client.force_login(User.objects.create_user(username="sans_profil", password="p"))
+        self.assertEqual(self.client.get(reverse("commande_json")).status_code, 404)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ClientQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="budget_client", password="pass", first_name="F", last_name="L")
+        # Photo affichée par les gabarits du compte ; le fichier n'a pas besoin d'exister
+        self.customer = Customer.objects.create(user=self.user, contact_1="0000", adresse="home", photo="clients/budget.jpg")
+        seller = User.objects.create_user(username="budget_vendeur", password="pass")
+        cat_etab = CategorieEtablissement.objects.create(nom="CatE", description="d")
+        cat_prod = CategorieProduit.objects.create(nom="CatP", description="d", categorie=cat_etab)
+        etab = Etablissement.objects.create(
+            user=seller, nom="Etab", description="d", categorie=cat_etab,
+            nom_du_responsable="Kone", prenoms_duresponsable="Awa",
+            adresse="addr", pays="CI", contact_1="01020304", email="etab@example.com",
+        )
+        self.produits = [
+            Produit.objects.create(nom="Pizza %d" % i, description="d", prix=100 * (i + 1),
+                                   categorie=cat_prod, etablissement=etab)
+            for i in range(3)
+        ]
+        self.commande = Commande.objects.create(customer=self.customer, transaction_id="TRX-DETAIL", prix_total=0)
+        self.client.force_login(self.user)
+
+    def _seed_commandes(self, size):
+        deja = Commande.objects.count()
+        commandes = Commande.objects.bulk_create([
+            Commande(customer=self.customer, transaction_id="TRX%04d" % i, prix_total=0) for i in range(deja, size)
+        ])
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(commande=commande, produit=produit, quantite=2)
+            for commande in commandes for produit in self.produits
+        ])
+
+    def _seed_lignes(self, size):
+        deja = self.commande.produit_commande.count()
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(commande=self.commande, produit=self.produits[i % 3], quantite=1) for i in range(deja, size)
+        ])
+
+    def test_commande_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("commande"), self._seed_commandes, budget=12)
+
+    def test_commande_search_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("commande") + "?q=pizza", self._seed_commandes, budget=12)
+
+    def test_commande_json_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("commande_json"), self._seed_commandes, budget=8)
+
+    def test_commande_detail_query_count_is_constant(self):
+        url = reverse("commande-detail", args=[self.commande.pk])
+        self.assertQueryBudget(url, self._seed_lignes, budget=10)
+
+
 class ClientViewsTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -109,10 +272,11 @@ class ClientViewsTests(TestCase):
         self.assertEqual(self.customer.contact_1, "9999")
 
     # --- Test Facture PDF (Mocké) ---
-    @patch("client.views.sync_playwright")
-    @patch("client.views.SiteInfo")
-    @patch("client.views.qrcode_base64")
-    def test_invoice_pdf_generation(self, mock_qr, mock_siteinfo, mock_playwright):
+    @override_settings(MEDIA_ROOT=MEDIA_TEST)
+    @patch("client.receipts.render_pdf")
+    @patch("client.receipts.SiteInfo")
+    @patch("client.receipts.qrcode_base64")
+    def test_invoice_pdf_generation(self, mock_qr, mock_siteinfo, mock_render_pdf):
         self.client.force_login(self.user)
         
         # Mock SiteInfo
@@ -120,22 +284,24 @@ class ClientViewsTests(TestCase):
         mock_site.logo.url = "/media/logo.png"
         mock_siteinfo.objects.latest.return_value = mock_site
         
-        # Mock Playwright
-        mock_p = MagicMock()
-        mock_browser = MagicMock()
-        mock_page = MagicMock()
-        
-        mock_playwright.return_value.__enter__.return_value = mock_p
-        mock_p.chromium.launch.return_value = mock_browser
-        mock_browser.new_page.return_value = mock_page
-        mock_page.pdf.return_value = b"%PDF-1.4..." # Fake PDF bytes
+        # Mock du pool Chromium
+        mock_render_pdf.return_value = b"%PDF-1.4..." # Fake PDF bytes
         
         url = reverse("invoice_pdf", args=[self.commande.id])
         resp = self.client.get(url)
         
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp["Content-Type"], "application/pdf")
+        self.assertEqual(resp["Content-Length"], str(len(b"%PDF-1.4...")))
         self.assertIn(f"Recu_{self.commande.transaction_id}.pdf", resp["Content-Disposition"])
+        self.assertEqual(b"".join(resp.streaming_content), b"%PDF-1.4...")
+
+        # Téléchargement suivant : fichier stocké, puis 304 si le navigateur a déjà le reçu
+        resp = self.client.get(url)
+        self.assertEqual(b"".join(resp.streaming_content), b"%PDF-1.4...")
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(mock_render_pdf.call_count, 1)
 
     def test_invoice_pdf_security_check(self):
         # Accéder à la facture d'un autre utilisateur
@@ -149,3 +315,201 @@ class ClientViewsTests(TestCase):
         
         # Devrait rediriger vers la liste 'commande'
         self.assertRedirects(resp, reverse("commande"))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEST)
+@patch("client.receipts.qrcode_base64", return_value="")
+@patch("client.receipts.SiteInfo")
+class ClientReceiptCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client_recu", password="pass")
+        customer = Customer.objects.create(user=self.user)
+        self.commande = Commande.objects.create(customer=customer, transaction_id="TRX100", prix_total=100)
+        self.request = RequestFactory().get("/")
+        self.addCleanup(shutil.rmtree, MEDIA_TEST, ignore_errors=True)
+
+    def _lire(self):
+        commande = Commande.objects.get(pk=self.commande.pk)
+        with receipts.get_receipt(commande, self.request) as fichier:
+            return commande, fichier.read()
+
+    def test_receipt_is_rendered_once_and_stored_on_the_order(self, mock_siteinfo, mock_qr):
+        with patch("client.receipts.render_pdf", return_value=b"%PDF-1") as render:
+            commande, contenu = self._lire()
+            commande, contenu = self._lire()
+
+        self.assertEqual(contenu, b"%PDF-1")
+        self.assertEqual(render.call_count, 1)
+        self.assertIn(receipts.receipt_key(commande, self.request), commande.recu_paiement.name)
+        # L'enregistrement du fichier ne modifie pas date_update (sinon la clé changerait)
+        self.assertEqual(commande.date_update, self.commande.date_update)
+
+    def test_changed_order_or_template_regenerates_receipt(self, mock_siteinfo, mock_qr):
+        with patch("client.receipts.render_pdf", return_value=b"%PDF-1"):
+            commande, _ = self._lire()
+        ancien = commande.recu_paiement.name
+
+        commande.prix_total = 120
+        commande.save()
+        with patch("client.receipts.render_pdf", return_value=b"%PDF-2") as render:
+            commande, contenu = self._lire()
+            self._lire()
+        self.assertEqual((contenu, render.call_count), (b"%PDF-2", 1))
+        self.assertFalse(commande.recu_paiement.storage.exists(ancien))
+
+        with patch("client.receipts.template_version", return_value="v2"), \
+                patch("client.receipts.render_pdf", return_value=b"%PDF-3"):
+            _, contenu = self._lire()
+        self.assertEqual(contenu, b"%PDF-3")
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_invoice_pdf_unavailable_when_renderer_fails(self, mock_siteinfo, mock_qr):
+        self.client.force_login(self.user)
+        with patch("client.receipts.render_pdf", side_effect=PDFTimeout("trop long")):
+            resp = self.client.get(reverse("invoice_pdf", args=[self.commande.id]))
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "10")
+        # Rien n'est stocké : le prochain téléchargement retentera le rendu
+        self.assertFalse(Commande.objects.get(pk=self.commande.pk).recu_paiement)
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def set_content(self, html, wait_until=None):
+        if self.browser.crash:
+            self.browser.connected = False
+            raise RuntimeError("Target closed")
+        if self.browser.delai:
+            await asyncio.sleep(self.browser.delai)
+        self.html = html
+
+    async def pdf(self, **options):
+        return ("PDF:" + self.html).encode()
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.page = FakePage(browser)
+
+    async def new_page(self):
+        self.browser.pages += 1
+        return self.page
+
+    async def close(self):
+        self.page.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.crash = False
+        self.delai = 0
+        self.pages = 0
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        return FakeContext(self)
+
+    async def close(self):
+        self.connected = False
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.browsers = []
+        self.chromium = self
+        self.erreur_lancement = None
+        self.delai_lancement = 0
+
+    async def start(self):
+        return self
+
+    async def launch(self, timeout=None):
+        if self.delai_lancement:
+            await asyncio.sleep(self.delai_lancement)
+        if self.erreur_lancement:
+            raise self.erreur_lancement
+        self.browsers.append(FakeBrowser())
+        return self.browsers[-1]
+
+    async def stop(self):
+        pass
+
+
+class PDFRendererTests(SimpleTestCase):
+    def setUp(self):
+        self.playwright = FakePlaywright()
+        patcher = patch("client.pdf.async_playwright", return_value=self.playwright)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.renderer = PDFRenderer(taille=2, timeout=1, attente=1, file_max=5, reutilisations=3)
+        self.addCleanup(self.renderer.close)
+
+    def test_browser_starts_lazily_and_pages_are_reused(self):
+        self.assertFalse(self.renderer.demarre)
+        self.assertEqual(self.playwright.browsers, [])
+
+        for i in range(3):
+            self.assertEqual(self.renderer.render("<p>%d</p>" % i, format="A4"), b"PDF:<p>%d</p>" % i)
+
+        self.assertEqual(len(self.playwright.browsers), 1)
+        self.assertEqual(self.playwright.browsers[0].pages, 1)
+
+        # Recyclage du contexte après `reutilisations` rendus
+        self.renderer.render("<p>4</p>")
+        self.assertEqual(self.playwright.browsers[0].pages, 2)
+
+    def test_concurrent_renders_are_bounded_by_pool_size(self):
+        self.renderer.render("<p>chauffe</p>")
+        self.playwright.browsers[0].delai = 0.1
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            resultats = list(executor.map(self.renderer.render, ["<p>%d</p>" % i for i in range(5)]))
+
+        self.assertEqual(resultats, [b"PDF:<p>%d</p>" % i for i in range(5)])
+        self.assertLessEqual(self.playwright.browsers[0].pages, 2)
+
+    def test_timeout(self):
+        self.renderer.render("<p>chauffe</p>")
+        self.playwright.browsers[0].delai = 2
+        with self.assertRaises(PDFTimeout):
+            self.renderer.render("<p>lent</p>")
+
+    def test_crashed_browser_is_restarted(self):
+        self.renderer.render("<p>1</p>")
+        self.playwright.browsers[0].crash = True
+        with self.assertRaises(PDFError):
+            self.renderer.render("<p>2</p>")
+
+        self.assertEqual(self.renderer.render("<p>3</p>"), b"PDF:<p>3</p>")
+        self.assertEqual(len(self.playwright.browsers), 2)
+
+    def test_launch_failure_and_hang_are_pdf_errors(self):
+        self.playwright.erreur_lancement = RuntimeError("Executable doesn't exist")
+        with self.assertRaises(PDFError):
+            self.renderer.render("<p>1</p>")
+
+        self.playwright.erreur_lancement, self.playwright.delai_lancement = None, 2
+        with self.assertRaises(PDFTimeout):
+            self.renderer.render("<p>2</p>")
+
+        self.playwright.delai_lancement = 0
+        self.assertEqual(self.renderer.render("<p>3</p>"), b"PDF:<p>3</p>")
+
+    def test_unanswered_render_is_a_timeout(self):
+        async def bloque(html, options):
+            await asyncio.sleep(5)
+
+        # Abandon après 0,1 s au lieu de attente + timeout + 5
+        self.renderer.marge = -1.9
+        with patch.object(self.renderer, "_rendre", bloque), self.assertRaises(PDFTimeout):
+            self.renderer.render("<p>1</p>")
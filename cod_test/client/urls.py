@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('', views.profil, name="profil"),
     path('commande', views.commande, name="commande"),
+    path('commande.json', views.commande_json, name="commande_json"),
     path('commande-detail/<int:commande_id>/', views.commande_detail, name="commande-detail"),
     path('liste-souhait', views.souhait, name="liste-souhait"),
     path('parametre', views.parametre, name="parametre"),
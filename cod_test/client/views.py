@@ -1,20 +1,24 @@
 from django.shortcuts import render, reverse, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from customer.models import Customer, Commande, ProduitPanier
+from customer.models import Customer, Commande
 from shop.models import  Favorite, Produit
 from django.core.paginator import Paginator
-from django.db.models import Q
 from cities_light.models import City
-from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_GET
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from .utils import render_to_pdf
-from .utils import qrcode_base64
-from website.models import SiteInfo
 import qrcode
-from playwright.sync_api import sync_playwright
+from . import historique, receipts
+from .pdf import PDFError
 import base64
 from io import BytesIO
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
@@ -41,6 +45,18 @@ def profil(request):
     return render(request, 'profil.html', datas)
 
 
+TAILLE_PAGE = 10
+
+
+def _page_commandes(request, customer):
+    # Lignes et produits de toute la page en une requête (historique()), pas une par commande
+    commandes = Commande.objects.filter(customer=customer).historique().order_by('-date_add', '-id')
+    query = request.GET.get('q', '')
+    if query:
+        commandes = historique.rechercher(commandes, query)
+    return Paginator(commandes, TAILLE_PAGE).get_page(request.GET.get('page')), query
+
+
 @login_required
 def commande(request):
     user = request.user
@@ -50,31 +66,13 @@ def commande(request):
     except:
         return redirect('index')
 
-    # Récupération de toutes les commandes de l'utilisateur
-    commandes = Commande.objects.filter(customer=customer).order_by('-date_add')
+    # Recherche par début d'ID transaction, produit ou période (jour, mois, année, intervalle)
+    commandes_paginated, query = _page_commandes(request, customer)
 
-    # Recherche par ID transaction, produit ou date
-    query = request.GET.get('q')
-    if query:
-        commandes = commandes.filter(
-            Q(transaction_id__icontains=query) |
-            Q(date_add__icontains=query) |
-            Q(produit_commande__produit__nom__icontains=query)
-        ).distinct()
-
-    # Pagination : Limite à 10 articles par page
-    paginator = Paginator(commandes, 10)  # 10 commandes par page
-    page = request.GET.get('page')
-    commandes_paginated = paginator.get_page(page)
-
-    # Récupération des produits associés aux commandes paginées
-    commandes_data = []
-    for commande in commandes_paginated:
-        produits_commande = ProduitPanier.objects.filter(commande=commande).select_related('produit')
-        commandes_data.append({
-            'commande': commande,
-            'produits': produits_commande,
-        })
+    commandes_data = [
+        {'commande': commande, 'produits': commande.lignes}
+        for commande in commandes_paginated
+    ]
 
     datas = {
         'user': user,
@@ -87,6 +85,25 @@ def commande(request):
     return render(request, 'commande.html', datas)
 
 
+@login_required
+@require_GET
+def commande_json(request):
+    """Historique des commandes en JSON, page par page, pour le chargement progressif du compte."""
+    try:
+        customer = request.user.customer
+    except Customer.DoesNotExist:
+        return JsonResponse({'message': 'Compte client introuvable'}, status=404)
+
+    page, _ = _page_commandes(request, customer)
+    return JsonResponse({
+        'commandes': [historique.serialiser(commande) for commande in page],
+        'page': page.number,
+        'pages': page.paginator.num_pages,
+        'total': page.paginator.count,
+        'suivant': page.next_page_number() if page.has_next() else None,
+    })
+
+
 @login_required
 def commande_detail(request, commande_id):
     user = request.user
@@ -96,17 +113,14 @@ def commande_detail(request, commande_id):
     except:
         return redirect('index')
 
-    # Récupération de la commande sélectionnée
-    commande = get_object_or_404(Commande, id=commande_id, customer=customer)
-
-    # Récupération des produits associés à cette commande
-    produits_commande = ProduitPanier.objects.filter(commande=commande).select_related('produit')
+    # Commande sélectionnée et ses produits, préchargés
+    commande = get_object_or_404(Commande.objects.historique(), id=commande_id, customer=customer)
 
     datas = {
         'user': user,
         'customer': customer,
         'commande': commande,
-        'produits_commande': produits_commande
+        'produits_commande': commande.lignes
     }
 
     return render(request, 'commande-detail.html', datas)
@@ -215,37 +229,27 @@ def invoice_pdf(request, order_id):
     if not hasattr(request.user, "customer") or order.customer_id != request.user.customer.id:
         return redirect("commande")
 
-    # 1. Générer le QR code en base64
+    # Reçu déjà rendu pour ce contenu : le navigateur peut garder le sien
+    etag = receipts.receipt_etag(order, request)
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
 
-    detail_url = request.build_absolute_uri(
-        reverse("commande-reçu-detail", args=[order.id])  # ou une URL publique de vérif
+    try:
+        fichier = receipts.get_receipt(order, request)
+    except PDFError:
+        logger.exception("Échec du rendu PDF de la commande %s", order.id)
+        response = HttpResponse("Le reçu est momentanément indisponible, veuillez réessayer.", status=503)
+        response["Retry-After"] = "10"
+        return response
+
+    # FileResponse diffuse le fichier stocké et renseigne Content-Length
+    response = FileResponse(
+        fichier, as_attachment=True, filename=f"Recu_{order.transaction_id}.pdf", content_type="application/pdf"
     )
-    qr_b64 = qrcode_base64(detail_url)
-
-    # 2. Construire le HTML à partir du template
-    html = render_to_string("receipt.html", {
-        "order_id": order,
-        "produits_commande": order.produit_commande.all(),
-        "qr_code": qr_b64,
-        "logo": request.build_absolute_uri(SiteInfo.objects.latest('date_add').logo.url)
-    }, request=request)
-
-    # 3. Lancer Playwright et générer le PDF
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        page.set_content(html, wait_until="load")  # on imprime directement le HTML rendu
-        pdf_bytes = page.pdf(
-            format="A4",
-            print_background=True,
-            margin={"top": "10mm", "right": "10mm", "bottom": "10mm", "left": "10mm"}
-        )
-        browser.close()
-
-    # 4. Forcer le téléchargement du PDF
-    filename = f"Recu_{order.transaction_id}.pdf"
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 #
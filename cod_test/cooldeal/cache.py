@@ -0,0 +1,51 @@
+"""Configuration du cache lue dans l'environnement.
+
+Le cache doit être partagé par tous les workers : les tampons de version de website.cache
+(habillage, villes, pages du catalogue, ETag) n'invalident sinon que le processus qui a
+enregistré la modification.
+
+- CACHE_URL :
+  - absente : fichiers dans BASE_DIR/cache, partagés par les workers d'un même serveur ;
+  - redis://hote:6379/0 (ou rediss://) : Redis, partagé entre serveurs (paquet redis requis) ;
+  - db://table : table de la base (python manage.py createcachetable), cooldeal_cache par défaut ;
+  - file:///chemin : fichiers dans ce dossier ;
+  - locmem:// : mémoire du processus, pour un seul worker (développement, tests).
+- CACHE_KEY_PREFIX : préfixe des clés, pour plusieurs sites sur un même Redis.
+"""
+from urllib.parse import unquote, urlsplit
+
+from .database import ConfigurationInvalide
+
+
+def configuration(environ, base_dir):
+    """Entrée CACHES['default'] décrite par `environ` (voir l'en-tête du module)."""
+    url = environ.get('CACHE_URL', '')
+    schema = urlsplit(url).scheme
+    if not url:
+        config = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(base_dir / 'cache'),
+        }
+    elif schema in ('redis', 'rediss'):
+        config = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    elif schema == 'db':
+        config = {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': urlsplit(url).netloc or 'cooldeal_cache',
+        }
+    elif schema == 'file':
+        config = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': unquote(urlsplit(url).path),
+        }
+    elif schema == 'locmem':
+        config = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    else:
+        raise ConfigurationInvalide('Cache non pris en charge : %s' % schema)
+
+    if config['BACKEND'].endswith('FileBasedCache'):
+        # 300 entrées par défaut : trop peu pour les pages du catalogue
+        config['OPTIONS'] = {'MAX_ENTRIES': 10000}
+    if environ.get('CACHE_KEY_PREFIX'):
+        config['KEY_PREFIX'] = environ['CACHE_KEY_PREFIX']
+    return config
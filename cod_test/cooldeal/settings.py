@@ -85,18 +85,62 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    'base.middleware.PrimaryStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.middleware.QueryBudgetMiddleware',
 ]
 
+# Budget de requêtes SQL par page (base.middleware.QueryBudgetMiddleware)
+# 'off' : désactivé, 'warn' : journalise les dépassements, 'raise' : lève une erreur
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn' if DEBUG else 'off')
+QUERY_BUDGETS = {
+    'index': 12,
+    'about': 10,
+    'shop': 12,
+    'shop_suite': 8,
+    'categorie': 12,
+    'product_detail': 12,
+    'cart': 12,
+    'commande': 12,
+    'commande_json': 8,
+    'commande-detail': 10,
+    'dashboard': 12,
+    # Connexion : fusion du panier anonyme dans celui du client (customer.panier.fusionner)
+    'post': 40,
+}
+QUERY_BUDGET_DEFAULT = 30
+
+# Pool Chromium des reçus PDF (client.pdf), démarré au premier rendu
+PDF_POOL_SIZE = int(os.environ.get('PDF_POOL_SIZE', 2))
+PDF_TIMEOUT = 30
+PDF_QUEUE_TIMEOUT = 10
+PDF_MAX_QUEUE = 20
+
+# Durée de réservation du stock d'un produit mis au panier, en minutes (customer.stock)
+STOCK_RESERVATION_TTL = 15
+
+# Panier des visiteurs anonymes : 'database' (Panier lié à la session) ou 'cookie' (cookie signé,
+# enregistré en base à la connexion ; voir customer.panier_cookie)
+CART_STORAGE = os.environ.get('CART_STORAGE', 'database')
+
+# Durée de vie (s) des pages du catalogue mises en cache pour les anonymes (website.cache.cache_anonymous_page)
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+# Entre dans l'ETag des pages du catalogue (website.conditional) : à changer quand les gabarits changent
+CONDITIONAL_GET_VERSION = os.environ.get('CONDITIONAL_GET_VERSION', '1')
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 CRON_CLASSES = [
     "customer.cron.CleanExpiredTokensCronJob",
+    "customer.cron.ReleaseExpiredReservationsCronJob",
+    "base.cron.SendOutboxCronJob",
+    "base.cron.GenerateRenditionsCronJob",
 ]
 
 
@@ -127,7 +171,6 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'website.context_processors.categories',
                 'website.context_processors.site_infos',
-                'website.context_processors.cities',
                 'website.context_processors.cart',
                 'website.context_processors.galeries',
                 'website.context_processors.horaires',
@@ -142,22 +185,27 @@ WSGI_APPLICATION = 'cooldeal.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# SQLite par défaut ; PostgreSQL via DATABASE_URL (voir cooldeal/database.py pour les réglages)
+from .database import configuration as _configuration_base_de_donnees, repliques as _repliques
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': _configuration_base_de_donnees(os.environ, BASE_DIR),
+    **_repliques(os.environ, BASE_DIR),
+}
+
+# Lectures du catalogue sur les réplicas (DATABASE_REPLICA_URLS), voir base.routers
+DATABASE_ROUTERS = ['base.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Après une écriture, les lectures du visiteur restent sur le primaire pendant ce délai (s)
+DATABASE_STICKY_SECONDS = int(os.environ.get('DATABASE_STICKY_SECONDS', 10))
+
+# Cache partagé par les workers ; fichiers dans BASE_DIR/cache par défaut, Redis ou base via
+# CACHE_URL (voir cooldeal/cache.py)
+from .cache import configuration as _configuration_cache
+
+CACHES = {
+    'default': _configuration_cache(os.environ, BASE_DIR),
 }
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.mysql',
-#         'NAME': 'cooldeal',
-#         'USER': 'root',
-#         'PASSWORD': '',
-#         'HOST': '127.0.0.1',
-#         'PORT': '3306',
-#     }
-# }
 
 
 # Password validation
@@ -227,6 +275,11 @@ EMAIL_HOST_PASSWORD = 'fddd pmet bors unhf'  # Remplacez par le mot de passe d'a
 DEFAULT_FROM_EMAIL = 'nguessandezz@gmail.com'
 CONTACT_EMAIL = 'nguessandezz@gmail.com'
 
+# File d'envoi des e-mails (base.outbox), vidée par `manage.py send_outbox` ou le cron
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_OUTBOX_BACKOFF = 60  # secondes, doublé à chaque échec
+
 DAISY_SETTINGS = {
     'SITE_TITLE': 'Django Admin',  # The title of the site
     'SITE_HEADER': 'Administration',  # Header text displayed in the admin panel
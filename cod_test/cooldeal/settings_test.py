@@ -38,3 +38,12 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 
 # Use a test URLConf that does not require optional dependencies (e.g. DRF).
 ROOT_URLCONF = "cooldeal.urls_test"
+
+# Fail loudly when a page exceeds its SQL query budget.
+QUERY_BUDGET_MODE = "raise"
+
+# Second alias, miroir de 'default' : le routeur des réplicas se teste avec deux bases (base.tests)
+DATABASES["replica"] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+
+# Un seul processus : cache en mémoire, rien d'écrit dans BASE_DIR/cache
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
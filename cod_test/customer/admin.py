@@ -146,6 +146,12 @@ class PasswordResetTokenAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)  # Filtres par champ
     search_fields = ('user__username', 'token')  # Champs de recherche
 
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'produit', 'ligne', 'quantite', 'expire_le', 'date_add')
+    list_filter = ('expire_le',)
+    raw_id_fields = ('produit', 'ligne')
+
+
 # Enregistrez le modèle avec l'administration
 admin.site.register(PasswordResetToken, PasswordResetTokenAdmin)
 
@@ -158,4 +164,5 @@ _register(models.Customer, CustomerAdmin)
 _register(models.CodePromotionnel, CodePromotionnelAdmin)
 _register(models.Panier, PanierAdmin)
 _register(models.Commande, CommandeAdmin)
-_register(models.ProduitPanier, ProduitPanierAdmin)
\ No newline at end of file
+_register(models.ProduitPanier, ProduitPanierAdmin)
+_register(models.Reservation, ReservationAdmin)
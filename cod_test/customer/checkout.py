@@ -0,0 +1,98 @@
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from shop import ventes
+
+from . import models, stock
+from .pricing import TOTAUX_VIDES, cart_totals
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class PanierIntrouvable(CheckoutError):
+    pass
+
+
+class PanierVide(CheckoutError):
+    pass
+
+
+class TransactionDejaUtilisee(CheckoutError):
+    pass
+
+
+def _commande_existante(customer, transaction_id):
+    commande = models.Commande.objects.filter(transaction_id=transaction_id).first()
+    if commande is not None and commande.customer_id != customer.pk:
+        raise TransactionDejaUtilisee(transaction_id)
+    return commande
+
+
+def _passer_commande(customer, panier_id, transaction_id):
+    with transaction.atomic():
+        commande = _commande_existante(customer, transaction_id)
+        if commande is not None:
+            return commande, False
+
+        try:
+            # Verrou sur le panier : deux validations simultanées passent l'une après l'autre
+            panier = models.Panier.objects.select_for_update().get(pk=panier_id, customer=customer)
+        except models.Panier.DoesNotExist:
+            raise PanierIntrouvable(panier_id)
+        # Client déjà chargé : l'invalidation du mini-panier à la suppression n'a pas à le relire
+        panier.customer = customer
+
+        totaux = cart_totals([panier]).get(panier.pk, TOTAUX_VIDES)
+        if not totaux.nombre_lignes:
+            raise PanierVide(panier_id)
+        stock.decrementer(panier)
+
+        commande = models.Commande.objects.create(
+            customer=customer,
+            payment_url='payment_url',
+            id_paiment=transaction_id,
+            transaction_id=transaction_id,
+            api_response_id='api_response_id',
+            payment_token='payment_token',
+            prix_total=totaux.total,
+        )
+        lignes = models.ProduitPanier.objects.filter(panier=panier)
+        totaux = ventes.totaux_par_etablissement(lignes)
+        models.SousCommande.objects.bulk_create([
+            models.SousCommande(
+                commande=commande, etablissement_id=total['etablissement_id'], sous_total=total['montant'],
+                nombre_articles=total['unites'], status=commande.status, date_add=commande.date_add,
+            )
+            for total in totaux
+        ])
+        ventes.enregistrer_commande(commande, totaux)
+        lignes.update(panier=None, commande=commande)
+        panier.delete()
+    return commande, True
+
+
+def passer_commande(customer, panier_id, transaction_id, tentatives=3):
+    """Transforme le panier en commande, en une seule transaction.
+
+    Le total est calculé en une requête, le stock est sorti par des UPDATE conditionnels
+    (stock.StockInsuffisant sinon) et les lignes passent du panier à la commande en un
+    seul UPDATE. transaction_id sert de clé d'idempotence : une requête rejouée
+    renvoie la commande déjà créée. Renvoie (commande, créée).
+    """
+    for essai in range(tentatives):
+        try:
+            return _passer_commande(customer, panier_id, transaction_id)
+        except IntegrityError:
+            # Même transaction_id validé en parallèle : la contrainte d'unicité a tranché
+            commande = _commande_existante(customer, transaction_id)
+            if commande is None:
+                raise
+            return commande, False
+        except OperationalError:
+            # Verrou ou interblocage : on rejoue la transaction entière
+            if essai == tentatives - 1:
+                raise
+            time.sleep(0.05 * (essai + 1))
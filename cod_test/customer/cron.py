@@ -1,5 +1,6 @@
 from django_cron import CronJobBase, Schedule
 from customer.models import PasswordResetToken
+from customer import stock
 from django.utils.timezone import now
 from datetime import timedelta
 
@@ -15,3 +16,14 @@ class CleanExpiredTokensCronJob(CronJobBase):
         count = expired_tokens.count()
         expired_tokens.delete()
         print(f"{count} tokens expirés supprimés.")
+
+
+class ReleaseExpiredReservationsCronJob(CronJobBase):
+    RUN_EVERY_MINS = 1
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'customer.release_expired_reservations'
+
+    def do(self):
+        liberees = stock.liberer_expirees()
+        return f"{liberees} réservations expirées libérées."
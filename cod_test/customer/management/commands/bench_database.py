@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from customer.models import Customer, Panier
+from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
+
+
+def _poster(client, url, donnees):
+    debut = time.monotonic()
+    reponse = client.post(url, json.dumps(donnees), content_type='application/json')
+    duree = time.monotonic() - debut
+    return duree, reponse.status_code == 200 and reponse.json().get('success')
+
+
+def _client(args):
+    """Worker : `commandes` fois, ajoute `lignes` produits au panier puis valide la commande."""
+    user_id, produits, commandes, lignes = args
+    connections.close_all()
+    user = User.objects.get(pk=user_id)
+    customer = Customer.objects.get(user=user)
+    client = Client(HTTP_HOST='127.0.0.1')
+    client.force_login(user)
+    mesures = {'panier': [], 'commande': [], 'echecs_panier': 0, 'echecs_commande': 0}
+    for _ in range(commandes):
+        for produit in random.sample(produits, lignes):
+            duree, ok = _poster(client, reverse('add_to_cart'), {'panier': None, 'produit': produit, 'quantite': 1})
+            mesures['panier'].append(duree)
+            mesures['echecs_panier'] += not ok
+        panier = Panier.objects.filter(customer=customer).order_by('-pk').values_list('pk', flat=True).first()
+        duree, ok = _poster(client, reverse('paiement_detail'), {
+            'panier': panier, 'transaction_id': uuid.uuid4().hex,
+            'notify_url': 'http://127.0.0.1/notify', 'return_url': 'http://127.0.0.1/retour',
+        })
+        mesures['commande'].append(duree)
+        # Sous SQLite, surtout des « database is locked » : un seul écrivain à la fois
+        mesures['echecs_commande'] += not ok
+    connections.close_all()
+    return mesures
+
+
+def _centile(durees, centile):
+    return statistics.quantiles(durees, n=100)[centile - 1] if len(durees) > 1 else durees[0]
+
+
+class Command(BaseCommand):
+    help = ("Mesure le débit des endpoints panier (add_to_cart) et commande (paiement_detail) sur la base "
+            "configurée. À lancer sans puis avec DATABASE_URL pour comparer SQLite et PostgreSQL "
+            "(données supprimées à la fin).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processus', type=int, default=8, help='Clients simultanés (un processus chacun).')
+        parser.add_argument('--commandes', type=int, default=20, help='Commandes passées par client.')
+        parser.add_argument('--lignes', type=int, default=3, help='Produits ajoutés au panier avant chaque commande.')
+        parser.add_argument('--produits', type=int, default=100)
+
+    def handle(self, *args, **options):
+        produits, users = self._seed(options['produits'], options['processus'])
+        try:
+            connections.close_all()
+            taches = [(u.pk, produits, options['commandes'], options['lignes']) for u in users]
+            debut = time.monotonic()
+            with multiprocessing.get_context('fork').Pool(options['processus']) as pool:
+                resultats = pool.map(_client, taches)
+            duree = time.monotonic() - debut
+        finally:
+            User.objects.filter(username__startswith='bench-db-').delete()
+            CategorieEtablissement.objects.filter(nom='Bench DB').delete()
+
+        reglages = connection.settings_dict
+        self.stdout.write('%s (%s), CONN_MAX_AGE=%s, %d clients, %.2f s' % (
+            connection.vendor, reglages['NAME'], reglages['CONN_MAX_AGE'], options['processus'], duree))
+        for endpoint in ('panier', 'commande'):
+            durees = [d for r in resultats for d in r[endpoint]]
+            echecs = sum(r['echecs_' + endpoint] for r in resultats)
+            self.stdout.write('%-8s %5d requêtes  %7.1f req/s  p50 %6.1f ms  p95 %6.1f ms  échecs %d' % (
+                endpoint, len(durees), len(durees) / duree,
+                _centile(durees, 50) * 1000, _centile(durees, 95) * 1000, echecs))
+
+    def _seed(self, nombre, processus):
+        vendeur = User.objects.create_user(username='bench-db-vendeur')
+        categorie_etab = CategorieEtablissement.objects.create(nom='Bench DB', description='')
+        categorie = CategorieProduit.objects.create(nom='Bench DB', description='', categorie=categorie_etab)
+        etablissement = Etablissement.objects.create(
+            user=vendeur, nom='Bench DB', description='', categorie=categorie_etab,
+            nom_du_responsable='Bench', prenoms_duresponsable='DB',
+            adresse='', pays='', contact_1='', email='bench@example.com',
+        )
+        Produit.objects.bulk_create([
+            Produit(
+                nom='Produit %d' % i, description='', description_deal='', prix=1000 + i, slug='bench-db-%d' % i,
+                categorie=categorie, categorie_etab=categorie_etab, etablissement=etablissement,
+            )
+            for i in range(nombre)
+        ])
+        produits = list(Produit.objects.filter(etablissement=etablissement).values_list('pk', flat=True))
+        users = []
+        for i in range(processus):
+            user = User.objects.create_user(username='bench-db-%d' % i, first_name='Bench', last_name='DB')
+            Customer.objects.create(user=user)
+            users.append(user)
+        return produits, users
@@ -0,0 +1,95 @@
+import multiprocessing
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from customer import checkout, stock
+from customer.models import Customer, Panier, ProduitPanier
+from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
+
+
+def _acheter(args):
+    """Worker : `achats` achats d'une unité du produit, chacun réservé au panier puis commandé."""
+    customer_id, produit_id, achats, reservation = args
+    connections.close_all()
+    customer = Customer.objects.get(pk=customer_id)
+    resultats = {'vendus': 0, 'rupture': 0, 'erreurs': 0}
+    for _ in range(achats):
+        ligne = None
+        try:
+            # Un panier par client (contrainte panier_client_unique) : après un échec, le même
+            # panier et sa ligne servent à l'achat suivant (reserver() ajuste la réservation)
+            panier, _ = Panier.objects.get_or_create(customer=customer)
+            ligne, _ = ProduitPanier.objects.get_or_create(panier=panier, produit_id=produit_id, defaults={'quantite': 1})
+            if reservation:
+                stock.reserver(ligne, 1)
+            checkout.passer_commande(customer, panier.pk, uuid.uuid4().hex, tentatives=10)
+            resultats['vendus'] += 1
+        except stock.StockInsuffisant:
+            resultats['rupture'] += 1
+        except DatabaseError:
+            # Verrou toujours occupé après les nouvelles tentatives : on rend la réservation
+            resultats['erreurs'] += 1
+            if ligne is not None:
+                try:
+                    stock.liberer([ligne])
+                except DatabaseError:
+                    pass  # le balayeur la rendra à expiration
+    connections.close_all()
+    return resultats
+
+
+class Command(BaseCommand):
+    help = ("Stress test du stock : plusieurs processus achètent le même produit en parallèle. "
+            "Mesure le débit et vérifie l'absence de survente (données supprimées à la fin).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processus', type=int, default=8)
+        parser.add_argument('--achats', type=int, default=50, help='Achats tentés par processus.')
+        parser.add_argument('--stock', type=int, default=200)
+        parser.add_argument('--sans-reservation', action='store_true', help='Commande directe, sans réserver au panier.')
+
+    def handle(self, *args, **options):
+        produit, customers = self._seed(options['stock'], options['processus'])
+        try:
+            connections.close_all()
+            taches = [(c.pk, produit.pk, options['achats'], not options['sans_reservation']) for c in customers]
+            debut = time.monotonic()
+            with multiprocessing.get_context('fork').Pool(options['processus']) as pool:
+                resultats = pool.map(_acheter, taches)
+            duree = time.monotonic() - debut
+
+            total = {cle: sum(r[cle] for r in resultats) for cle in ('vendus', 'rupture', 'erreurs')}
+            produit.refresh_from_db()
+            tentes = options['processus'] * options['achats']
+            self.stdout.write('%d achats tentés en %.2f s : %.0f achats/s' % (tentes, duree, tentes / duree))
+            self.stdout.write('vendus %(vendus)d, rupture %(rupture)d, erreurs %(erreurs)d' % total)
+            self.stdout.write('stock restant %d, réservé %d' % (produit.quantite, produit.quantite_reservee))
+            coherent = produit.quantite >= 0 and produit.quantite == options['stock'] - total['vendus']
+            self.stdout.write('survente : %s' % ('non' if coherent else 'OUI'))
+        finally:
+            User.objects.filter(username__startswith='stress-stock-').delete()
+            produit.categorie.categorie.delete()
+
+    def _seed(self, quantite, processus):
+        vendeur = User.objects.create_user(username='stress-stock-vendeur')
+        categorie_etab = CategorieEtablissement.objects.create(nom='Stress', description='')
+        categorie = CategorieProduit.objects.create(nom='Stress', description='', categorie=categorie_etab)
+        etablissement = Etablissement.objects.create(
+            user=vendeur, nom='Stress', description='', categorie=categorie_etab,
+            nom_du_responsable='Stress', prenoms_duresponsable='Stock',
+            adresse='', pays='', contact_1='', email='stress@example.com',
+        )
+        produit = Produit.objects.create(
+            nom='Deal populaire', description='', description_deal='', prix=1000, quantite=quantite,
+            categorie=categorie, etablissement=etablissement,
+        )
+        customers = [
+            Customer.objects.create(user=User.objects.create_user(
+                username='stress-stock-%d' % i, first_name='Stress', last_name='Stock'))
+            for i in range(processus)
+        ]
+        return produit, customers
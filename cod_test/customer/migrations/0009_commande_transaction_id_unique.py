@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def renommer_doublons(apps, schema_editor):
+    """Donne un transaction_id distinct aux commandes créées en double par une nouvelle tentative.
+
+    La plus ancienne garde l'identifiant ; les autres deviennent « <id>-doublon-<pk> », sans
+    perte de lignes, à rapprocher à la main du prestataire de paiement. Les NULL ne sont pas concernés.
+    """
+    Commande = apps.get_model('customer', 'Commande')
+    doublons = (
+        Commande.objects.filter(transaction_id__isnull=False)
+        .values('transaction_id').annotate(n=Count('id')).filter(n__gt=1).order_by()
+    )
+    for doublon in list(doublons):
+        commandes = Commande.objects.filter(transaction_id=doublon['transaction_id']).order_by('id')
+        for commande in list(commandes)[1:]:
+            commande.transaction_id = '%s-doublon-%d' % (commande.transaction_id, commande.pk)
+            commande.save(update_fields=['transaction_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0008_customer_ville'),
+    ]
+
+    operations = [
+        migrations.RunPython(renommer_doublons, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commande',
+            constraint=models.UniqueConstraint(fields=('transaction_id',), name='commande_transaction_id_unique'),
+        ),
+    ]
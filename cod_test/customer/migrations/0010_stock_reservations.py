@@ -0,0 +1,30 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_stock_reservations'),
+        ('customer', '0009_commande_transaction_id_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.PositiveIntegerField()),
+                ('expire_le', models.DateTimeField(db_index=True)),
+                ('date_add', models.DateTimeField(auto_now_add=True)),
+                ('ligne', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservation', to='customer.produitpanier')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.produit')),
+            ],
+            options={
+                'verbose_name': 'Réservation',
+                'verbose_name_plural': 'Réservations',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_vente_journaliere'),
+        ('customer', '0010_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SousCommande',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sous_total', models.FloatField(default=0)),
+                ('nombre_articles', models.PositiveIntegerField(default=0)),
+                ('status', models.BooleanField(default=True)),
+                ('date_add', models.DateTimeField()),
+                ('commande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sous_commandes', to='customer.commande')),
+                ('etablissement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sous_commandes', to='shop.etablissement')),
+            ],
+            options={
+                'verbose_name': 'Sous-commande',
+                'verbose_name_plural': 'Sous-commandes',
+                'indexes': [models.Index(fields=['etablissement', '-date_add', '-id'], name='sous_commande_etab_date_idx'), models.Index(fields=['etablissement', 'status', '-date_add', '-id'], name='sous_commande_etab_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='souscommande',
+            constraint=models.UniqueConstraint(fields=('commande', 'etablissement'), name='sous_commande_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import TruncDate
+
+
+def remplir(apps, schema_editor):
+    from shop.models import prix_effectif_expression
+
+    ProduitPanier = apps.get_model('customer', 'ProduitPanier')
+    SousCommande = apps.get_model('customer', 'SousCommande')
+    prix = prix_effectif_expression('produit__', TruncDate('commande__date_add'))
+    totaux = (
+        ProduitPanier.objects.filter(commande__isnull=False)
+        .values('commande_id', 'produit__etablissement_id', 'commande__status', 'commande__date_add')
+        .annotate(unites=Sum('quantite'), montant=Sum(F('quantite') * prix, output_field=FloatField()))
+        .order_by('commande_id')
+    )
+    SousCommande.objects.bulk_create([
+        SousCommande(
+            commande_id=t['commande_id'], etablissement_id=t['produit__etablissement_id'],
+            sous_total=t['montant'] or 0, nombre_articles=t['unites'],
+            status=t['commande__status'], date_add=t['commande__date_add'],
+        )
+        for t in totaux.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0011_sous_commande'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir, migrations.RunPython.noop),
+    ]
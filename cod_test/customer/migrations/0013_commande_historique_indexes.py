@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0012_sous_commande_backfill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['customer', '-date_add', '-id'], name='commande_client_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['transaction_id'], name='commande_transaction_like_idx', opclasses=['text_pattern_ops']),
+        ),
+    ]
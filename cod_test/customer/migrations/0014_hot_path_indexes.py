@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionner_doublons(apps, schema_editor):
+    """Regroupe les lignes en double d'un même produit dans un panier sur la plus ancienne.
+
+    Les réservations des lignes supprimées restent jusqu'à expiration et sont rendues par le balayeur.
+    """
+    ProduitPanier = apps.get_model('customer', 'ProduitPanier')
+    doublons = (
+        ProduitPanier.objects.filter(panier__isnull=False)
+        .values('panier_id', 'produit_id')
+        .annotate(n=Count('id'), premier=Min('id'), total=Sum('quantite'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    for doublon in list(doublons):
+        lignes = ProduitPanier.objects.filter(panier_id=doublon['panier_id'], produit_id=doublon['produit_id'])
+        lignes.filter(pk=doublon['premier']).update(quantite=doublon['total'])
+        lignes.exclude(pk=doublon['premier']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0013_commande_historique_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(fusionner_doublons, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='produitpanier',
+            constraint=models.UniqueConstraint(condition=models.Q(('panier__isnull', False)), fields=('panier', 'produit'), name='produit_panier_unique'),
+        ),
+    ]
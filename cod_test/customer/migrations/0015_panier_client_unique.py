@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fusionner_paniers(apps, schema_editor):
+    """Regroupe les paniers d'un même client sur le plus récent et les détache de leur session.
+
+    Une ligne dont le produit est déjà dans le panier gardé y ajoute sa quantité. Les
+    réservations des lignes supprimées restent jusqu'à expiration et sont rendues par le balayeur.
+    """
+    Panier = apps.get_model('customer', 'Panier')
+    ProduitPanier = apps.get_model('customer', 'ProduitPanier')
+    doublons = (
+        Panier.objects.filter(customer__isnull=False)
+        .values('customer_id').annotate(n=Count('id')).filter(n__gt=1).order_by()
+    )
+    for doublon in list(doublons):
+        paniers = list(Panier.objects.filter(customer_id=doublon['customer_id']).order_by('-id'))
+        garde, autres = paniers[0], paniers[1:]
+        lignes = {ligne.produit_id: ligne for ligne in ProduitPanier.objects.filter(panier=garde)}
+        for ligne in ProduitPanier.objects.filter(panier__in=autres).order_by('id'):
+            if ligne.produit_id in lignes:
+                lignes[ligne.produit_id].quantite += ligne.quantite
+                lignes[ligne.produit_id].save(update_fields=['quantite'])
+                ligne.delete()
+            else:
+                ligne.panier = garde
+                ligne.save(update_fields=['panier'])
+                lignes[ligne.produit_id] = ligne
+        if garde.coupon_id is None:
+            garde.coupon_id = next((panier.coupon_id for panier in autres if panier.coupon_id), None)
+            garde.save(update_fields=['coupon'])
+        Panier.objects.filter(pk__in=[panier.pk for panier in autres]).delete()
+    # Sinon la déconnexion, qui supprime la session, emporterait le panier du client
+    Panier.objects.filter(customer__isnull=False).update(session_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_paniers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='panier',
+            constraint=models.UniqueConstraint(condition=models.Q(('customer__isnull', False)), fields=('customer',), name='panier_client_unique'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 try:
@@ -32,7 +33,8 @@ class Customer(models.Model):
 class PasswordResetToken(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='password_reset_token')
     token = models.CharField(max_length=100, unique=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Purge horaire des jetons expirés (customer.cron)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def is_valid(self):
         return now() - self.created_at <= timedelta(hours=1)  # Token valide pendant 1 heure
@@ -83,32 +85,45 @@ class Panier(models.Model):
         """Meta definition for Panier."""
         verbose_name = 'Panier'
         verbose_name_plural = 'Paniers'
+        constraints = [
+            # Un seul panier par client (customer.utils.get_cart) ; celui d'un anonyme suit sa session
+            models.UniqueConstraint(
+                fields=['customer'], condition=models.Q(customer__isnull=False), name='panier_client_unique',
+            ),
+        ]
 
     def __str__(self):
         """Unicode representation of Panier."""
         return "panier"
 
+    @property
+    def totaux(self):
+        from .pricing import panier_totaux
+        return panier_totaux(self)
+
+    @property
+    def lignes(self):
+        return self.produit_panier.avec_prix().order_by('id')
+
     @property
     def total(self):
-        sum = 0
-        for i in self.produit_panier.all():
-            sum = sum + i.total
-        return int(sum)
+        return self.totaux.sous_total
 
     @property
     def total_with_coupon(self):
-        reduction = 0
-        if self.coupon:
-            reduction = self.coupon.reduction * self.total
-        return int(self.total - reduction)
+        return self.totaux.total
 
     @property
     def check_empty(self):
-        panier = Panier.objects.get(id=self.id)
-        if panier.produit_panier.count() > 0:
-            return True
-        else:
-            return False
+        return self.totaux.nombre_lignes > 0
+
+
+class CommandeQuerySet(models.QuerySet):
+
+    def historique(self):
+        """Commandes avec leurs lignes (produit chargé, prix unitaire du jour de la commande) en une requête de plus."""
+        lignes = ProduitPanier.objects.au_prix_de_la_commande().order_by('pk')
+        return self.prefetch_related(models.Prefetch('produit_commande', queryset=lignes))
 
 
 class Commande(models.Model):
@@ -128,16 +143,41 @@ class Commande(models.Model):
     status = models.BooleanField(default=True)
     recu_paiement = models.FileField(upload_to="fichiers/paiements", null=True)
 
+    objects = CommandeQuerySet.as_manager()
+
     class Meta:
         """Meta definition for UserRessource."""
 
         verbose_name = 'Commande'
         verbose_name_plural = 'Commandes'
+        indexes = [
+            # Historique d'un client, du plus récent au plus ancien
+            models.Index(fields=['customer', '-date_add', '-id'], name='commande_client_recent_idx'),
+            # Recherche par début de transaction_id (LIKE 'abc%' ; opclass ignorée hors PostgreSQL)
+            models.Index(fields=['transaction_id'], name='commande_transaction_like_idx', opclasses=['text_pattern_ops']),
+        ]
+        constraints = [
+            # Clé d'idempotence de la validation du panier (voir customer.checkout)
+            models.UniqueConstraint(fields=['transaction_id'], name='commande_transaction_id_unique'),
+        ]
 
     def __str__(self):
         """Unicode representation of UserRessource."""
         return "commande"
     
+    @property
+    def lignes(self):
+        return list(self.produit_commande.all())
+
+    @property
+    def nombre_articles(self):
+        return sum(ligne.quantite for ligne in self.lignes)
+
+    @property
+    def sous_total(self):
+        """Total des lignes (après historique(), sans requête) ; le montant payé est prix_total."""
+        return sum(ligne.total for ligne in self.lignes)
+
     @property
     def check_paiement(self):
 
@@ -147,6 +187,47 @@ class Commande(models.Model):
             return False
 
 
+class SousCommande(models.Model):
+    """Part d'une commande revenant à un établissement, écrite à la validation du panier.
+
+    Les écrans commerçant lisent cette table (index par établissement) au lieu de
+    remonter Commande -> ProduitPanier -> Produit -> Etablissement.
+    """
+
+    commande = models.ForeignKey(Commande, related_name="sous_commandes", on_delete=models.CASCADE)
+    etablissement = models.ForeignKey('shop.Etablissement', related_name="sous_commandes", on_delete=models.CASCADE)
+    sous_total = models.FloatField(default=0)
+    nombre_articles = models.PositiveIntegerField(default=0)
+    # Copies de la commande, pour filtrer et trier sans jointure
+    status = models.BooleanField(default=True)
+    date_add = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Sous-commande'
+        verbose_name_plural = 'Sous-commandes'
+        constraints = [
+            models.UniqueConstraint(fields=['commande', 'etablissement'], name='sous_commande_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['etablissement', '-date_add', '-id'], name='sous_commande_etab_date_idx'),
+            models.Index(fields=['etablissement', 'status', '-date_add', '-id'], name='sous_commande_etab_status_idx'),
+        ]
+
+    def __str__(self):
+        return '%s / %s' % (self.commande_id, self.etablissement_id)
+
+
+class ProduitPanierQuerySet(models.QuerySet):
+
+    def avec_prix(self, jour=None):
+        """Charge le produit et annote le prix unitaire effectif (promotion comprise) du jour, ou de `jour`."""
+        return self.select_related('produit').annotate(prix_unitaire=Produit.prix_effectif_expression('produit__', jour))
+
+    def au_prix_de_la_commande(self):
+        """avec_prix() au jour de la commande : une promotion finie depuis reste appliquée."""
+        return self.avec_prix(TruncDate('commande__date_add'))
+
+
 class ProduitPanier(models.Model):
     produit = models.ForeignKey('shop.Produit', related_name="commande", on_delete=models.CASCADE)
     panier = models.ForeignKey(Panier, related_name="produit_panier", on_delete=models.CASCADE, null=True)
@@ -156,14 +237,26 @@ class ProduitPanier(models.Model):
     date_update = models.DateTimeField(auto_now=True)
     status = models.BooleanField(default=True)
 
+    objects = ProduitPanierQuerySet.as_manager()
+
     class Meta:
         """Meta definition for UserRessource."""
 
         verbose_name = 'Produit Panier/Commande'
         verbose_name_plural = 'Produits Panier/Commande'
+        constraints = [
+            # Une ligne par produit et par panier ; l'index sert aussi la recherche de add_to_cart
+            models.UniqueConstraint(
+                fields=['panier', 'produit'], condition=models.Q(panier__isnull=False),
+                name='produit_panier_unique',
+            ),
+        ]
 
     @property
     def total(self):
+        prix_unitaire = getattr(self, 'prix_unitaire', None)
+        if prix_unitaire is not None:
+            return prix_unitaire * self.quantite
         if self.produit.check_promotion:
             return self.produit.prix_promotionnel * self.quantite
         else:
@@ -171,4 +264,18 @@ class ProduitPanier(models.Model):
         
 
 
+class Reservation(models.Model):
+    """Unités d'un produit retenues pour une ligne de panier jusqu'à expire_le (voir customer.stock)."""
 
+    ligne = models.OneToOneField(ProduitPanier, related_name="reservation", on_delete=models.SET_NULL, null=True, blank=True)
+    produit = models.ForeignKey('shop.Produit', related_name="reservations", on_delete=models.CASCADE)
+    quantite = models.PositiveIntegerField()
+    expire_le = models.DateTimeField(db_index=True)
+    date_add = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Réservation'
+        verbose_name_plural = 'Réservations'
+
+    def __str__(self):
+        return '%s x %s' % (self.quantite, self.produit_id)
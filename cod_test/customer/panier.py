@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.utils.timezone import now
+
+from shop.models import Produit
+
+from . import models, stock
+from .stock import StockInsuffisant
+from .pricing import TOTAUX_VIDES, invalidate_memo
+from .utils import invalidate_cart_summary
+
+
+class OperationInvalide(Exception):
+    pass
+
+
+class CouponInvalide(OperationInvalide):
+    pass
+
+
+def _entier(valeur, nom):
+    try:
+        valeur = int(valeur)
+    except (TypeError, ValueError):
+        raise OperationInvalide('%s invalide : %r' % (nom, valeur))
+    if valeur < 0:
+        raise OperationInvalide('%s invalide : %r' % (nom, valeur))
+    return valeur
+
+
+def lire_operations(operations):
+    """Valide les opérations reçues : ({produit_id: quantité, 0 = retrait}, code coupon ou None).
+
+    Opérations : {"op": "quantite", "produit": id, "quantite": n}, {"op": "supprimer", "produit": id}
+    et {"op": "coupon", "code": "..."}. Pour un même produit, la dernière opération l'emporte.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise OperationInvalide('Aucune opération')
+    quantites, coupon = {}, None
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise OperationInvalide('Opération invalide : %r' % (operation,))
+        op = operation.get('op')
+        if op == 'quantite':
+            quantites[_entier(operation.get('produit'), 'produit')] = _entier(operation.get('quantite'), 'quantite')
+        elif op == 'supprimer':
+            quantites[_entier(operation.get('produit'), 'produit')] = 0
+        elif op == 'coupon' and operation.get('code'):
+            coupon = str(operation['code'])
+        else:
+            raise OperationInvalide('Opération invalide : %r' % (op,))
+    return quantites, coupon
+
+
+def appliquer(panier, quantites, coupon=None):
+    """Applique les changements de lignes et le coupon au panier, tout ou rien.
+
+    Une requête pour les produits, une pour les lignes existantes, puis un bulk_update
+    et un bulk_create ; les réservations de stock suivent (customer.stock.reserver_lignes).
+    OperationInvalide ou StockInsuffisant annulent l'ensemble.
+    """
+    with transaction.atomic():
+        if quantites:
+            connus = set(Produit.objects.filter(pk__in=quantites, status=True).values_list('pk', flat=True))
+            inconnus = set(quantites) - connus
+            if inconnus:
+                raise OperationInvalide('Produit introuvable : %s' % ', '.join(map(str, sorted(inconnus))))
+
+        if coupon is not None:
+            panier.coupon = models.CodePromotionnel.objects.filter(code_promo=coupon).order_by('-pk').first()
+            if panier.coupon is None:
+                raise CouponInvalide(coupon)
+            panier.save(update_fields=['coupon', 'date_update'])
+
+        lignes = models.ProduitPanier.objects.filter(panier=panier, produit_id__in=quantites)
+        existantes = {ligne.produit_id: ligne for ligne in lignes}
+        retirees = [existantes.pop(produit_id) for produit_id in list(existantes) if not quantites[produit_id]]
+        if retirees:
+            stock.liberer(retirees)
+            models.ProduitPanier.objects.filter(pk__in=[ligne.pk for ligne in retirees]).delete()
+
+        maintenant = now()
+        for ligne in existantes.values():
+            ligne.quantite, ligne.date_update = quantites[ligne.produit_id], maintenant
+        models.ProduitPanier.objects.bulk_update(existantes.values(), ['quantite', 'date_update'])
+        nouvelles = models.ProduitPanier.objects.bulk_create([
+            models.ProduitPanier(panier=panier, produit_id=produit_id, quantite=quantite)
+            for produit_id, quantite in quantites.items() if quantite and produit_id not in existantes
+        ])
+        if nouvelles and nouvelles[0].pk is None:
+            # Base sans RETURNING pour bulk_create : relire les identifiants
+            nouvelles = list(lignes.filter(produit_id__in=[ligne.produit_id for ligne in nouvelles]))
+
+        stock.reserver_lignes([*existantes.values(), *nouvelles])
+
+    # bulk_update et bulk_create n'envoient pas de signaux (voir customer.signals)
+    invalidate_memo()
+    invalidate_cart_summary(panier)
+
+
+def ajouter(panier, quantites, coupon=None):
+    """Ajoute `quantites` ({produit_id: n}) aux lignes du panier : versement du panier du cookie
+    à la connexion. Produits disparus ou en rupture sont écartés, un coupon inconnu ignoré."""
+    actifs = set(Produit.objects.filter(pk__in=quantites, status=True).values_list('pk', flat=True))
+    existantes = dict(
+        models.ProduitPanier.objects.filter(panier=panier, produit_id__in=actifs).values_list('produit_id', 'quantite'))
+    quantites = {
+        produit: quantite + existantes.get(produit, 0) for produit, quantite in quantites.items() if produit in actifs
+    }
+    while True:
+        try:
+            return appliquer(panier, quantites, coupon)
+        except StockInsuffisant as e:
+            # La ligne déjà au panier du client garde sa quantité
+            del quantites[e.produit_id]
+        except CouponInvalide:
+            coupon = None
+
+
+def fusionner(panier, anonyme):
+    """Verse le panier `anonyme` dans `panier` (celui du client, à la connexion), puis le supprime.
+
+    Les lignes d'un produit absent du panier du client y passent en un UPDATE, avec leurs
+    réservations ; les autres ajoutent leur quantité aux lignes du client (un bulk_update)
+    et leur réservation y est reportée. Le coupon anonyme ne remplace pas celui du client.
+    """
+    with transaction.atomic():
+        lignes = list(anonyme.produit_panier.all())
+        produits = [ligne.produit_id for ligne in lignes]
+        existantes = {
+            ligne.produit_id: ligne for ligne in models.ProduitPanier.objects.filter(panier=panier, produit_id__in=produits)
+        }
+        doublons = [ligne for ligne in lignes if ligne.produit_id in existantes]
+        deplacees = [ligne.pk for ligne in lignes if ligne.produit_id not in existantes]
+        if deplacees:
+            models.ProduitPanier.objects.filter(pk__in=deplacees).update(panier=panier)
+        if doublons:
+            for ligne in doublons:
+                existantes[ligne.produit_id].quantite += ligne.quantite
+            models.ProduitPanier.objects.bulk_update(existantes.values(), ['quantite'])
+            stock.liberer(doublons)
+            try:
+                stock.reserver_lignes(list(existantes.values()))
+            except StockInsuffisant:
+                # Réservations expirées entre-temps : le stock sera de toute façon vérifié à la commande
+                pass
+        if anonyme.coupon_id and not panier.coupon_id:
+            panier.coupon_id = anonyme.coupon_id
+            panier.save(update_fields=['coupon', 'date_update'])
+        anonyme.delete()
+    invalidate_memo()
+    invalidate_cart_summary(panier)
+    return panier
+
+
+def resume(panier):
+    """Résumé du panier renvoyé par l'API : lignes au prix effectif et totaux.
+
+    `panier` est un Panier (deux requêtes) ou un customer.panier_cookie.PanierCookie.
+    """
+    lignes, totaux = (list(panier.lignes), panier.totaux) if panier is not None else ([], TOTAUX_VIDES)
+    return {
+        'panier': panier.pk if panier is not None else None,
+        'lignes': [
+            {
+                'produit_panier': ligne.pk,
+                'produit': ligne.produit_id,
+                'nom': ligne.produit.nom,
+                'quantite': ligne.quantite,
+                'prix_unitaire': ligne.prix_unitaire,
+                'total': ligne.prix_unitaire * ligne.quantite,
+            }
+            for ligne in lignes
+        ],
+        'nombre_lignes': totaux.nombre_lignes,
+        'sous_total': totaux.sous_total,
+        'reduction': totaux.reduction,
+        'total': totaux.total,
+    }
@@ -0,0 +1,166 @@
+"""Panier des visiteurs anonymes gardé dans un cookie signé (CART_STORAGE = 'cookie').
+
+Le cookie contient les produits, leurs quantités et le code coupon ; rien n'est écrit en
+base avant la connexion, où le panier devient un Panier (enregistrer()). Les gabarits
+reçoivent un PanierCookie, qui expose les mêmes attributs que Panier ; l'identifiant
+d'une ligne y est celui de son produit.
+"""
+import logging
+
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from shop.models import Produit
+
+from . import models
+from .panier import CouponInvalide, OperationInvalide, ajouter
+from .pricing import Totaux
+from .stock import StockInsuffisant
+from .utils import get_or_create_cart
+
+logger = logging.getLogger(__name__)
+
+
+COOKIE_NAME = 'panier'
+COOKIE_SALT = 'customer.panier_cookie'
+COOKIE_AGE = 60 * 60 * 24 * 30
+
+# Un cookie dépasse 4 Ko vers 300 lignes : large marge
+MAX_LIGNES = 50
+
+
+def actif(request):
+    return getattr(settings, 'CART_STORAGE', 'database') == 'cookie' and not request.user.is_authenticated
+
+
+def lire(request):
+    """Contenu du cookie : ({produit_id: quantité}, code coupon ou None). Un cookie altéré ou expiré est ignoré."""
+    try:
+        donnees = signing.loads(request.COOKIES.get(COOKIE_NAME, ''), salt=COOKIE_SALT, max_age=COOKIE_AGE)
+        return {int(produit): int(quantite) for produit, quantite in donnees['l']}, donnees.get('c')
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return {}, None
+
+
+def ecrire(response, quantites, coupon=None):
+    if not quantites and not coupon:
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return
+    donnees = {'l': [[produit, quantite] for produit, quantite in quantites.items()]}
+    if coupon:
+        donnees['c'] = coupon
+    response.set_cookie(
+        COOKIE_NAME, signing.dumps(donnees, salt=COOKIE_SALT, compress=True), max_age=COOKIE_AGE,
+        secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+    )
+
+
+def modifier(request, quantites, coupon=None):
+    """Nouveau contenu du cookie après les changements `quantites` ({produit_id: quantité, 0 = retrait}).
+
+    Vérifie sans rien écrire que les produits existent et que leur stock libre suffit
+    (une requête), et que le coupon existe. Lève OperationInvalide, CouponInvalide ou StockInsuffisant.
+    """
+    actuelles, coupon_actuel = lire(request)
+    ajouts = {produit: quantite for produit, quantite in quantites.items() if quantite}
+    if ajouts:
+        disponibles = dict(Produit.objects.filter(pk__in=ajouts, status=True).values_list(
+            'pk', F('quantite') - F('quantite_reservee')))
+        for produit, quantite in ajouts.items():
+            if produit not in disponibles:
+                raise OperationInvalide('Produit introuvable : %s' % produit)
+            if disponibles[produit] is not None and disponibles[produit] < quantite:
+                raise StockInsuffisant(produit)
+    if coupon is not None and not models.CodePromotionnel.objects.filter(code_promo=coupon).exists():
+        raise CouponInvalide(coupon)
+
+    actuelles.update(quantites)
+    actuelles = {produit: quantite for produit, quantite in actuelles.items() if quantite}
+    if len(actuelles) > MAX_LIGNES:
+        raise OperationInvalide('Pas plus de %d produits par panier' % MAX_LIGNES)
+    return actuelles, coupon if coupon is not None else coupon_actuel
+
+
+def enregistrer(request, response):
+    """À la connexion ou à l'inscription : verse le panier du cookie dans celui du client
+    (customer.panier.ajouter) et efface le cookie.
+
+    Une erreur de base est journalisée sans interrompre la connexion ; le cookie est alors
+    gardé et versé à la connexion suivante.
+    """
+    quantites, coupon = lire(request)
+    if not quantites and not coupon:
+        return None
+    try:
+        with transaction.atomic():
+            panier = get_or_create_cart(request)
+            ajouter(panier, quantites, coupon)
+    except models.Customer.DoesNotExist:
+        panier = None
+    except DatabaseError:
+        logger.exception("Panier du cookie non enregistré pour l'utilisateur %s", request.user.pk)
+        return None
+    ecrire(response, {})
+    return panier
+
+
+def panier(request):
+    """PanierCookie de la requête, construit une seule fois."""
+    if not hasattr(request, '_panier_cookie'):
+        request._panier_cookie = PanierCookie(*lire(request))
+    return request._panier_cookie
+
+
+class PanierCookie:
+    """Panier lu dans le cookie : produits et prix en une requête, plus une pour le coupon."""
+
+    id = pk = 'cookie'
+
+    def __init__(self, quantites, code_coupon=None):
+        self.quantites, self.code_coupon = quantites, code_coupon
+        produits = Produit.objects.with_effective_price().filter(pk__in=self.quantites, status=True).order_by('pk')
+        self.lignes = []
+        for produit in produits:
+            ligne = models.ProduitPanier(produit=produit, quantite=self.quantites[produit.pk])
+            ligne.id = produit.pk
+            ligne.prix_unitaire = produit.prix_effectif
+            self.lignes.append(ligne)
+        self.coupon = None
+        if self.code_coupon:
+            self.coupon = models.CodePromotionnel.objects.filter(code_promo=self.code_coupon).order_by('-pk').first()
+
+    @property
+    def totaux(self):
+        # Mêmes arrondis que pricing.cart_totals
+        sous_total = int(sum(ligne.total for ligne in self.lignes))
+        reduction = (self.coupon.reduction if self.coupon else 0) * sous_total
+        return Totaux(len(self.lignes), sous_total, reduction, int(sous_total - reduction))
+
+    @property
+    def total(self):
+        return self.totaux.sous_total
+
+    @property
+    def total_with_coupon(self):
+        return self.totaux.total
+
+    @property
+    def check_empty(self):
+        return bool(self.lignes)
+
+    def mini_panier(self):
+        """Résumé du mini-panier, au format de customer.utils.get_cart_summary."""
+        lignes = [
+            {
+                'nom': ligne.produit.nom,
+                'image_url': ligne.produit.image.url if ligne.produit.image else '',
+                'prix': ligne.produit.prix,
+                'prix_promotionnel': ligne.produit.prix_promotionnel,
+                'promo': ligne.produit.is_promo,
+                'quantite': ligne.quantite,
+            }
+            for ligne in self.lignes
+        ]
+        return {'panier_id': None, 'count': len(lignes), 'lignes': lignes}
@@ -0,0 +1,83 @@
+import threading
+from collections import namedtuple
+
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
+
+from shop.models import prix_effectif_expression
+from . import models
+
+
+Totaux = namedtuple('Totaux', ['nombre_lignes', 'sous_total', 'reduction', 'total'])
+
+TOTAUX_VIDES = Totaux(0, 0, 0, 0)
+
+# Compteur des écritures de paniers faites par ce thread (voir customer.signals)
+_local = threading.local()
+
+
+def _ids(objets):
+    return [getattr(objet, 'pk', objet) for objet in objets]
+
+
+def _aggregate(queryset, lignes):
+    """Nombre de lignes et sous-total de chaque objet, calculés en une seule requête."""
+    prix = prix_effectif_expression(lignes + '__produit__')
+    return queryset.annotate(
+        nombre_lignes=Count(lignes),
+        sous_total=Coalesce(
+            Sum(F(lignes + '__quantite') * prix, output_field=FloatField()),
+            Value(0.0),
+        ),
+    )
+
+
+def cart_totals(paniers):
+    """Totaux de plusieurs paniers : {id du panier: Totaux}.
+
+    Le coupon éventuel est appliqué sur le sous-total, comme le faisait
+    Panier.total_with_coupon.
+    """
+    rows = _aggregate(models.Panier.objects.filter(pk__in=_ids(paniers)), 'produit_panier') \
+        .values_list('pk', 'nombre_lignes', 'sous_total', 'coupon__reduction')
+
+    totaux = {}
+    for pk, nombre_lignes, sous_total, taux in rows:
+        sous_total = int(sous_total)
+        reduction = (taux or 0) * sous_total
+        totaux[pk] = Totaux(nombre_lignes, sous_total, reduction, int(sous_total - reduction))
+    return totaux
+
+
+def order_totals(commandes):
+    """Totaux des lignes de plusieurs commandes au prix du jour : {id de la commande: Totaux}.
+
+    Le montant effectivement payé reste Commande.prix_total.
+    """
+    rows = _aggregate(models.Commande.objects.filter(pk__in=_ids(commandes)), 'produit_commande') \
+        .values_list('pk', 'nombre_lignes', 'sous_total')
+    return {
+        pk: Totaux(nombre_lignes, int(sous_total), 0, int(sous_total))
+        for pk, nombre_lignes, sous_total in rows
+    }
+
+
+def _generation():
+    return getattr(_local, 'generation', 0)
+
+
+def invalidate_memo():
+    _local.generation = _generation() + 1
+
+
+def panier_totaux(panier):
+    """Totaux d'un panier, mémorisés sur l'instance jusqu'à la prochaine écriture de panier.
+
+    Un template qui lit plusieurs fois cart.total et cart.total_with_coupon
+    ne déclenche donc qu'une seule requête.
+    """
+    memo = getattr(panier, '_totaux', None)
+    if memo is None or memo[0] != _generation():
+        memo = (_generation(), cart_totals([panier]).get(panier.pk, TOTAUX_VIDES))
+        panier._totaux = memo
+    return memo[1]
@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models
+from .pricing import invalidate_memo
+from .utils import invalidate_cart_summary
+
+
+@receiver([post_save, post_delete], sender=models.Panier)
+def panier_changed(sender, instance, **kwargs):
+    invalidate_memo()
+    invalidate_cart_summary(instance)
+
+
+@receiver([post_save, post_delete], sender=models.ProduitPanier)
+def produit_panier_changed(sender, instance, **kwargs):
+    invalidate_memo()
+    if not instance.panier_id:
+        return
+    if models.ProduitPanier.panier.is_cached(instance):
+        panier = instance.panier
+    else:
+        # Ligne chargée sans son panier : une seule requête pour la session et l'utilisateur
+        panier = (
+            models.Panier.objects.filter(pk=instance.panier_id).select_related('customer')
+            .only('session_id', 'customer', 'customer__user_id').first()
+        )
+    if panier is not None:
+        invalidate_cart_summary(panier)
+
+
+@receiver(post_save, sender=models.Commande)
+def commande_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Le statut est recopié dans les sous-commandes, filtrées par statut côté commerçant
+    if created or raw or (update_fields is not None and 'status' not in update_fields):
+        return
+    models.SousCommande.objects.filter(commande=instance).exclude(status=instance.status).update(status=instance.status)
@@ -0,0 +1,156 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils.timezone import now
+
+from shop.models import Produit
+from . import models
+
+
+class StockInsuffisant(Exception):
+
+    def __init__(self, produit_id):
+        super().__init__(produit_id)
+        self.produit_id = produit_id
+
+
+def _ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL', 15))
+
+
+def _ajuster_reserve(quantites):
+    """Retire du compteur de réservations de chaque produit les unités libérées : {produit_id: n}."""
+    for produit_id, quantite in quantites.items():
+        if quantite:
+            Produit.objects.filter(pk=produit_id).update(quantite_reservee=F('quantite_reservee') - quantite)
+
+
+def _retenir(produit_id, ecart):
+    """Ajoute `ecart` unités (éventuellement négatif) au compteur de réservations du produit.
+
+    Une hausse n'a lieu que si le stock libre suffit (UPDATE conditionnel) ; sinon
+    StockInsuffisant. Renvoie False pour un produit sans quantite (stock illimité).
+    """
+    if ecart > 0:
+        retenu = Produit.objects.filter(
+            pk=produit_id, quantite__gte=F('quantite_reservee') + ecart,
+        ).update(quantite_reservee=F('quantite_reservee') + ecart)
+        if not retenu:
+            if Produit.objects.filter(pk=produit_id, quantite__isnull=True).exists():
+                return False
+            raise StockInsuffisant(produit_id)
+    elif ecart < 0:
+        _ajuster_reserve({produit_id: -ecart})
+    return True
+
+
+def reserver(ligne, quantite):
+    """Retient `quantite` unités du produit pour la ligne de panier, pour STOCK_RESERVATION_TTL minutes.
+
+    La réservation existante de la ligne est ajustée et prolongée. Le compteur du produit
+    n'augmente que si le stock libre suffit (UPDATE conditionnel) ; sinon StockInsuffisant.
+    Un produit sans quantite (stock illimité) n'est pas réservé : renvoie None.
+    """
+    with transaction.atomic():
+        reservation = models.Reservation.objects.select_for_update().filter(ligne=ligne).first()
+        ecart = quantite - (reservation.quantite if reservation else 0)
+        if not _retenir(ligne.produit_id, ecart):
+            return None
+
+        expire_le = now() + _ttl()
+        if reservation is None:
+            return models.Reservation.objects.create(
+                ligne=ligne, produit_id=ligne.produit_id, quantite=quantite, expire_le=expire_le)
+        reservation.quantite = quantite
+        reservation.expire_le = expire_le
+        reservation.save(update_fields=['quantite', 'expire_le'])
+        return reservation
+
+
+def reserver_lignes(lignes):
+    """reserver() pour plusieurs lignes de panier, à leur quantite : une requête pour les
+    réservations existantes, un UPDATE conditionnel par produit, puis un bulk_create et un
+    bulk_update. StockInsuffisant annule l'ensemble.
+    """
+    with transaction.atomic():
+        reservations = {
+            reservation.ligne_id: reservation
+            for reservation in models.Reservation.objects.select_for_update().filter(ligne__in=lignes)
+        }
+        expire_le = now() + _ttl()
+        nouvelles, modifiees = [], []
+        for ligne in sorted(lignes, key=lambda ligne: ligne.produit_id):
+            reservation = reservations.get(ligne.pk)
+            if not _retenir(ligne.produit_id, ligne.quantite - (reservation.quantite if reservation else 0)):
+                continue
+            if reservation is None:
+                nouvelles.append(models.Reservation(
+                    ligne=ligne, produit_id=ligne.produit_id, quantite=ligne.quantite, expire_le=expire_le))
+            else:
+                reservation.quantite, reservation.expire_le = ligne.quantite, expire_le
+                modifiees.append(reservation)
+        models.Reservation.objects.bulk_create(nouvelles)
+        models.Reservation.objects.bulk_update(modifiees, ['quantite', 'expire_le'])
+
+
+def _liberer(reservations):
+    """Supprime les réservations (verrouillées) et rend leurs unités ; renvoie leur nombre."""
+    lignes = list(reservations.select_for_update().values_list('pk', 'produit_id', 'quantite'))
+    if not lignes:
+        return 0
+    quantites = defaultdict(int)
+    for _, produit_id, quantite in lignes:
+        quantites[produit_id] += quantite
+    models.Reservation.objects.filter(pk__in=[pk for pk, _, _ in lignes]).delete()
+    _ajuster_reserve(quantites)
+    return len(lignes)
+
+
+def liberer(lignes):
+    """Rend les unités retenues pour ces lignes de panier (ligne supprimée, panier abandonné)."""
+    with transaction.atomic():
+        return _liberer(models.Reservation.objects.filter(ligne__in=lignes))
+
+
+def liberer_expirees(taille=1000):
+    """Rend les unités des réservations expirées, par lots : un UPDATE par produit et par lot."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(models.Reservation.objects.filter(expire_le__lte=now())
+                       .order_by('expire_le').values_list('pk', flat=True)[:taille])
+            liberees = _liberer(models.Reservation.objects.filter(pk__in=ids)) if ids else 0
+        total += liberees
+        if len(ids) < taille:
+            return total
+
+
+def decrementer(panier):
+    """Sort du stock les produits du panier, à appeler dans la transaction de la commande.
+
+    Chaque produit est décrémenté par un UPDATE conditionnel (quantite >= demandé, sans
+    compter les unités retenues par d'autres paniers) : pas de lecture puis écriture, donc
+    pas de survente. Les réservations du panier sont consommées. StockInsuffisant si un
+    produit manque ; la transaction appelante doit alors être annulée.
+    """
+    demandes = models.ProduitPanier.objects.filter(panier=panier).values('produit_id').annotate(n=Sum('quantite'))
+    reservations = models.Reservation.objects.filter(ligne__panier=panier)
+    # Verrouillées : le balayeur ne peut pas les rendre pendant qu'on les consomme
+    retenues = defaultdict(int)
+    for produit_id, quantite in reservations.select_for_update().values_list('produit_id', 'quantite'):
+        retenues[produit_id] += quantite
+
+    for demande in demandes.order_by('produit_id'):
+        produit_id, quantite = demande['produit_id'], demande['n']
+        retenue = retenues.get(produit_id, 0)
+        sorti = Produit.objects.filter(
+            Q(quantite__isnull=True) | Q(quantite__gte=F('quantite_reservee') - retenue + quantite),
+            pk=produit_id,
+        ).update(quantite=F('quantite') - quantite, quantite_reservee=F('quantite_reservee') - retenue)
+        if not sorti:
+            raise StockInsuffisant(produit_id)
+    if retenues:
+        reservations.delete()
@@ -1,4 +1,14 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.test import Client
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -6,13 +16,21 @@ from django.utils.timezone import now
 from datetime import timedelta
 from unittest.mock import patch, MagicMock
 import json
+from django.core import mail
+from django.core.cache import cache
+
+from base.models import EmailSortant
 
+from customer import checkout, panier_cookie, pricing, stock
+from customer.utils import _cart_summary_key, get_cart
 from customer.models import (
+    Commande,
     Customer,
     PasswordResetToken,
     Panier,
     CodePromotionnel,
     ProduitPanier,
+    Reservation,
 )
 from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -113,12 +131,374 @@ class CustomerModelsTests(TestCase):
         pp = ProduitPanier.objects.create(produit=produit, panier=panier, quantite=3)
         self.assertEqual(pp.total, 180)
 
+    def test_cart_line_change_invalidates_summary_without_loading_the_cart(self):
+        user = User.objects.create_user(username="resume", password="p")
+        customer = Customer.objects.create(user=user)
+        panier = Panier.objects.create(customer=Customer.objects.select_related("user").get(pk=customer.pk))
+        etab, cat_prod = _make_etablissement_with_product_owner(User.objects.create_user(username="seller3", password="p"))
+        produit = Produit.objects.create(nom="P3", description="d", prix=100, categorie=cat_prod, etablissement=etab)
+        cle = _cart_summary_key(user_id=user.pk)
+
+        # Panier en cache sur la ligne : seul l'INSERT
+        cache.set(cle, "ancien")
+        with self.assertNumQueries(1):
+            ligne = ProduitPanier.objects.create(produit=produit, panier=panier)
+        self.assertIsNone(cache.get(cle))
+
+        # Ligne chargée seule : réservations détachées, DELETE, une requête pour le panier et l'utilisateur
+        cache.set(cle, "ancien")
+        ligne = ProduitPanier.objects.get(pk=ligne.pk)
+        with self.assertNumQueries(3):
+            ligne.delete()
+        self.assertIsNone(cache.get(cle))
+
     def test_customer_str(self):
         user = User.objects.create_user(username="cust1", password="p")
         customer = Customer.objects.create(user=user)
         self.assertEqual(str(customer), "cust1")
 
 
+class CustomerPricingTests(TestCase):
+    def setUp(self):
+        etab_user = User.objects.create_user(username="seller_px", password="pass", email="seller_px@example.com")
+        etab, cat_prod = _make_etablissement_with_product_owner(etab_user)
+        self.produit = Produit.objects.create(
+            nom="Normal", description="d", description_deal="dd", prix=100, prix_promotionnel=70,
+            categorie=cat_prod, etablissement=etab,
+        )
+        self.promo = Produit.objects.create(
+            nom="Promo", description="d", description_deal="dd", prix=100, prix_promotionnel=60,
+            categorie=cat_prod, etablissement=etab,
+            date_debut_promo=(now().date() - timedelta(days=1)),
+            date_fin_promo=(now().date() + timedelta(days=1)),
+        )
+        self.coupon = CodePromotionnel.objects.create(
+            libelle="c", etat=True, date_fin=(now().date() + timedelta(days=10)),
+            reduction=0.25, code_promo="QUART",
+        )
+
+    def test_cart_totals_for_many_carts_in_one_query(self):
+        p1 = Panier.objects.create()
+        ProduitPanier.objects.create(produit=self.produit, panier=p1, quantite=2)
+        ProduitPanier.objects.create(produit=self.promo, panier=p1, quantite=3)
+        p2 = Panier.objects.create(coupon=self.coupon)
+        ProduitPanier.objects.create(produit=self.promo, panier=p2, quantite=2)
+        vide = Panier.objects.create()
+
+        with self.assertNumQueries(1):
+            totaux = pricing.cart_totals([p1, p2.id, vide])
+
+        self.assertEqual(totaux[p1.id], pricing.Totaux(2, 380, 0, 380))
+        self.assertEqual(totaux[p2.id], pricing.Totaux(1, 120, 30.0, 90))
+        self.assertEqual(totaux[vide.id], pricing.Totaux(0, 0, 0, 0))
+
+    def test_cart_totals_match_python_line_totals(self):
+        panier = Panier.objects.create(coupon=self.coupon)
+        lignes = [
+            ProduitPanier.objects.create(produit=self.produit, panier=panier, quantite=1),
+            ProduitPanier.objects.create(produit=self.promo, panier=panier, quantite=4),
+        ]
+        sous_total = int(sum(ligne.total for ligne in lignes))
+        self.assertEqual(panier.total, sous_total)
+        self.assertEqual(panier.total_with_coupon, int(sous_total - 0.25 * sous_total))
+
+    def test_panier_totals_are_memoized_until_cart_changes(self):
+        panier = Panier.objects.create()
+        ProduitPanier.objects.create(produit=self.produit, panier=panier, quantite=1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(panier.total, 100)
+            self.assertEqual(panier.total_with_coupon, 100)
+            self.assertTrue(panier.check_empty)
+
+        ProduitPanier.objects.create(produit=self.promo, panier=panier, quantite=1)
+        self.assertEqual(panier.total, 160)
+
+    def test_lignes_annotate_effective_unit_price(self):
+        panier = Panier.objects.create()
+        ProduitPanier.objects.create(produit=self.produit, panier=panier, quantite=2)
+        ProduitPanier.objects.create(produit=self.promo, panier=panier, quantite=2)
+
+        with self.assertNumQueries(1):
+            totals = [(ligne.produit.nom, ligne.total) for ligne in panier.lignes]
+        self.assertEqual(totals, [("Normal", 200), ("Promo", 120)])
+
+    def test_order_totals(self):
+        commande = Commande.objects.create(prix_total=150)
+        ProduitPanier.objects.create(produit=self.produit, commande=commande, quantite=1)
+        ProduitPanier.objects.create(produit=self.promo, commande=commande, quantite=1)
+
+        with self.assertNumQueries(1):
+            totaux = pricing.order_totals([commande])
+        self.assertEqual(totaux[commande.id].total, 160)
+
+
+def _panier_rempli(username, lignes=3):
+    user = User.objects.create_user(username=username, password="pass", first_name="F", last_name="L")
+    customer = Customer.objects.create(user=user, adresse="addr", contact_1="01020304")
+    cat_etab = CategorieEtablissement.objects.create(nom="CatE", description="d")
+    cat_prod = CategorieProduit.objects.create(nom="CatP", description="d", categorie=cat_etab)
+    etab = Etablissement.objects.create(
+        user=user, nom="Etab", description="d", categorie=cat_etab,
+        adresse="addr", pays="CI", contact_1="01020304", email="etab@example.com",
+        nom_du_responsable="L", prenoms_duresponsable="F",
+    )
+    panier = Panier.objects.create(customer=customer)
+    for i in range(lignes):
+        produit = Produit.objects.create(nom="P%d" % i, description="d", prix=100, categorie=cat_prod, etablissement=etab)
+        ProduitPanier.objects.create(produit=produit, panier=panier, quantite=2)
+    return customer, panier
+
+
+class CustomerCheckoutTests(TestCase):
+    def setUp(self):
+        self.customer, self.panier = _panier_rempli("acheteur")
+
+    def test_checkout_moves_lines_in_one_transaction(self):
+        # Dont un UPDATE conditionnel de stock par produit, la sous-commande et le cumul des ventes
+        with self.assertNumQueries(20):
+            commande, creee = checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertTrue(creee)
+        self.assertEqual(commande.prix_total, 600)
+        self.assertEqual(commande.produit_commande.count(), 3)
+        self.assertFalse(ProduitPanier.objects.filter(panier__isnull=False).exists())
+        self.assertFalse(Panier.objects.filter(pk=self.panier.pk).exists())
+
+    def test_replayed_transaction_returns_the_same_order(self):
+        commande, _ = checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        rejouee, creee = checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertFalse(creee)
+        self.assertEqual(rejouee, commande)
+        self.assertEqual(Commande.objects.count(), 1)
+
+    def test_transaction_id_of_another_customer_is_refused(self):
+        checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        autre, panier = _panier_rempli("autre")
+        with self.assertRaises(checkout.TransactionDejaUtilisee):
+            checkout.passer_commande(autre, panier.id, "trx-1")
+        self.assertTrue(Panier.objects.filter(pk=panier.pk).exists())
+
+    def test_empty_cart_is_refused(self):
+        ProduitPanier.objects.all().delete()
+        with self.assertRaises(checkout.PanierVide):
+            checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertFalse(Commande.objects.exists())
+
+    def test_failure_rolls_back_the_order(self):
+        with patch.object(Panier, "delete", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(ProduitPanier.objects.filter(panier=self.panier).count(), 3)
+
+    def test_view_is_idempotent(self):
+        self.client.login(username="acheteur", password="pass")
+        payload = json.dumps({
+            "transaction_id": "trx-1", "notify_url": "http://example.com/n",
+            "return_url": "http://example.com/r", "panier": self.panier.id,
+        })
+        for _ in range(2):
+            resp = self.client.post(reverse("paiement_detail"), data=payload, content_type="application/json")
+            self.assertTrue(resp.json()["success"])
+        self.assertEqual(Commande.objects.count(), 1)
+
+
+class CustomerStockTests(TestCase):
+    def setUp(self):
+        self.customer, self.panier = _panier_rempli("acheteur", lignes=1)
+        self.ligne = ProduitPanier.objects.get()
+        self.produit = self.ligne.produit
+        Produit.objects.filter(pk=self.produit.pk).update(quantite=5)
+
+    def _produit(self):
+        return Produit.objects.values_list("quantite", "quantite_reservee").get(pk=self.produit.pk)
+
+    def test_reservation_holds_free_stock_only(self):
+        stock.reserver(self.ligne, 4)
+        self.assertEqual(self._produit(), (5, 4))
+        autre, panier = _panier_rempli("autre", lignes=0)
+        ligne = ProduitPanier.objects.create(panier=panier, produit=self.produit, quantite=2)
+        with self.assertRaises(stock.StockInsuffisant):
+            stock.reserver(ligne, 2)
+        self.assertEqual(self._produit(), (5, 4))
+
+    def test_reservation_is_adjusted_and_extended(self):
+        premiere = stock.reserver(self.ligne, 4)
+        with patch("customer.stock.now", return_value=now() + timedelta(minutes=5)):
+            seconde = stock.reserver(self.ligne, 1)
+        self.assertEqual(seconde.pk, premiere.pk)
+        self.assertGreater(seconde.expire_le, premiere.expire_le)
+        self.assertEqual(self._produit(), (5, 1))
+
+    def test_unlimited_product_is_not_reserved(self):
+        Produit.objects.filter(pk=self.produit.pk).update(quantite=None)
+        self.assertIsNone(stock.reserver(self.ligne, 100))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_sweeper_releases_expired_reservations_in_bulk(self):
+        stock.reserver(self.ligne, 2)
+        autre, panier = _panier_rempli("autre", lignes=0)
+        stock.reserver(ProduitPanier.objects.create(panier=panier, produit=self.produit, quantite=3), 3)
+        Reservation.objects.update(expire_le=now() - timedelta(seconds=1))
+        # Savepoint, ids, verrouillage, suppression, un seul UPDATE pour le produit, fin du savepoint
+        with self.assertNumQueries(6):
+            self.assertEqual(stock.liberer_expirees(), 2)
+        self.assertEqual(self._produit(), (5, 0))
+        self.assertEqual(stock.liberer_expirees(), 0)
+
+    def test_checkout_consumes_reservation_and_decrements(self):
+        stock.reserver(self.ligne, 2)
+        checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertEqual(self._produit(), (3, 0))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_checkout_without_enough_stock_is_rolled_back(self):
+        autre, panier = _panier_rempli("autre", lignes=0)
+        stock.reserver(ProduitPanier.objects.create(panier=panier, produit=self.produit, quantite=4), 4)
+        # Expirée mais pas encore balayée : les unités restent retenues pour l'autre panier
+        Reservation.objects.update(expire_le=now() - timedelta(seconds=1))
+        with self.assertRaises(stock.StockInsuffisant):
+            checkout.passer_commande(self.customer, self.panier.id, "trx-1")
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(self._produit(), (5, 4))
+
+    def test_cart_views_reserve_and_release(self):
+        self.client.login(username="acheteur", password="pass")
+        payload = {"panier": self.panier.id, "produit": self.produit.id, "quantite": 6}
+        resp = self.client.post(reverse("update_cart"), data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(resp.json(), {"message": "Stock insuffisant", "success": False})
+        self.assertEqual(ProduitPanier.objects.get().quantite, 2)
+
+        payload["quantite"] = 5
+        resp = self.client.post(reverse("update_cart"), data=json.dumps(payload), content_type="application/json")
+        self.assertTrue(resp.json()["success"])
+        self.assertEqual(self._produit(), (5, 5))
+
+        payload = {"panier": self.panier.id, "produit_panier": self.ligne.id}
+        self.client.post(reverse("delete_from_cart"), data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(self._produit(), (5, 0))
+
+
+class CustomerCheckoutConcurrencyTests(TransactionTestCase):
+    PARALLELE = 8
+
+    def setUp(self):
+        # Hors transaction, les rendus d'images sont produits : pas dans le vrai media/
+        media = tempfile.mkdtemp(prefix="cooldeal-media-")
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        # Image par défaut des produits
+        shutil.copy(os.path.join(settings.MEDIA_ROOT, "b-1.jpg"), media)
+        reglage = override_settings(MEDIA_ROOT=media)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+
+    def _en_parallele(self, transaction_ids):
+        customer, panier = _panier_rempli("acheteur")
+        depart = threading.Barrier(len(transaction_ids))
+        resultats, erreurs = [], []
+
+        def valider(transaction_id):
+            try:
+                depart.wait()
+                resultats.append(checkout.passer_commande(customer, panier.id, transaction_id, tentatives=20))
+            except Exception as erreur:
+                erreurs.append(erreur)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=valider, args=(t,)) for t in transaction_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultats, erreurs
+
+    def test_parallel_retries_create_a_single_order(self):
+        resultats, erreurs = self._en_parallele(["trx-1"] * self.PARALLELE)
+        self.assertEqual(erreurs, [])
+        self.assertEqual(Commande.objects.count(), 1)
+        commande = Commande.objects.get()
+        self.assertEqual({c.pk for c, _ in resultats}, {commande.pk})
+        self.assertEqual(sum(creee for _, creee in resultats), 1)
+        self.assertEqual(commande.produit_commande.count(), 3)
+        self.assertEqual(commande.prix_total, 600)
+
+    def test_parallel_buyers_never_oversell_a_hot_product(self):
+        vendeur, panier = _panier_rempli("vendeur", lignes=1)
+        produit = ProduitPanier.objects.get().produit
+        Produit.objects.filter(pk=produit.pk).update(quantite=3)
+        acheteurs = []
+        for i in range(self.PARALLELE):
+            customer = Customer.objects.create(user=User.objects.create_user(
+                username="acheteur-%d" % i, first_name="F", last_name="L"))
+            panier = Panier.objects.create(customer=customer)
+            ProduitPanier.objects.create(panier=panier, produit=produit, quantite=1)
+            acheteurs.append((customer, panier))
+        depart = threading.Barrier(self.PARALLELE)
+        vendus, ruptures = [], []
+
+        def acheter(customer, panier):
+            try:
+                depart.wait()
+                checkout.passer_commande(customer, panier.id, "trx-%d" % panier.id, tentatives=20)
+                vendus.append(panier.id)
+            except stock.StockInsuffisant:
+                ruptures.append(panier.id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=acheter, args=a) for a in acheteurs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(vendus), len(ruptures)), (3, self.PARALLELE - 3))
+        self.assertEqual(Produit.objects.get(pk=produit.pk).quantite, 0)
+
+    def test_parallel_checkouts_of_one_cart_create_a_single_order(self):
+        resultats, erreurs = self._en_parallele(["trx-%d" % i for i in range(self.PARALLELE)])
+        self.assertEqual(len(resultats), 1)
+        self.assertTrue(all(isinstance(erreur, checkout.PanierIntrouvable) for erreur in erreurs), erreurs)
+        self.assertEqual(Commande.objects.count(), 1)
+        self.assertEqual(ProduitPanier.objects.filter(commande__isnull=False).count(), 3)
+
+    def test_stress_worker_reuses_the_customer_cart_after_a_stock_out(self):
+        customer, panier = _panier_rempli("stress", lignes=1)
+        produit = panier.produit_panier.get().produit
+        Produit.objects.filter(pk=produit.pk).update(quantite=2)
+        panier.delete()
+        resultats = import_module("customer.management.commands.stress_stock")._acheter((customer.pk, produit.pk, 4, True))
+        self.assertEqual(resultats, {"vendus": 2, "rupture": 2, "erreurs": 0})
+        self.assertEqual(Panier.objects.filter(customer=customer).count(), 1)
+
+
+class CustomerTransactionIdMigrationTests(TransactionTestCase):
+    def test_duplicate_transaction_ids_are_renamed_before_the_constraint(self):
+        # Base d'avant la migration : sans la contrainte, rétablie à la fin
+        contrainte = next(c for c in Commande._meta.constraints if c.name == "commande_transaction_id_unique")
+        # SQLite reconstruit la table d'après Meta.constraints : la contrainte doit en être retirée
+        autres = [c for c in Commande._meta.constraints if c is not contrainte]
+        with patch.object(Commande._meta, "constraints", autres), connection.schema_editor() as editor:
+            editor.remove_constraint(Commande, contrainte)
+
+        def retablir():
+            Commande.objects.all().delete()
+            with connection.schema_editor() as editor:
+                editor.add_constraint(Commande, contrainte)
+        self.addCleanup(retablir)
+
+        customer, _ = _panier_rempli("doublon", lignes=0)
+        _, seconde, troisieme = [
+            Commande.objects.create(customer=customer, transaction_id="trx-1", prix_total=0) for _ in range(3)]
+        sans_id = [Commande.objects.create(customer=customer, transaction_id=None, prix_total=0) for _ in range(2)]
+
+        import_module("customer.migrations.0009_commande_transaction_id_unique").renommer_doublons(apps, None)
+        self.assertEqual(
+            list(Commande.objects.exclude(pk__in=[c.pk for c in sans_id]).order_by("pk").values_list("transaction_id", flat=True)),
+            ["trx-1", "trx-1-doublon-%d" % seconde.pk, "trx-1-doublon-%d" % troisieme.pk])
+        self.assertEqual(Commande.objects.filter(transaction_id__isnull=True).count(), 2)
+
+
 class CustomerInscriptionTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -278,6 +658,25 @@ class CustomerCartCRUDTests(TestCase):
         pp = ProduitPanier.objects.get(panier=panier, produit=self.produit)
         self.assertEqual(pp.quantite, 2)
         
+    def test_add_to_cart_without_panier_creates_cart_on_first_mutation(self):
+        # Visiteur anonyme : aucun panier n'existe avant le premier ajout
+        self.assertEqual(Panier.objects.count(), 0)
+
+        url = reverse("add_to_cart")
+        payload = {"panier": "", "produit": self.produit.id, "quantite": 3}
+        resp = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+
+        self.assertTrue(resp.json()["success"])
+        panier = Panier.objects.get()
+        self.assertEqual(panier.session_id_id, self.client.session.session_key)
+        self.assertIsNone(panier.customer)
+        self.assertEqual(ProduitPanier.objects.get(panier=panier).quantite, 3)
+
+        # Un second ajout réutilise le même panier
+        resp = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertTrue(resp.json()["success"])
+        self.assertEqual(Panier.objects.count(), 1)
+
     def test_update_cart_modifies_quantity(self):
         self.client.login(username="cartuser", password="pass")
         
@@ -342,12 +741,231 @@ class CustomerCartCRUDTests(TestCase):
         self.assertEqual(panier.coupon.code_promo, "TEST20")
 
 
+class CustomerBatchCartTests(TestCase):
+    def setUp(self):
+        etab_user = User.objects.create_user(username="seller_batch", password="pass", email="batch@example.com")
+        etab, cat_prod = _make_etablissement_with_product_owner(etab_user)
+        self.produits = [
+            Produit.objects.create(
+                nom="Prod %d" % i, description="d", description_deal="dd", prix=100 * (i + 1),
+                categorie=cat_prod, etablissement=etab, quantite=10,
+            )
+            for i in range(3)
+        ]
+        self.coupon = CodePromotionnel.objects.create(
+            libelle="Promo", etat=True, date_fin=now().date(), reduction=0.1, code_promo="PROMO10")
+
+    def _batch(self, *operations):
+        return self.client.post(reverse("batch_cart"), json.dumps({"operations": list(operations)}),
+                                content_type="application/json")
+
+    def test_operations_are_applied_together_and_summary_returned(self):
+        a, b, c = self.produits
+        self._batch(
+            {"op": "quantite", "produit": a.pk, "quantite": 1}, {"op": "quantite", "produit": b.pk, "quantite": 1})
+
+        resp = self._batch(
+            {"op": "quantite", "produit": a.pk, "quantite": 3},
+            {"op": "supprimer", "produit": b.pk},
+            {"op": "quantite", "produit": c.pk, "quantite": 2},
+            {"op": "coupon", "code": "PROMO10"},
+        )
+        data = resp.json()
+        self.assertTrue(data["success"])
+        panier = Panier.objects.get()
+        self.assertEqual(panier.coupon, self.coupon)
+        self.assertEqual(
+            dict(ProduitPanier.objects.filter(panier=panier).values_list("produit_id", "quantite")),
+            {a.pk: 3, c.pk: 2},
+        )
+        self.assertEqual(data["panier"]["panier"], panier.pk)
+        self.assertEqual([l["quantite"] for l in data["panier"]["lignes"]], [3, 2])
+        self.assertEqual(data["panier"]["sous_total"], 900)
+        self.assertEqual(data["panier"]["total"], 810)
+        # Réservations ajustées, celle de la ligne retirée rendue
+        self.assertEqual(dict(Reservation.objects.values_list("produit_id", "quantite")), {a.pk: 3, c.pk: 2})
+        b.refresh_from_db()
+        self.assertEqual(b.quantite_reservee, 0)
+
+    def test_failure_rolls_back_every_operation(self):
+        a, b, _ = self.produits
+        self._batch({"op": "quantite", "produit": a.pk, "quantite": 1})
+
+        resp = self._batch(
+            {"op": "quantite", "produit": a.pk, "quantite": 5}, {"op": "quantite", "produit": b.pk, "quantite": 11})
+        self.assertEqual(resp.status_code, 409)
+        self.assertFalse(resp.json()["success"])
+        self.assertEqual([l["quantite"] for l in resp.json()["panier"]["lignes"]], [1])
+        self.assertEqual(list(ProduitPanier.objects.values_list("produit_id", "quantite")), [(a.pk, 1)])
+
+        resp = self._batch({"op": "supprimer", "produit": a.pk}, {"op": "coupon", "code": "INCONNU"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(ProduitPanier.objects.count(), 1)
+        self.assertIsNone(Panier.objects.get().coupon)
+
+    def test_invalid_payloads(self):
+        self.assertEqual(self._batch().status_code, 400)
+        self.assertEqual(self._batch({"op": "vider"}).status_code, 400)
+        negative = {"op": "quantite", "produit": self.produits[0].pk, "quantite": -1}
+        self.assertEqual(self._batch(negative).status_code, 400)
+        self.assertEqual(self._batch({"op": "quantite", "produit": 999999, "quantite": 1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("batch_cart")).status_code, 405)
+        # Aucun panier créé par une requête refusée
+        self.assertEqual(Panier.objects.count(), 1)
+
+
+@override_settings(CART_STORAGE="cookie")
+class CustomerCookieCartTests(TestCase):
+    def setUp(self):
+        etab_user = User.objects.create_user(username="seller_cookie", password="pass", email="cookie@example.com")
+        etab, cat_prod = _make_etablissement_with_product_owner(etab_user)
+        self.produit, self.autre = [
+            Produit.objects.create(
+                nom=nom, description="d", description_deal="dd", prix=prix,
+                categorie=cat_prod, etablissement=etab, quantite=5,
+            )
+            for nom, prix in (("Cookie A", 100), ("Cookie B", 250))
+        ]
+        CodePromotionnel.objects.create(
+            libelle="Promo", etat=True, date_fin=now().date(), reduction=0.5, code_promo="MOITIE")
+
+    def _post(self, nom, donnees):
+        return self.client.post(reverse(nom), json.dumps(donnees), content_type="application/json")
+
+    def test_anonymous_cart_lives_in_the_cookie_without_writes(self):
+        with CaptureQueriesContext(connection) as requetes:
+            ajout = self._post("add_to_cart", {"panier": "", "produit": self.produit.pk, "quantite": 2})
+            resp = self._post("batch_cart", {"operations": [
+                {"op": "quantite", "produit": self.autre.pk, "quantite": 1}, {"op": "coupon", "code": "MOITIE"},
+            ]})
+        self.assertTrue(ajout.json()["success"])
+        self.assertTrue(all(q["sql"].startswith("SELECT") for q in requetes.captured_queries))
+        self.assertEqual(Panier.objects.count(), 0)
+        self.assertEqual(resp.json()["panier"]["total"], 225)
+        self.assertIn(panier_cookie.COOKIE_NAME, self.client.cookies)
+
+        mini = self.client.get(reverse("mini_panier"))
+        self.assertContains(mini, "Cookie A")
+        self.assertContains(mini, "Quantité : 2")
+        page = self.client.get(reverse("cart"))
+        self.assertContains(page, "Cookie B")
+        self.assertContains(page, "remove_from_cart(%d)" % self.produit.pk)
+
+        retrait = self._post("delete_from_cart", {"panier": "cookie", "produit_panier": self.produit.pk})
+        self.assertTrue(retrait.json()["success"])
+        coupon = self._post("batch_cart", {"operations": [{"op": "coupon", "code": "MOITIE"}]})
+        lignes = coupon.json()["panier"]["lignes"]
+        self.assertEqual([ligne["produit"] for ligne in lignes], [self.autre.pk])
+
+    def test_stock_and_tampering_are_checked(self):
+        resp = self._post("add_to_cart", {"panier": "", "produit": self.produit.pk, "quantite": 6})
+        self.assertFalse(resp.json()["success"])
+        self.assertNotIn(panier_cookie.COOKIE_NAME, self.client.cookies)
+
+        self.client.cookies[panier_cookie.COOKIE_NAME] = "faux"
+        resp = self._post("batch_cart", {"operations": [{"op": "supprimer", "produit": self.produit.pk}]})
+        self.assertEqual(resp.json()["panier"]["lignes"], [])
+
+    def test_login_saves_the_cookie_cart(self):
+        user = User.objects.create_user(username="client_cookie", password="pass")
+        customer = Customer.objects.create(user=user, adresse="a", contact_1="0102")
+        self._post("add_to_cart", {"panier": "", "produit": self.produit.pk, "quantite": 2})
+        self._post("add_coupon", {"panier": "cookie", "coupon": "MOITIE"})
+
+        resp = self._post("post", {"username": "client_cookie", "password": "pass"})
+        self.assertTrue(resp.json()["success"])
+        self.assertEqual(resp.cookies[panier_cookie.COOKIE_NAME].value, "")
+        panier = Panier.objects.get(customer=customer)
+        self.assertEqual(panier.coupon.code_promo, "MOITIE")
+        self.assertEqual(list(panier.produit_panier.values_list("produit_id", "quantite")), [(self.produit.pk, 2)])
+        self.assertEqual(Reservation.objects.get().quantite, 2)
+
+    def test_signup_saves_the_cookie_cart(self):
+        self._post("add_to_cart", {"panier": "", "produit": self.produit.pk, "quantite": 2})
+        resp = self.client.post(reverse("inscription"), {
+            "nom": "Kone", "prenoms": "Awa", "username": "awa_cookie", "email": "awa@example.com",
+            "phone": "0102", "adresse": "a", "password": "pass", "passwordconf": "pass",
+            "file": SimpleUploadedFile("photo.jpg", b"x", content_type="image/jpeg"),
+        })
+        self.assertTrue(resp.json()["success"])
+        self.assertEqual(resp.cookies[panier_cookie.COOKIE_NAME].value, "")
+        panier = Panier.objects.get(customer__user__username="awa_cookie")
+        self.assertEqual(list(panier.produit_panier.values_list("produit_id", "quantite")), [(self.produit.pk, 2)])
+
+    def test_login_succeeds_and_keeps_the_cookie_when_saving_fails(self):
+        user = User.objects.create_user(username="client_cookie", password="pass")
+        Customer.objects.create(user=user, adresse="a", contact_1="0102")
+        self._post("add_to_cart", {"panier": "", "produit": self.produit.pk, "quantite": 2})
+
+        with patch("customer.panier_cookie.ajouter", side_effect=DatabaseError), self.assertLogs("customer.panier_cookie"):
+            resp = self._post("post", {"username": "client_cookie", "password": "pass"})
+        self.assertTrue(resp.json()["success"])
+        self.assertNotIn(panier_cookie.COOKIE_NAME, resp.cookies)
+        self.assertEqual(int(self.client.session["_auth_user_id"]), user.pk)
+
+
+class CustomerCartMergeTests(TestCase):
+    def setUp(self):
+        etab_user = User.objects.create_user(username="seller_merge", password="pass", email="merge@example.com")
+        etab, cat_prod = _make_etablissement_with_product_owner(etab_user)
+        self.produit, self.autre = [
+            Produit.objects.create(
+                nom=nom, description="d", description_deal="dd", prix=100,
+                categorie=cat_prod, etablissement=etab, quantite=10,
+            )
+            for nom in ("Merge A", "Merge B")
+        ]
+        self.user = User.objects.create_user(username="client_merge", password="pass")
+        self.customer = Customer.objects.create(user=self.user, adresse="a", contact_1="0102")
+
+    def _ajouter(self, produit, quantite):
+        donnees = {"panier": "", "produit": produit.pk, "quantite": quantite}
+        self.client.post(reverse("add_to_cart"), json.dumps(donnees), content_type="application/json")
+
+    def _connexion(self):
+        return self.client.post(reverse("post"), json.dumps({"username": "client_merge", "password": "pass"}),
+                                content_type="application/json")
+
+    def test_login_merges_the_anonymous_cart_into_the_customer_cart(self):
+        panier = Panier.objects.create(customer=self.customer)
+        stock.reserver(ProduitPanier.objects.create(panier=panier, produit=self.produit, quantite=1), 1)
+
+        self._ajouter(self.produit, 2)
+        self._ajouter(self.autre, 3)
+        self.assertTrue(self._connexion().json()["success"])
+
+        self.assertEqual(list(Panier.objects.all()), [panier])
+        self.assertEqual(
+            dict(panier.produit_panier.values_list("produit_id", "quantite")), {self.produit.pk: 3, self.autre.pk: 3})
+        self.assertEqual(
+            dict(Reservation.objects.values_list("produit_id", "quantite")), {self.produit.pk: 3, self.autre.pk: 3})
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite_reservee, 3)
+
+        # Le panier du client ne dépend plus de la session : la déconnexion le garde
+        self.client.get(reverse("deconnexion"))
+        self.assertTrue(Panier.objects.filter(pk=panier.pk).exists())
+
+    def test_customer_cart_is_unique_and_found_by_customer(self):
+        self._connexion()
+        self._ajouter(self.produit, 1)
+        panier = Panier.objects.get()
+        self.assertEqual(panier.customer, self.customer)
+        self.assertIsNone(panier.session_id)
+
+        requete = RequestFactory().get("/")
+        requete.user = self.user
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart(requete), panier)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Panier.objects.create(customer=self.customer)
+
+
 class CustomerPasswordResetViewsTests(TestCase):
     def setUp(self):
         self.client = Client()
 
-    @patch("customer.views.send_mail")
-    def test_request_reset_password_creates_or_updates_token_and_sends_email(self, send_mail_mock):
+    def test_request_reset_password_creates_or_updates_token_and_enqueues_email(self):
         user = User.objects.create_user(username="u3", email="u3@e.com", password="pass")
 
         url = reverse("request_reset_password")
@@ -356,7 +974,11 @@ class CustomerPasswordResetViewsTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         token_obj = PasswordResetToken.objects.get(user=user)
         self.assertTrue(len(token_obj.token) >= 10)
-        send_mail_mock.assert_called()
+        # Rien n'est envoyé pendant la requête : l'e-mail attend le worker
+        self.assertEqual(mail.outbox, [])
+        email = EmailSortant.objects.get()
+        self.assertEqual(email.destinataires, [user.email])
+        self.assertIn(token_obj.token, email.corps)
 
     def test_reset_password_invalid_token_redirects(self):
         url = reverse("reset_password", args=["does-not-exist"])
@@ -0,0 +1,140 @@
+from django.contrib.auth import login as auth_login
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from . import models
+
+
+CART_SUMMARY_TIMEOUT = 60 * 5
+
+
+def _cart_summary_key(session_key=None, user_id=None):
+    if user_id:
+        return "panier:resume:client:%s" % user_id
+    return "panier:resume:%s" % session_key
+
+
+def get_cart(request):
+    """Retourne le panier de la requête sans jamais écrire en base (ou None).
+
+    Un client n'a qu'un panier, trouvé par son customer_id ; celui d'un anonyme suit sa session.
+    """
+    if request.user.is_authenticated:
+        return models.Panier.objects.filter(customer__user=request.user).first()
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    if not session_key:
+        return None
+    return models.Panier.objects.filter(session_id=session_key, customer__isnull=True).order_by('id').first()
+
+
+def get_or_create_cart(request):
+    """Retourne le panier de la requête, en le créant lors de la première mutation."""
+    panier = get_cart(request)
+    if panier is not None:
+        return panier
+
+    if request.user.is_authenticated:
+        # Sans session : la déconnexion, qui supprime la session, ne doit pas l'emporter
+        panier, _ = models.Panier.objects.get_or_create(customer=models.Customer.objects.get(user=request.user))
+        return panier
+    if not request.session.session_key:
+        request.session.create()
+    return models.Panier.objects.create(session_id_id=request.session.session_key)
+
+
+def _build_cart_summary(panier):
+    lignes = []
+    if panier is not None:
+        for ligne in panier.produit_panier.select_related('produit').order_by('id'):
+            produit = ligne.produit
+            lignes.append({
+                'nom': produit.nom,
+                'image_url': produit.image.url if produit.image else '',
+                'prix': produit.prix,
+                'prix_promotionnel': produit.prix_promotionnel,
+                'promo': produit.check_promotion,
+                'quantite': ligne.quantite,
+            })
+    return {
+        'panier_id': panier.id if panier is not None else None,
+        'count': len(lignes),
+        'lignes': lignes,
+    }
+
+
+def _panier_cookie(request):
+    # Import local : customer.panier_cookie dépend de ce module
+    from . import panier_cookie
+    return panier_cookie.panier(request) if panier_cookie.actif(request) else None
+
+
+def get_cart_summary(request):
+    """Résumé du mini-panier (nombre de lignes et contenu), mis en cache par client ou par session."""
+    panier = _panier_cookie(request)
+    if panier is not None:
+        return panier.mini_panier()
+    if request.user.is_authenticated:
+        key = _cart_summary_key(user_id=request.user.pk)
+    else:
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        if not session_key:
+            return _build_cart_summary(None)
+        key = _cart_summary_key(session_key)
+
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build_cart_summary(get_cart(request))
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(panier):
+    keys = []
+    if panier.session_id_id:
+        keys.append(_cart_summary_key(panier.session_id_id))
+    if panier.customer_id:
+        if models.Panier.customer.is_cached(panier):
+            user_id = panier.customer.user_id
+        else:
+            user_id = models.Customer.objects.filter(pk=panier.customer_id).values_list('user_id', flat=True).first()
+        keys.append(_cart_summary_key(user_id=user_id))
+    if keys:
+        cache.delete_many(keys)
+
+
+def connecter(request, user):
+    """django.contrib.auth.login() qui verse le panier anonyme de la session dans celui du client.
+
+    Voir customer.panier.fusionner : une requête pour le panier du client, un UPDATE des lignes
+    qui changent de panier et un bulk_update de celles dont la quantité s'additionne.
+    """
+    from .panier import fusionner
+    from .stock import liberer
+
+    anonyme = None if request.user.is_authenticated else get_cart(request)
+    if anonyme is not None:
+        # login() remplace la session, ce qui supprimerait le panier avec elle
+        models.Panier.objects.filter(pk=anonyme.pk).update(session_id=None)
+    auth_login(request, user)
+    if anonyme is None:
+        return
+    try:
+        panier = get_or_create_cart(request)
+    except models.Customer.DoesNotExist:
+        # Compte sans profil client (commerçant) : le panier anonyme est abandonné
+        with transaction.atomic():
+            liberer(anonyme.produit_panier.all())
+            anonyme.delete()
+        return
+    fusionner(panier, anonyme)
+
+
+def lazy_cart(request):
+    return SimpleLazyObject(lambda: _panier_cookie(request) or get_cart(request))
+
+
+def lazy_cart_summary(request):
+    return SimpleLazyObject(lambda: get_cart_summary(request))
@@ -3,7 +3,7 @@ from django.shortcuts import render, redirect
 from django.shortcuts import render
 from . import models
 from shop import models as shop_models
-from django.contrib.auth import authenticate, login as login_request, logout
+from django.contrib.auth import authenticate, logout
 import json
 from django.http import JsonResponse
 from django.contrib.auth.models import User
@@ -11,6 +11,7 @@ from cities_light.models import City
 
 
 from django.core.mail import send_mail
+from base import outbox
 from django.utils.crypto import get_random_string
 from django.contrib import messages
 from django.urls import reverse
@@ -18,8 +19,14 @@ from django.urls import reverse
 
 from django.contrib.auth.hashers import make_password
 from .models import PasswordResetToken
+from . import panier as panier_api, panier_cookie
+from .utils import connecter, get_cart, get_cart_summary, get_or_create_cart
+from .stock import StockInsuffisant, liberer, reserver
+from django.db import transaction
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET, require_POST
 
 # Create your views here.
 def login(request):
@@ -59,7 +66,6 @@ def islogin(request):
     username = postdata['username']
     password = postdata['password']
 
-    isSuccess = False
     try:
 
         if '@' in username:
@@ -68,23 +74,6 @@ def islogin(request):
         else:
             utilisateur = User.objects.get(username=username)
             user = authenticate(username=utilisateur.username, password=password)
-        if user is not None and user.is_active:
-
-            isSuccess = True
-            _ = isSuccess
-            login_request(request, user)
-            datas = {
-                'success': True,
-                'message': 'Vous êtes connectés!!!',
-            }
-            return JsonResponse(datas, safe=False)  # page si connect
-        else:
-
-            data = {
-                'success': False,
-                'message': 'Vos identifiants ne sont pas correcte',
-            }
-            return JsonResponse(data, safe=False)
     except:
         data = {
             'success': False,
@@ -92,6 +81,24 @@ def islogin(request):
         }
         return JsonResponse(data, safe=False)
 
+    if user is None or not user.is_active:
+        data = {
+            'success': False,
+            'message': 'Vos identifiants ne sont pas correcte',
+        }
+        return JsonResponse(data, safe=False)
+
+    # Hors du try : une fois connecté, une erreur ne doit plus répondre « vérifiez vos informations »
+    connecter(request, user)
+    datas = {
+        'success': True,
+        'message': 'Vous êtes connectés!!!',
+    }
+    response = JsonResponse(datas, safe=False)  # page si connect
+    # Panier constitué en anonyme avec CART_STORAGE = 'cookie'
+    panier_cookie.enregistrer(request, response)
+    return response
+
 
 def deconnexion(request):
     logout(request)
@@ -154,7 +161,7 @@ def inscription(request):
                     message = "Votre Compte a été créé avec succès"
                     issuccess = True
                     if user is not None and user.is_active:
-                        login_request(request, user)
+                        connecter(request, user)
                         message = "Votre Compte a été créé avec succès"
                         issuccess = True
                 except Exception as _:
@@ -175,7 +182,26 @@ def inscription(request):
         'message': message
     }
 
-    return JsonResponse(datas, safe=False)
+    response = JsonResponse(datas, safe=False)
+    if issuccess and request.user.is_authenticated:
+        # Panier constitué en anonyme avec CART_STORAGE = 'cookie', comme à la connexion
+        panier_cookie.enregistrer(request, response)
+    return response
+
+
+def _modifier_panier_cookie(request, quantites, coupon=None, message="Panier modifié avec succès"):
+    """Mutation du panier d'un anonyme en mode CART_STORAGE = 'cookie' : aucune écriture en base."""
+    try:
+        etat = panier_cookie.modifier(request, quantites, coupon)
+    except panier_api.CouponInvalide:
+        return JsonResponse({'success': False, 'message': "Code coupon invalide"})
+    except panier_api.OperationInvalide as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+    except StockInsuffisant:
+        return JsonResponse({'success': False, 'message': "Stock insuffisant"})
+    response = JsonResponse({'success': True, 'message': message})
+    panier_cookie.ecrire(response, *etat)
+    return response
 
 
 def add_to_cart(request):
@@ -183,12 +209,19 @@ def add_to_cart(request):
 
     # name = postdata['name']
 
-    panier = postdata['panier']
+    panier = postdata.get('panier')
     produit = postdata['produit']
     quantite = postdata['quantite']
     isSuccess = False
-    if panier is not None and produit is not None and quantite is not None:
-        panier = models.Panier.objects.get(id=panier)
+    if produit is not None and quantite is not None and panier_cookie.actif(request):
+        return _modifier_panier_cookie(
+            request, {int(produit): int(quantite)}, message="Produit ajouté au panier avec succès")
+    if produit is not None and quantite is not None:
+        # Le panier n'est enregistré qu'au premier ajout d'un produit
+        if panier:
+            panier = models.Panier.objects.get(id=panier)
+        else:
+            panier = get_or_create_cart(request)
         produit = shop_models.Produit.objects.get(id=produit)
         try:
             produit_panier = models.ProduitPanier.objects.get(produit=produit, panier=panier)
@@ -199,9 +232,15 @@ def add_to_cart(request):
         produit_panier.panier = panier
         produit_panier.produit = produit
         produit_panier.quantite = quantite
-        produit_panier.save()
-        isSuccess = True
-        message = "Produit ajouté au panier avec succès"
+        try:
+            with transaction.atomic():
+                produit_panier.save()
+                reserver(produit_panier, int(quantite))
+            isSuccess = True
+            message = "Produit ajouté au panier avec succès"
+        except StockInsuffisant:
+            isSuccess = False
+            message = "Stock insuffisant"
     else:
         isSuccess = False
         message = "Une erreur s'est produite"
@@ -212,6 +251,13 @@ def add_to_cart(request):
     return JsonResponse(data, safe=False)
 
 
+@require_GET
+@never_cache
+def mini_panier(request):
+    """Mini-panier de l'en-tête, chargé à part par les pages en cache (website.cache.cache_anonymous_page)."""
+    return render(request, 'mini-panier.html', {'cart_summary': get_cart_summary(request)})
+
+
 def delete_from_cart(request):
     postdata = json.loads(request.body.decode('utf-8'))
 
@@ -221,8 +267,12 @@ def delete_from_cart(request):
     produit_panier = postdata['produit_panier']
 
     isSuccess = False
+    if produit_panier is not None and panier_cookie.actif(request):
+        # Dans le cookie, une ligne est désignée par son produit
+        return _modifier_panier_cookie(request, {int(produit_panier): 0}, message="Produit supprimé avec succès")
     if panier is not None and produit_panier is not None :
-        produit_panier = models.ProduitPanier.objects.get(id=produit_panier)
+        produit_panier = models.ProduitPanier.objects.select_related('panier').get(id=produit_panier)
+        liberer([produit_panier])
         produit_panier.delete()
         isSuccess = True
         message = "Produit supprimé avec succès"
@@ -245,6 +295,8 @@ def add_coupon(request):
     coupon = postdata['coupon']
 
     isSuccess = False
+    if coupon and panier_cookie.actif(request):
+        return _modifier_panier_cookie(request, {}, str(coupon), "Félicitations, vous avez ajouté un code coupon")
     if panier is not None and coupon is not None :
         try:
             coupon = models.CodePromotionnel.objects.get(code_promo=coupon)
@@ -276,14 +328,23 @@ def update_cart(request):
     quantite = postdata['quantite']
 
     isSuccess = False
+    if produit is not None and quantite is not None and panier_cookie.actif(request):
+        return _modifier_panier_cookie(request, {int(produit): int(quantite)})
     if panier is not None and produit is not None :
         panier = models.Panier.objects.get(id=panier)
         produit = shop_models.Produit.objects.get(id=produit)
         produit_panier = models.ProduitPanier.objects.get(panier=panier, produit=produit)
+        produit_panier.panier = panier
         produit_panier.quantite = quantite
-        produit_panier.save()
-        isSuccess = True
-        message = "Panier modifié avec succès"
+        try:
+            with transaction.atomic():
+                produit_panier.save()
+                reserver(produit_panier, int(quantite))
+            isSuccess = True
+            message = "Panier modifié avec succès"
+        except StockInsuffisant:
+            isSuccess = False
+            message = "Stock insuffisant"
     else:
         isSuccess = False
         message = "Une erreur s'est produite"
@@ -294,6 +355,48 @@ def update_cart(request):
     return JsonResponse(data, safe=False)
 
 
+@require_POST
+def batch_cart(request):
+    """Applique au panier de la session une liste d'opérations (voir customer.panier.lire_operations),
+    tout ou rien, et renvoie le panier recalculé."""
+    try:
+        quantites, coupon = panier_api.lire_operations(json.loads(request.body.decode('utf-8')).get('operations'))
+    except (ValueError, AttributeError, panier_api.OperationInvalide) as e:
+        return JsonResponse({'success': False, 'message': str(e) or "Requête invalide"}, status=400)
+
+    cookie = panier_cookie.actif(request)
+    etat = None
+    if cookie:
+        panier = panier_cookie.panier(request)
+    else:
+        panier = get_cart(request)
+        if panier is None and (coupon or any(quantites.values())):
+            panier = get_or_create_cart(request)
+    status, message = 200, "Panier modifié avec succès"
+    try:
+        if cookie:
+            etat = panier_cookie.modifier(request, quantites, coupon)
+            panier = panier_cookie.PanierCookie(*etat)
+        elif panier is None:
+            message = "Panier vide"
+        else:
+            panier_api.appliquer(panier, quantites, coupon)
+    except panier_api.CouponInvalide:
+        message, status = "Code coupon invalide", 400
+    except panier_api.OperationInvalide as e:
+        message, status = str(e), 400
+    except StockInsuffisant:
+        message, status = "Stock insuffisant", 409
+    response = JsonResponse({
+        'success': status == 200,
+        'message': message,
+        'panier': panier_api.resume(panier),
+    }, status=status)
+    if etat is not None:
+        panier_cookie.ecrire(response, *etat)
+    return response
+
+
 # Étape 1 : Vue pour demander l'e-mail
 def request_reset_password(request):
     if request.method == 'POST':
@@ -308,14 +411,13 @@ def request_reset_password(request):
             token.token = get_random_string(64)
             token.save()
 
-            # Envoyer l'e-mail
+            # Mettre l'e-mail en file d'envoi (expédié par send_outbox, hors de la requête)
             reset_url = request.build_absolute_uri(reverse('reset_password', args=[token.token]))
-            send_mail(
+            outbox.enqueue(
                 'Réinitialisation de mot de passe',
                 f'Cliquez sur le lien suivant pour réinitialiser votre mot de passe : {reset_url}',
-                'nguessanlandry216@gmail.com',
                 [user.email],
-                fail_silently=False,
+                expediteur='nguessanlandry216@gmail.com',
             )
 
             messages.success(request, 'Un e-mail de réinitialisation a été envoyé.')
@@ -153,6 +153,12 @@ class FavoriteAdmin(admin.ModelAdmin):
 admin.site.register(Favorite, FavoriteAdmin)
 
 
+class VenteJournaliereAdmin(admin.ModelAdmin):
+    list_display = ('id', 'etablissement', 'jour', 'commandes', 'unites', 'chiffre_affaires')
+    list_filter = ('jour',)
+    search_fields = ('etablissement__nom',)
+
+
 def _register(model, admin_class):
     admin.site.register(model, admin_class)
 
@@ -160,3 +166,4 @@ _register(models.CategorieEtablissement, CategorieEtablissementAdmin)
 _register(models.CategorieProduit, CategorieProduitAdmin)
 _register(models.Etablissement, EtablissementAdmin)
 _register(models.Produit, ProduitAdmin)
+_register(models.VenteJournaliere, VenteJournaliereAdmin)
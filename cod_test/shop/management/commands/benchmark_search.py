@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import search
+from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
+
+
+MOTS = (
+    'crème', 'brûlée', 'massage', 'relaxant', 'soin', 'visage', 'épilation', 'manucure', 'pédicure',
+    'coiffure', 'tresses', 'défrisage', 'hammam', 'sauna', 'spa', 'gommage', 'éclat', 'hydratant',
+    'pizza', 'grillade', 'poulet', 'braisé', 'attiéké', 'poisson', 'dîner', 'déjeuner', 'buffet',
+    'hôtel', 'séjour', 'piscine', 'plage', 'week-end', 'chambre', 'suite', 'détente', 'forfait',
+    'sport', 'fitness', 'yoga', 'abonnement', 'coaching', 'cinéma', 'soirée', 'concert', 'karaoké',
+)
+
+# Vocabulaire de remplissage : les mots de MOTS restent sélectifs, comme dans un vrai catalogue
+REMPLISSAGE = tuple('mot%04d' % i for i in range(5000))
+
+REQUETES = ('creme', 'massage relaxant', 'epilation', 'hotel piscine', 'attieke poisson', 'sej', 'yoga abonnement')
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence de la recherche produits sur un catalogue synthétique (annulé à la fin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produits', type=int, default=100000)
+        parser.add_argument('--repetitions', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._seed(options['produits'])
+            debut = time.monotonic()
+            search.reconstruire()
+            self.stdout.write('Index reconstruit en %.1f s' % (time.monotonic() - debut))
+
+            self.stdout.write('%-20s %8s %8s %8s %8s' % ('requête', 'p50 ms', 'p95 ms', 'icontains', 'résultats'))
+            for requete in REQUETES:
+                durees, resultats = self._mesurer(
+                    lambda: list(search.filtrer(Produit.objects.all(), requete).order_by('-pertinence', '-pk')[:24]),
+                    options['repetitions'])
+                scan, _ = self._mesurer(
+                    lambda: list(Produit.objects.filter(nom__icontains=requete.split()[0]).order_by('-pk')[:24]),
+                    options['repetitions'])
+                self.stdout.write('%-20s %8.2f %8.2f %8.2f %8d' % (
+                    requete, statistics.median(durees), _p95(durees), statistics.median(scan),
+                    search.filtrer(Produit.objects.all(), requete).count()))
+            transaction.set_rollback(True)
+
+    def _mesurer(self, requete, repetitions):
+        durees, resultat = [], None
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            resultat = requete()
+            durees.append((time.perf_counter() - debut) * 1000)
+        return durees, resultat
+
+    def _seed(self, nombre):
+        aleatoire = random.Random(42)
+        user = User.objects.create_user(username='benchmark-search')
+        categorie_etab = CategorieEtablissement.objects.create(nom='Bien-être', description='')
+        categorie = CategorieProduit.objects.create(nom='Soins', description='', categorie=categorie_etab)
+        etablissement = Etablissement.objects.create(
+            user=user, nom='Institut Beauté', description='', categorie=categorie_etab,
+            nom_du_responsable='Benchmark', prenoms_duresponsable='Recherche',
+            adresse='', pays='', contact_1='', email='benchmark@example.com',
+        )
+        for debut in range(0, nombre, 5000):
+            Produit.objects.bulk_create([
+                Produit(
+                    nom=' '.join(aleatoire.sample(MOTS, 3)),
+                    description=' '.join(aleatoire.choices(MOTS + REMPLISSAGE, k=30)),
+                    description_deal=' '.join(aleatoire.choices(MOTS + REMPLISSAGE, k=8)),
+                    prix=aleatoire.randint(1, 100) * 1000,
+                    categorie=categorie, categorie_etab=categorie_etab, etablissement=etablissement,
+                    slug='benchmark-%d' % i,
+                )
+                for i in range(debut, min(debut + 5000, nombre))
+            ])
+        self.stdout.write('%d produits créés' % nombre)
+
+
+def _p95(durees):
+    durees = sorted(durees)
+    return durees[min(len(durees) - 1, int(len(durees) * 0.95))]
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from customer.models import Commande
+from shop import ventes
+
+
+def _date(valeur):
+    try:
+        return datetime.date.fromisoformat(valeur)
+    except ValueError:
+        raise CommandError('Date invalide : %s (format AAAA-MM-JJ)' % valeur)
+
+
+class Command(BaseCommand):
+    help = "Recalcule les ventes journalières des établissements à partir des commandes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=_date, help='Premier jour (AAAA-MM-JJ), par défaut la première commande.')
+        parser.add_argument('--fin', type=_date, help="Dernier jour inclus (AAAA-MM-JJ), par défaut aujourd'hui.")
+
+    def handle(self, *args, **options):
+        fin = options['fin'] or timezone.localdate()
+        debut = options['debut']
+        if debut is None:
+            premiere = Commande.objects.aggregate(premiere=Min('date_add'))['premiere']
+            debut = timezone.localdate(premiere) if premiere else fin
+        if debut > fin:
+            raise CommandError('--debut doit précéder --fin')
+        total = ventes.reconstruire(debut, fin)
+        self.stdout.write(self.style.SUCCESS('%d lignes de ventes recalculées du %s au %s' % (total, debut, fin)))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des produits."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=500, help='Produits indexés par lot.')
+
+    def handle(self, *args, **options):
+        if search.backend() is None:
+            self.stdout.write(self.style.WARNING(
+                "Pas d'index plein texte pour cette base : la recherche utilise icontains."))
+            return
+        debut = time.monotonic()
+        total = search.reconstruire(options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(
+            '%d produits indexés en %.1f s' % (total, time.monotonic() - debut)))
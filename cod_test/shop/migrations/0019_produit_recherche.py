@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def creer_index(apps, schema_editor):
+    from shop import search
+
+    connection = schema_editor.connection
+    moteur = search.backend(connection)
+    if moteur is not None:
+        with connection.cursor() as cursor:
+            moteur.creer(cursor)
+        # Produits déjà en base : sinon la recherche ne trouve rien avant rebuild_search_index
+        produits = apps.get_model('shop', 'Produit').objects.using(connection.alias)
+        search.reconstruire(produits=produits, connection=connection)
+
+
+def detruire_index(apps, schema_editor):
+    from shop import search
+
+    moteur = search.backend(schema_editor.connection)
+    if moteur is not None:
+        with schema_editor.connection.cursor() as cursor:
+            moteur.detruire(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_produit_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, detruire_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_produit_recherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='quantite_reservee',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VenteJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('commandes', models.PositiveIntegerField(default=0)),
+                ('unites', models.PositiveIntegerField(default=0)),
+                ('chiffre_affaires', models.FloatField(default=0)),
+                ('etablissement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventes', to='shop.etablissement')),
+            ],
+            options={
+                'verbose_name': 'Vente journalière',
+                'verbose_name_plural': 'Ventes journalières',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ventejournaliere',
+            constraint=models.UniqueConstraint(fields=('etablissement', 'jour'), name='vente_journaliere_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_vente_journaliere'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='produit',
+            name='produit_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('status', True)), fields=['-date_add', '-id'], name='produit_actif_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('super_deal', True)), fields=['-date_add', '-id'], name='produit_super_deal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['etablissement', '-date_add', '-id'], name='produit_etab_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import TruncDate
+
+
+def remplir(apps, schema_editor):
+    """Ventes journalières des commandes passées avant le cumul (voir shop.ventes.reconstruire)."""
+    from shop.models import prix_effectif_expression
+
+    ProduitPanier = apps.get_model('customer', 'ProduitPanier')
+    VenteJournaliere = apps.get_model('shop', 'VenteJournaliere')
+    jour = TruncDate('commande__date_add')
+    totaux = (
+        ProduitPanier.objects.filter(commande__isnull=False)
+        .annotate(jour=jour)
+        .values('produit__etablissement_id', 'jour')
+        .annotate(
+            commandes=Count('commande', distinct=True), unites=Sum('quantite'),
+            ca=Sum(F('quantite') * prix_effectif_expression('produit__', jour), output_field=FloatField()),
+        )
+        .order_by()
+    )
+    VenteJournaliere.objects.all().delete()
+    VenteJournaliere.objects.bulk_create([
+        VenteJournaliere(
+            etablissement_id=t['produit__etablissement_id'], jour=t['jour'],
+            commandes=t['commandes'], unites=t['unites'], chiffre_affaires=t['ca'] or 0,
+        )
+        for t in totaux.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_conditional_get_indexes'),
+        ('customer', '0010_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir, migrations.RunPython.noop),
+    ]
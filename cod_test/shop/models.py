@@ -3,9 +3,65 @@ from django.utils.text import slugify
 import datetime
 from django.contrib.sessions.models import Session
 from django.contrib.auth.models import User
+from django.db.models.functions import Coalesce, NullIf
 from cities_light.models import City
 
 
+def promotion_q(prefix='', jour=None):
+    """Équivalent SQL de Produit.check_promotion, pour des champs préfixés par `prefix`.
+
+    `jour` (date ou expression SQL) remplace la date du jour, pour évaluer une promotion passée.
+    """
+    today = jour if jour is not None else datetime.date.today()
+    return models.Q(**{prefix + 'date_debut_promo__lte': today, prefix + 'date_fin_promo__gte': today})
+
+
+def prix_effectif_expression(prefix='', jour=None):
+    """Prix payé aujourd'hui (ou le `jour` donné) : prix promotionnel pendant la promotion, prix normal sinon."""
+    return models.Case(
+        models.When(promotion_q(prefix, jour), then=models.F(prefix + 'prix_promotionnel')),
+        default=models.F(prefix + 'prix'),
+        output_field=models.FloatField(),
+    )
+
+
+class ProduitQuerySet(models.QuerySet):
+
+    def with_effective_price(self):
+        """Annote `is_promo` et `prix_effectif` calculés en base plutôt que par check_promotion."""
+        return self.annotate(
+            is_promo=models.Case(
+                models.When(promotion_q(), then=models.Value(True)),
+                default=models.Value(False),
+                output_field=models.BooleanField(),
+            ),
+            prix_effectif=prix_effectif_expression(),
+        )
+
+    def en_promotion(self):
+        return self.filter(promotion_q())
+
+    def price_between(self, minimum=None, maximum=None):
+        """Filtre sur le prix effectif, bornes incluses ; une borne à None est ignorée."""
+        queryset = self if 'prix_effectif' in self.query.annotations else self.with_effective_price()
+        if minimum is not None:
+            queryset = queryset.filter(prix_effectif__gte=minimum)
+        if maximum is not None:
+            queryset = queryset.filter(prix_effectif__lte=maximum)
+        return queryset
+
+    def with_discount(self):
+        """Annote `remise`, la réduction en pourcentage du prix normal (0 hors promotion)."""
+        queryset = self if 'prix_effectif' in self.query.annotations else self.with_effective_price()
+        return queryset.annotate(
+            remise=Coalesce(
+                (models.F('prix') - models.F('prix_effectif')) * 100 / NullIf(models.F('prix'), 0),
+                0,
+                output_field=models.FloatField(),
+            ),
+        )
+
+
 # Create your models here.
 class CategorieEtablissement(models.Model):
 
@@ -96,6 +152,8 @@ class Produit(models.Model):
     prix_promotionnel = models.FloatField(default=0)
     prix = models.FloatField()
     quantite = models.IntegerField(null=True, blank=True)
+    # Unités retenues par des paniers (customer.stock) ; quantite vide = stock illimité
+    quantite_reservee = models.PositiveIntegerField(default=0)
     date_debut_promo = models.DateField(null=True, blank=True)
     date_fin_promo = models.DateField(null=True, blank=True)
     categorie_etab = models.ForeignKey(CategorieEtablissement, related_name="produit_etab", on_delete=models.CASCADE, null=True, blank=True)
@@ -111,6 +169,25 @@ class Produit(models.Model):
     status = models.BooleanField(default=True)
     slug = models.SlugField(unique=True, editable=False, null=True,  blank=True)
 
+    objects = ProduitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Pagination par curseur du catalogue (tri « récents »). Index partiel : Django écrit
+            # status=True « WHERE status », que SQLite ne rapproche pas d'un index (status, ...)
+            models.Index(fields=['-date_add', '-id'], condition=models.Q(status=True), name='produit_actif_recent_idx'),
+            models.Index(fields=['categorie', '-date_add', '-id'], name='produit_cat_recent_idx'),
+            models.Index(fields=['categorie_etab', '-date_add', '-id'], name='produit_cat_etab_recent_idx'),
+            models.Index(fields=['date_fin_promo', 'date_debut_promo'], name='produit_promo_idx'),
+            # Super deals de l'accueil et derniers articles du tableau de bord marchand
+            models.Index(fields=['-date_add', '-id'], condition=models.Q(super_deal=True), name='produit_super_deal_idx'),
+            models.Index(fields=['etablissement', '-date_add', '-id'], name='produit_etab_recent_idx'),
+            # Empreintes des GET conditionnels (website.conditional) : COUNT/MAX(date_update) depuis l'index seul
+            models.Index(fields=['date_update'], name='produit_maj_idx'),
+            models.Index(fields=['categorie', 'date_update'], name='produit_cat_maj_idx'),
+            models.Index(fields=['categorie_etab', 'date_update'], name='produit_cat_etab_maj_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug or self.slug is None:
             self.slug = '-'.join((slugify(self.nom), slugify(datetime.datetime.now().microsecond)))
@@ -151,3 +228,22 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.produit.nom}"
 
+
+class VenteJournaliere(models.Model):
+    """Ventes d'un établissement sur une journée, tenues à jour par la validation des commandes (voir shop.ventes)."""
+
+    etablissement = models.ForeignKey(Etablissement, related_name="ventes", on_delete=models.CASCADE)
+    jour = models.DateField()
+    commandes = models.PositiveIntegerField(default=0)
+    unites = models.PositiveIntegerField(default=0)
+    chiffre_affaires = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = 'Vente journalière'
+        verbose_name_plural = 'Ventes journalières'
+        constraints = [
+            models.UniqueConstraint(fields=['etablissement', 'jour'], name='vente_journaliere_unique'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.etablissement_id, self.jour)
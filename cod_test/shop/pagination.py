@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+TAILLE_PAGE = 24
+
+# tri : (champ, ordre décroissant) ; l'id départage les égalités
+TRIS = {
+    'recent': ('date_add', True),
+    'prix': ('prix_effectif', False),
+    '-prix': ('prix_effectif', True),
+    'remise': ('remise', True),
+    'pertinence': ('pertinence', True),
+}
+TRI_PAR_DEFAUT = 'recent'
+
+_SALT = 'shop.pagination'
+
+Page = namedtuple('Page', ['produits', 'suivant', 'tri'])
+
+
+class CurseurInvalide(Exception):
+    pass
+
+
+def _encoder(tri, produit):
+    champ, _ = TRIS[tri]
+    valeur = getattr(produit, champ)
+    if champ == 'date_add':
+        valeur = valeur.isoformat()
+    return signing.dumps({'t': tri, 'v': valeur, 'id': produit.pk}, salt=_SALT)
+
+
+def _decoder(tri, curseur):
+    try:
+        data = signing.loads(curseur, salt=_SALT)
+    except signing.BadSignature:
+        raise CurseurInvalide(curseur)
+    if data.get('t') != tri:
+        raise CurseurInvalide(curseur)
+    valeur = data['v']
+    if TRIS[tri][0] == 'date_add':
+        valeur = parse_datetime(valeur)
+    return valeur, data['id']
+
+
+def paginer(produits, tri=None, curseur=None, taille=TAILLE_PAGE):
+    """Pagination par curseur (keyset) : le coût d'une page ne dépend pas de sa profondeur.
+
+    `produits` doit être annoté par with_effective_price() (et par search.filtrer() pour
+    le tri « pertinence ») ; le curseur renvoyé dans Page.suivant (None en fin de liste)
+    est signé et lié au tri.
+    """
+    if tri not in TRIS or (tri == 'pertinence' and 'pertinence' not in produits.query.annotations):
+        tri = TRI_PAR_DEFAUT
+    champ, decroissant = TRIS[tri]
+    if champ == 'remise':
+        produits = produits.with_discount()
+
+    if curseur:
+        valeur, pk = _decoder(tri, curseur)
+        if decroissant:
+            produits = produits.filter(Q(**{champ + '__lt': valeur}) | Q(**{champ: valeur, 'pk__lt': pk}))
+        else:
+            produits = produits.filter(Q(**{champ + '__gt': valeur}) | Q(**{champ: valeur, 'pk__gt': pk}))
+
+    prefixe = '-' if decroissant else ''
+    lignes = list(produits.order_by(prefixe + champ, prefixe + 'pk')[:taille + 1])
+    suivant = _encoder(tri, lignes[taille - 1]) if len(lignes) > taille else None
+    return Page(lignes[:taille], suivant, tri)
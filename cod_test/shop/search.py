@@ -0,0 +1,210 @@
+import re
+
+from django.db import connections, router
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from website.cities import normalize
+
+from . import models
+
+
+# Colonnes indexées et poids dans le classement (le nom compte le plus)
+COLONNES = ('nom', 'description_deal', 'categorie', 'etablissement', 'description')
+POIDS = (10.0, 4.0, 3.0, 3.0, 1.0)
+
+TABLE_SQLITE = 'shop_produit_fts'
+TABLE_POSTGRES = 'shop_produit_recherche'
+
+# Poids tsvector (A > B > C > D), dans l'ordre de COLONNES
+_POIDS_POSTGRES = ('A', 'B', 'C', 'C', 'D')
+
+_TAILLE_LOT = 500
+
+
+def _connection():
+    return connections[router.db_for_write(models.Produit)]
+
+
+def termes(query):
+    """Mots de la requête, en minuscules et sans accents (« Crème brûlée » -> creme, brulee)."""
+    return re.findall(r'\w+', normalize(query))
+
+
+def document(produit):
+    """Texte indexé d'un produit, colonne par colonne, sans accents."""
+    categories = [c.nom for c in (produit.categorie, produit.categorie_etab) if c is not None]
+    return (
+        normalize(produit.nom),
+        normalize(produit.description_deal),
+        normalize(' '.join(categories)),
+        normalize(produit.etablissement.nom),
+        normalize(produit.description),
+    )
+
+
+class SQLiteBackend:
+    """Table virtuelle FTS5, classement bm25."""
+
+    def creer(self, cursor):
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, tokenize='unicode61 remove_diacritics 2')"
+            % (TABLE_SQLITE, ', '.join(COLONNES))
+        )
+
+    def detruire(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % TABLE_SQLITE)
+
+    def supprimer(self, cursor, ids):
+        if not ids:
+            return
+        cursor.execute(
+            'DELETE FROM %s WHERE rowid IN (%s)' % (TABLE_SQLITE, ', '.join(['%s'] * len(ids))), list(ids))
+
+    def indexer(self, cursor, lignes):
+        self.supprimer(cursor, [pk for pk, _ in lignes])
+        cursor.executemany(
+            'INSERT INTO %s (rowid, %s) VALUES (%s)'
+            % (TABLE_SQLITE, ', '.join(COLONNES), ', '.join(['%s'] * (len(COLONNES) + 1))),
+            [(pk,) + doc for pk, doc in lignes],
+        )
+
+    def vider(self, cursor):
+        cursor.execute('DELETE FROM %s' % TABLE_SQLITE)
+
+    def requete(self, mots):
+        return ' '.join('"%s"*' % mot for mot in mots)
+
+    def jointure(self, table):
+        return TABLE_SQLITE, ['%s.rowid = %s.id' % (TABLE_SQLITE, table), '%s MATCH %%s' % TABLE_SQLITE]
+
+    def score(self, requete):
+        # bm25 est négatif (plus petit = plus pertinent) : on l'inverse
+        return '-bm25(%s, %s)' % (TABLE_SQLITE, ', '.join(str(p) for p in POIDS)), []
+
+
+class PostgresBackend:
+    """Table tsvector pondérée avec index GIN, classement ts_rank."""
+
+    def creer(self, cursor):
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            ' produit_id bigint PRIMARY KEY REFERENCES shop_produit (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,'
+            ' document tsvector NOT NULL)' % TABLE_POSTGRES
+        )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_gin ON %s USING GIN (document)' % (TABLE_POSTGRES, TABLE_POSTGRES))
+
+    def detruire(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % TABLE_POSTGRES)
+
+    def supprimer(self, cursor, ids):
+        if not ids:
+            return
+        cursor.execute('DELETE FROM %s WHERE produit_id = ANY(%%s)' % TABLE_POSTGRES, [list(ids)])
+
+    def indexer(self, cursor, lignes):
+        vecteur = ' || '.join("setweight(to_tsvector('simple', %%s), '%s')" % poids for poids in _POIDS_POSTGRES)
+        cursor.executemany(
+            'INSERT INTO %s (produit_id, document) VALUES (%%s, %s) '
+            'ON CONFLICT (produit_id) DO UPDATE SET document = EXCLUDED.document' % (TABLE_POSTGRES, vecteur),
+            [(pk,) + doc for pk, doc in lignes],
+        )
+
+    def vider(self, cursor):
+        cursor.execute('TRUNCATE %s' % TABLE_POSTGRES)
+
+    def requete(self, mots):
+        return ' & '.join('%s:*' % mot for mot in mots)
+
+    def jointure(self, table):
+        return TABLE_POSTGRES, [
+            '%s.produit_id = %s.id' % (TABLE_POSTGRES, table),
+            "%s.document @@ to_tsquery('simple', %%s)" % TABLE_POSTGRES,
+        ]
+
+    def score(self, requete):
+        # Poids de ts_rank dans l'ordre {D, C, B, A}
+        return "ts_rank('{0.1, 0.3, 0.5, 1.0}', %s.document, to_tsquery('simple', %%s))" % TABLE_POSTGRES, [requete]
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgresBackend(),
+}
+
+
+def backend(connection=None):
+    """Moteur d'index de la base, ou None si elle n'en a pas (recherche par icontains)."""
+    return BACKENDS.get((connection or _connection()).vendor)
+
+
+def _lignes(produits):
+    produits = produits.select_related('categorie', 'categorie_etab', 'etablissement')
+    return [(produit.pk, document(produit)) for produit in produits]
+
+
+def indexer(ids):
+    """Met à jour l'index des produits `ids` (les produits disparus en sont retirés)."""
+    moteur = backend()
+    if moteur is None or not ids:
+        return
+    ids = list(ids)
+    with _connection().cursor() as cursor:
+        for debut in range(0, len(ids), _TAILLE_LOT):
+            lot = ids[debut:debut + _TAILLE_LOT]
+            lignes = _lignes(models.Produit.objects.filter(pk__in=lot))
+            moteur.supprimer(cursor, set(lot) - {pk for pk, _ in lignes})
+            if lignes:
+                moteur.indexer(cursor, lignes)
+
+
+def supprimer(ids):
+    moteur = backend()
+    if moteur is None or not ids:
+        return
+    with _connection().cursor() as cursor:
+        moteur.supprimer(cursor, list(ids))
+
+
+def reconstruire(taille_lot=_TAILLE_LOT, produits=None, connection=None):
+    """Reconstruit tout l'index ; renvoie le nombre de produits indexés.
+
+    Une migration passe les produits de son modèle historique et sa connexion.
+    """
+    connection = connection or _connection()
+    moteur = backend(connection)
+    if moteur is None:
+        return 0
+    total = 0
+    produits = (models.Produit.objects if produits is None else produits).order_by('pk')
+    with connection.cursor() as cursor:
+        moteur.vider(cursor)
+        dernier = 0
+        while True:
+            lignes = _lignes(produits.filter(pk__gt=dernier)[:taille_lot])
+            if not lignes:
+                return total
+            moteur.indexer(cursor, lignes)
+            total += len(lignes)
+            dernier = lignes[-1][0]
+
+
+def filtrer(produits, query):
+    """Restreint `produits` aux résultats de `query` et annote `pertinence` (plus grand = meilleur)."""
+    mots = termes(query)
+    moteur = backend()
+    if not mots:
+        return produits.none().annotate(pertinence=Value(0.0, output_field=FloatField()))
+    if moteur is None:
+        condition = Q()
+        for mot in mots:
+            condition &= Q(nom__icontains=mot) | Q(description_deal__icontains=mot) | Q(description__icontains=mot)
+        return produits.filter(condition).annotate(pertinence=Value(0.0, output_field=FloatField()))
+    requete = moteur.requete(mots)
+    # Jointure directe avec l'index : une sous-requête corrélée par ligne serait
+    # quadratique sur FTS5 (le MATCH est réévalué pour chaque produit).
+    table, conditions = moteur.jointure(models.Produit._meta.db_table)
+    sql, params = moteur.score(requete)
+    return produits.extra(tables=[table], where=conditions, params=[requete]).annotate(
+        pertinence=RawSQL(sql, params, output_field=FloatField()))
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import models, search
+
+
+def produit_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.indexer([instance.pk])
+
+
+def produit_deleted(sender, instance, **kwargs):
+    search.supprimer([instance.pk])
+
+
+def libelle_changed(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Les noms de catégorie et d'établissement font partie du document indexé
+    if created or raw or (update_fields is not None and 'nom' not in update_fields):
+        return
+    champ = CHAMPS_LIBELLE[sender]
+    search.indexer(models.Produit.objects.filter(**{champ: instance}).values_list('pk', flat=True))
+
+
+CHAMPS_LIBELLE = {
+    models.CategorieProduit: 'categorie',
+    models.CategorieEtablissement: 'categorie_etab',
+    models.Etablissement: 'etablissement',
+}
+
+
+post_save.connect(produit_saved, sender=models.Produit, dispatch_uid='search_produit_save')
+post_delete.connect(produit_deleted, sender=models.Produit, dispatch_uid='search_produit_delete')
+for model in CHAMPS_LIBELLE:
+    post_save.connect(libelle_changed, sender=model, dispatch_uid='search_libelle_%s' % model._meta.label_lower)
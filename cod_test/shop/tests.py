@@ -1,13 +1,24 @@
-from django.test import TestCase, Client
+from django.apps import apps
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 from datetime import timedelta
 import json
+from io import StringIO
+from django.core.management import call_command
+from importlib import import_module
+from types import SimpleNamespace
+from unittest.mock import PropertyMock, patch
 from django.core.files.uploadedfile import SimpleUploadedFile
 
-from customer.models import Customer, Panier, ProduitPanier, Commande
-from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
+from base.testing import QueryBudgetTestCase
+from customer.models import Customer, Panier, ProduitPanier, Commande, SousCommande
+from customer import checkout
+from shop import pagination, search, ventes
+from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit, VenteJournaliere
 
 
 def _make_etablissement_with_product_owner(user):
@@ -173,6 +184,346 @@ class ShopViewsTests(TestCase):
         self.assertIn("produits", resp.context)
 
 
+class ShopEffectivePriceTests(TestCase):
+    def setUp(self):
+        self.etab_user = User.objects.create_user(username="seller_prix", password="pass")
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(self.etab_user)
+        today = now().date()
+        self.normal = Produit.objects.create(
+            nom="Normal", description="d", description_deal="dd", prix=100, prix_promotionnel=50,
+            categorie=self.cat_prod, etablissement=self.etab,
+        )
+        self.promo = Produit.objects.create(
+            nom="Promo", description="d", description_deal="dd", prix=200, prix_promotionnel=80,
+            categorie=self.cat_prod, etablissement=self.etab,
+            date_debut_promo=today - timedelta(days=1), date_fin_promo=today + timedelta(days=1),
+        )
+        self.expiree = Produit.objects.create(
+            nom="Expiree", description="d", description_deal="dd", prix=150, prix_promotionnel=10,
+            categorie=self.cat_prod, etablissement=self.etab,
+            date_debut_promo=today - timedelta(days=5), date_fin_promo=today - timedelta(days=1),
+        )
+
+    def test_annotations_match_check_promotion(self):
+        for produit in Produit.objects.with_effective_price():
+            self.assertEqual(produit.is_promo, produit.check_promotion)
+            attendu = produit.prix_promotionnel if produit.check_promotion else produit.prix
+            self.assertEqual(produit.prix_effectif, attendu)
+
+    def test_en_promotion(self):
+        self.assertEqual(list(Produit.objects.en_promotion()), [self.promo])
+
+    def test_price_between_uses_effective_price(self):
+        produits = Produit.objects.price_between(80, 150).order_by("prix_effectif")
+        self.assertEqual(list(produits), [self.promo, self.normal, self.expiree])
+        self.assertEqual(list(Produit.objects.price_between(maximum=99)), [self.promo])
+        self.assertEqual(list(Produit.objects.price_between(minimum=120)), [self.expiree])
+
+    def test_shop_view_filters_and_sorts_in_sql(self):
+        resp = self.client.get(reverse("shop"), {"tri": "prix"})
+        self.assertEqual(list(resp.context["produits"]), [self.promo, self.normal, self.expiree])
+
+        resp = self.client.get(reverse("shop"), {"promo": "1"})
+        self.assertEqual(list(resp.context["produits"]), [self.promo])
+
+        resp = self.client.get(reverse("shop"), {"prix_min": "90", "prix_max": "abc", "tri": "-prix"})
+        self.assertEqual(list(resp.context["produits"]), [self.expiree, self.normal])
+
+    def test_templates_do_not_call_check_promotion(self):
+        with patch.object(Produit, "check_promotion", new_callable=PropertyMock) as check:
+            self.client.get(reverse("shop"))
+            self.client.get(reverse("product_detail", args=[self.promo.slug]))
+        check.assert_not_called()
+
+
+class ShopPaginationTests(TestCase):
+    def setUp(self):
+        self.etab_user = User.objects.create_user(username="seller_page", password="pass")
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(self.etab_user)
+        today = now().date()
+        for i in range(30):
+            promo = i % 3 == 0
+            Produit.objects.create(
+                nom="P%d" % i, description="d", description_deal="dd", prix=100 + (i % 7) * 10,
+                prix_promotionnel=50 + (i % 5) * 10, categorie=self.cat_prod, etablissement=self.etab,
+                date_debut_promo=today - timedelta(days=1) if promo else None,
+                date_fin_promo=today + timedelta(days=1) if promo else None,
+            )
+
+    def _parcourir(self, tri, taille=7):
+        vus, curseur = [], None
+        while True:
+            page = pagination.paginer(Produit.objects.with_effective_price(), tri, curseur, taille=taille)
+            vus.extend(p.pk for p in page.produits)
+            if page.suivant is None:
+                return vus
+            curseur = page.suivant
+
+    def test_keyset_pages_cover_each_sort_order_exactly_once(self):
+        attendus = {
+            "recent": ["-date_add", "-pk"],
+            "prix": ["prix_effectif", "pk"],
+            "-prix": ["-prix_effectif", "-pk"],
+            "remise": ["-remise", "-pk"],
+        }
+        for tri, ordre in attendus.items():
+            with self.subTest(tri=tri):
+                tous = list(Produit.objects.with_discount().order_by(*ordre).values_list("pk", flat=True))
+                self.assertEqual(self._parcourir(tri), tous)
+
+    def test_cursor_is_bound_to_sort_order(self):
+        page = pagination.paginer(Produit.objects.with_effective_price(), "prix", taille=5)
+        with self.assertRaises(pagination.CurseurInvalide):
+            pagination.paginer(Produit.objects.with_effective_price(), "recent", page.suivant)
+        with self.assertRaises(pagination.CurseurInvalide):
+            pagination.paginer(Produit.objects.with_effective_price(), "prix", "abc")
+
+    def test_shop_renders_one_page_and_load_more_returns_the_next(self):
+        resp = self.client.get(reverse("shop"), {"tri": "prix"})
+        self.assertEqual(len(resp.context["produits"]), pagination.TAILLE_PAGE)
+        self.assertContains(resp, "data-load-more")
+        premiers = [p.pk for p in resp.context["produits"]]
+
+        resp = self.client.get(reverse("shop_suite"), {"tri": "prix", "curseur": resp.context["suivant"]})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertIsNone(data["suivant"])
+        restants = Produit.objects.with_effective_price().exclude(pk__in=premiers)
+        for produit in restants:
+            self.assertIn(produit.nom, data["grille"])
+            self.assertIn(produit.nom, data["liste"])
+
+    def test_load_more_rejects_invalid_cursor(self):
+        resp = self.client.get(reverse("shop_suite"), {"tri": "prix", "curseur": "abc"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class ShopSearchTests(TestCase):
+    def setUp(self):
+        self.etab_user = User.objects.create_user(username="seller_search", password="pass")
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(self.etab_user)
+        self.creme = self._produit("Crème brûlée maison", "Dessert du chef")
+        self.diner = self._produit("Dîner pour deux", "Entrée, plat et crème brûlée en dessert")
+        self.massage = self._produit("Massage relaxant", "Une heure de détente")
+
+    def _produit(self, nom, description):
+        return Produit.objects.create(
+            nom=nom, description=description, description_deal="", prix=1000,
+            categorie=self.cat_prod, etablissement=self.etab,
+        )
+
+    def _resultats(self, query):
+        return list(search.filtrer(Produit.objects.all(), query).order_by("-pertinence", "-pk"))
+
+    def test_search_folds_accents_and_matches_prefixes(self):
+        self.assertEqual(self._resultats("creme brulee")[0], self.creme)
+        self.assertEqual(self._resultats("CRÈME")[0], self.creme)
+        self.assertEqual(self._resultats("detente"), [self.massage])
+        self.assertEqual(self._resultats("mass"), [self.massage])
+        self.assertEqual(self._resultats("  "), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self._resultats("creme brulee"), [self.creme, self.diner])
+
+    def test_index_follows_saves_deletes_and_renames(self):
+        self.massage.nom = "Hammam traditionnel"
+        self.massage.save()
+        self.assertEqual(self._resultats("hammam"), [self.massage])
+
+        self.etab.nom = "Institut Éclat"
+        self.etab.save()
+        self.assertEqual(len(self._resultats("eclat")), 3)
+
+        self.creme.delete()
+        self.assertEqual(self._resultats("creme"), [self.diner])
+
+    def test_rebuild_command_indexes_bulk_created_products(self):
+        Produit.objects.bulk_create([
+            Produit(nom="Attiéké poisson", description="d", description_deal="", prix=1,
+                    categorie=self.cat_prod, categorie_etab=self.etab.categorie, etablissement=self.etab,
+                    slug="attieke-poisson"),
+        ])
+        self.assertEqual(self._resultats("attieke"), [])
+
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("4 produits indexés", out.getvalue())
+        self.assertEqual([p.nom for p in self._resultats("attieke")], ["Attiéké poisson"])
+
+    def test_search_migration_indexes_existing_products(self):
+        with connection.cursor() as cursor:
+            search.backend().vider(cursor)
+        self.assertEqual(self._resultats("massage"), [])
+        import_module("shop.migrations.0019_produit_recherche").creer_index(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self._resultats("massage"), [self.massage])
+        self.assertEqual(self._resultats("creme brulee"), [self.creme, self.diner])
+
+    def test_relevance_order_pages_with_cursor(self):
+        produits = search.filtrer(Produit.objects.with_effective_price(), "creme")
+        page = pagination.paginer(produits, "pertinence", taille=1)
+        self.assertEqual(page.produits, [self.creme])
+        page = pagination.paginer(produits, "pertinence", page.suivant, taille=1)
+        self.assertEqual(page.produits, [self.diner])
+        self.assertIsNone(page.suivant)
+
+    def test_shop_view_search_defaults_to_relevance(self):
+        resp = self.client.get(reverse("shop"), {"q": "crème"})
+        self.assertEqual(resp.context["tri"], "pertinence")
+        self.assertEqual(list(resp.context["produits"]), [self.creme, self.diner])
+
+
+class ShopSalesRollupTests(TestCase):
+    def setUp(self):
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(User.objects.create_user(username="seller"))
+        autre_vendeur = User.objects.create_user(username="seller2")
+        self.autre_etab, _ = _make_etablissement_with_product_owner(autre_vendeur)
+        hier, demain = now().date() - timedelta(days=1), now().date() + timedelta(days=1)
+        self.promo = Produit.objects.create(
+            nom="Promo", description="d", prix=100, prix_promotionnel=80, categorie=self.cat_prod,
+            etablissement=self.etab, date_debut_promo=hier, date_fin_promo=demain)
+        self.normal = Produit.objects.create(
+            nom="Normal", description="d", prix=50, categorie=self.cat_prod, etablissement=self.etab)
+        self.ailleurs = Produit.objects.create(
+            nom="Ailleurs", description="d", prix=30, categorie=self.cat_prod, etablissement=self.autre_etab)
+        user = User.objects.create_user(username="buyer", first_name="F", last_name="L")
+        self.customer = Customer.objects.create(user=user)
+
+    def _commander(self, transaction_id, *lignes):
+        panier = Panier.objects.create(customer=self.customer)
+        for produit, quantite in lignes:
+            ProduitPanier.objects.create(panier=panier, produit=produit, quantite=quantite)
+        return checkout.passer_commande(self.customer, panier.id, transaction_id)[0]
+
+    def _ventes(self, etablissement):
+        return VenteJournaliere.objects.values_list("commandes", "unites", "chiffre_affaires").get(
+            etablissement=etablissement, jour=now().date())
+
+    def test_checkout_updates_daily_rollup_per_establishment(self):
+        self._commander("trx-1", (self.promo, 2), (self.normal, 1), (self.ailleurs, 3))
+        self._commander("trx-2", (self.normal, 2))
+        self.assertEqual(self._ventes(self.etab), (2, 5, 2 * 80 + 50 + 2 * 50))
+        self.assertEqual(self._ventes(self.autre_etab), (1, 3, 90))
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self._commander("trx-1", (self.promo, 2), (self.ailleurs, 1))
+        self._commander("trx-2", (self.promo, 1), (self.normal, 4))
+        incremental = set(VenteJournaliere.objects.values_list("etablissement", "jour", "commandes", "unites", "chiffre_affaires"))
+        VenteJournaliere.objects.all().delete()
+        self.assertEqual(ventes.reconstruire(now().date(), now().date()), 2)
+        self.assertEqual(
+            set(VenteJournaliere.objects.values_list("etablissement", "jour", "commandes", "unites", "chiffre_affaires")),
+            incremental)
+
+    def test_rebuild_command_only_touches_the_given_range(self):
+        commande = self._commander("trx-1", (self.normal, 1))
+        Commande.objects.filter(pk=commande.pk).update(date_add=now() - timedelta(days=3))
+        autre_jour = VenteJournaliere.objects.create(etablissement=self.etab, jour=now().date() - timedelta(days=10), commandes=7)
+        out = StringIO()
+        debut = (now().date() - timedelta(days=5)).isoformat()
+        call_command("rebuild_sales_rollups", "--debut", debut, stdout=out)
+        self.assertIn("1 lignes de ventes recalculées", out.getvalue())
+        self.assertEqual(
+            list(VenteJournaliere.objects.exclude(pk=autre_jour.pk).values_list("jour", "commandes")),
+            [(now().date() - timedelta(days=3), 1)])
+        self.assertTrue(VenteJournaliere.objects.filter(pk=autre_jour.pk, commandes=7).exists())
+
+    def test_dashboard_counters_and_series_read_the_rollup(self):
+        self._commander("trx-1", (self.normal, 1))
+        VenteJournaliere.objects.create(etablissement=self.etab, jour=now().date() - timedelta(days=2), commandes=4)
+        with self.assertNumQueries(1):
+            self.assertEqual(ventes.resume(self.etab), {"commandes_aujourdhui": 1, "total_commandes": 5})
+        serie = ventes.serie(self.etab, now().date() - timedelta(days=2), now().date())
+        self.assertEqual([v.commandes for v in serie], [4, 0, 1])
+
+    def test_backfill_migration_counts_existing_orders(self):
+        self._commander("trx-1", (self.promo, 2), (self.ailleurs, 1))
+        self._commander("trx-2", (self.normal, 1))
+        VenteJournaliere.objects.all().delete()
+        import_module("shop.migrations.0024_vente_journaliere_backfill").remplir(apps, None)
+        self.assertEqual(ventes.resume(self.etab), {"commandes_aujourdhui": 2, "total_commandes": 2})
+        self.assertEqual(self._ventes(self.etab), (2, 3, 2 * 80 + 50))
+        self.assertEqual(self._ventes(self.autre_etab), (1, 1, 30))
+
+
+class ShopSubOrderTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username="seller")
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(self.seller)
+        self.autre_etab, _ = _make_etablissement_with_product_owner(User.objects.create_user(username="seller2"))
+        self.massage = Produit.objects.create(
+            nom="Massage", description="d", prix=100, categorie=self.cat_prod, etablissement=self.etab)
+        self.soin = Produit.objects.create(
+            nom="Soin", description="d", prix=40, categorie=self.cat_prod, etablissement=self.etab)
+        self.pizza = Produit.objects.create(
+            nom="Pizza", description="d", prix=30, categorie=self.cat_prod, etablissement=self.autre_etab)
+
+    def _commander(self, prenom, *lignes):
+        user = User.objects.create_user(username=prenom, first_name=prenom, last_name="L")
+        customer = Customer.objects.create(user=user)
+        panier = Panier.objects.create(customer=customer)
+        for produit, quantite in lignes:
+            ProduitPanier.objects.create(panier=panier, produit=produit, quantite=quantite)
+        return checkout.passer_commande(customer, panier.id, "trx-%s" % prenom)[0]
+
+    def _contexte(self, url, params=None):
+        with patch("shop.views.render", return_value=HttpResponse()) as rendu:
+            self.client.get(url, params or {})
+        return rendu.call_args[0][2]
+
+    def test_checkout_writes_one_sub_order_per_establishment(self):
+        commande = self._commander("awa", (self.massage, 2), (self.soin, 1), (self.pizza, 3))
+        self.assertEqual(
+            set(commande.sous_commandes.values_list("etablissement", "sous_total", "nombre_articles", "status")),
+            {(self.etab.pk, 240, 3, True), (self.autre_etab.pk, 90, 3, True)})
+        self.assertEqual({s.date_add for s in commande.sous_commandes.all()}, {commande.date_add})
+
+    def test_status_change_is_copied_to_sub_orders(self):
+        commande = self._commander("awa", (self.massage, 1), (self.pizza, 1))
+        commande.status = False
+        commande.save()
+        self.assertFalse(SousCommande.objects.filter(status=True).exists())
+
+    def test_merchant_order_list_filters_on_sub_orders(self):
+        self._commander("awa", (self.soin, 1), (self.massage, 1))
+        commande_koffi = self._commander("koffi", (self.pizza, 1), (self.massage, 1))
+        self._commander("yao", (self.pizza, 2))
+        commande_koffi.status = False
+        commande_koffi.save()
+        self.client.force_login(self.seller)
+        url = reverse("commande-reçu")
+
+        # Session, utilisateur, établissement, COUNT et page : rien par ligne
+        with self.assertNumQueries(5):
+            page = self._contexte(url)["commandes"]
+            lignes = [(s.commande.customer.user.first_name, s.premier_produit, s.sous_total) for s in page]
+        self.assertEqual(lignes, [("koffi", "Massage", 100), ("awa", "Soin", 140)])
+
+        self.assertEqual([s.commande_id for s in self._contexte(url, {"status": "attente"})["commandes"]], [commande_koffi.pk])
+        self.assertEqual([s.commande.customer.user.first_name for s in self._contexte(url, {"client": "aw"})["commandes"]], ["awa"])
+        # Un produit d'un autre établissement ne fait pas ressortir la commande
+        self.assertEqual(len(self._contexte(url, {"produit": "pizza"})["commandes"]), 0)
+        self.assertEqual(len(self._contexte(url, {"produit": "mass"})["commandes"]), 2)
+
+    def test_merchant_order_detail_shows_own_lines_only(self):
+        commande = self._commander("awa", (self.massage, 1), (self.pizza, 2))
+        self.client.force_login(self.seller)
+        contexte = self._contexte(reverse("commande-reçu-detail", args=[commande.pk]))
+        self.assertEqual([l.produit.nom for l in contexte["lignes"]], ["Massage"])
+        self.assertEqual(contexte["sous_commande"].sous_total, 100)
+
+        autre = self._commander("yao", (self.pizza, 1))
+        resp = self.client.get(reverse("commande-reçu-detail", args=[autre.pk]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_backfill_migration_creates_missing_sub_orders(self):
+        commande = self._commander("awa", (self.massage, 2), (self.pizza, 1))
+        SousCommande.objects.all().delete()
+        import_module("customer.migrations.0012_sous_commande_backfill").remplir(apps, None)
+        self.assertEqual(
+            set(SousCommande.objects.values_list("commande", "etablissement", "sous_total", "nombre_articles")),
+            {(commande.pk, self.etab.pk, 200, 2), (commande.pk, self.autre_etab.pk, 30, 1)})
+
+
 class ShopDashboardTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -250,3 +601,40 @@ class ShopDashboardTests(TestCase):
         
         resp_filter = self.client.get(url, {"status": "attente"})
         self.assertEqual(resp_filter.status_code, 200)
+
+
+# Cache de page désactivé : on mesure le rendu, pas une page servie depuis le cache
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ShopQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username="budget_seller", password="pass")
+        self.etab, self.cat_prod = _make_etablissement_with_product_owner(seller)
+        self.produit = Produit.objects.create(
+            nom="Budget", description="d", description_deal="dd", prix=100,
+            categorie=self.cat_prod, etablissement=self.etab, slug="budget",
+        )
+
+    def _seed_produits(self, size):
+        existing = Produit.objects.count()
+        today = now().date()
+        Produit.objects.bulk_create([
+            Produit(
+                nom="P%d" % i, description="d", description_deal="dd", prix=100 + i, prix_promotionnel=90,
+                date_debut_promo=today - timedelta(days=1), date_fin_promo=today + timedelta(days=i % 3 - 1),
+                categorie=self.cat_prod, categorie_etab=self.etab.categorie, etablissement=self.etab,
+                slug="budget-p%d" % i,
+            )
+            for i in range(existing, size)
+        ])
+
+    def test_shop_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("shop"), self._seed_produits, budget=12)
+
+    def test_product_detail_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("product_detail", args=[self.produit.slug]), self._seed_produits, budget=12)
+
+    def test_categorie_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("categorie", args=[self.cat_prod.slug]), self._seed_produits, budget=12)
+
+    def test_load_more_query_count_is_constant(self):
+        self.assertQueryBudget(reverse("shop_suite") + "?tri=remise", self._seed_produits, budget=8)
@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('', views.shop, name="shop"),
+    path('produits/suite', views.shop_suite, name="shop_suite"),
     path('produit/<str:slug>', views.product_detail, name="product_detail"),
     path('cart', views.cart, name="cart"),
     path('checkout', views.checkout, name="checkout"),
@@ -0,0 +1,109 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from customer.models import ProduitPanier
+from .models import VenteJournaliere, prix_effectif_expression
+
+
+def _chiffre_affaires(jour=None):
+    return Sum(F('quantite') * prix_effectif_expression('produit__', jour), output_field=FloatField())
+
+
+def _incrementer(etablissement_id, jour, commandes, unites, chiffre_affaires):
+    increments = {
+        'commandes': F('commandes') + commandes,
+        'unites': F('unites') + unites,
+        'chiffre_affaires': F('chiffre_affaires') + chiffre_affaires,
+    }
+    ligne = VenteJournaliere.objects.filter(etablissement_id=etablissement_id, jour=jour)
+    if ligne.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            VenteJournaliere.objects.create(
+                etablissement_id=etablissement_id, jour=jour,
+                commandes=commandes, unites=unites, chiffre_affaires=chiffre_affaires,
+            )
+    except IntegrityError:
+        # Première vente du jour enregistrée en même temps par une autre commande
+        ligne.update(**increments)
+
+
+def totaux_par_etablissement(lignes):
+    """Articles et montant de `lignes` (ProduitPanier) par établissement, en une requête.
+
+    Renvoie une liste de dicts {etablissement_id, unites, montant}, au prix du jour.
+    """
+    totaux = lignes.values('produit__etablissement_id').annotate(unites=Sum('quantite'), montant=_chiffre_affaires())
+    return [
+        {'etablissement_id': t['produit__etablissement_id'], 'unites': t['unites'], 'montant': t['montant'] or 0}
+        for t in totaux.order_by('produit__etablissement_id')
+    ]
+
+
+def enregistrer_commande(commande, totaux):
+    """Ajoute la commande aux ventes du jour de chaque établissement concerné.
+
+    `totaux` : résultat de totaux_par_etablissement() pour les lignes de la commande.
+    À appeler dans la transaction qui crée la commande.
+    """
+    jour = timezone.localdate(commande.date_add)
+    for total in totaux:
+        _incrementer(total['etablissement_id'], jour, 1, total['unites'], total['montant'])
+
+
+def _bornes(debut, fin):
+    zone = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.datetime.combine(debut, datetime.time.min), zone),
+        timezone.make_aware(datetime.datetime.combine(fin + datetime.timedelta(days=1), datetime.time.min), zone),
+    )
+
+
+def reconstruire(debut, fin):
+    """Recalcule les ventes journalières du `debut` au `fin` inclus à partir des commandes.
+
+    Le prix de chaque ligne est le prix effectif au jour de la commande (promotion
+    comprise), comme lors de l'enregistrement incrémental. Renvoie le nombre de lignes écrites.
+    """
+    depuis, jusqua = _bornes(debut, fin)
+    jour = TruncDate('commande__date_add')
+    totaux = (
+        ProduitPanier.objects
+        .filter(commande__date_add__gte=depuis, commande__date_add__lt=jusqua)
+        .annotate(jour=jour)
+        .values('produit__etablissement_id', 'jour')
+        .annotate(commandes=Count('commande', distinct=True), unites=Sum('quantite'), ca=_chiffre_affaires(jour))
+        .order_by()
+    )
+    with transaction.atomic():
+        VenteJournaliere.objects.filter(jour__range=(debut, fin)).delete()
+        ventes = VenteJournaliere.objects.bulk_create([
+            VenteJournaliere(
+                etablissement_id=total['produit__etablissement_id'], jour=total['jour'],
+                commandes=total['commandes'], unites=total['unites'], chiffre_affaires=total['ca'] or 0,
+            )
+            for total in totaux
+        ], batch_size=1000)
+    return len(ventes)
+
+
+def resume(etablissement):
+    """Commandes du jour et commandes totales de l'établissement, lues dans le cumul."""
+    return VenteJournaliere.objects.filter(etablissement=etablissement).aggregate(
+        commandes_aujourdhui=Coalesce(Sum('commandes', filter=Q(jour=timezone.localdate())), 0),
+        total_commandes=Coalesce(Sum('commandes'), 0),
+    )
+
+
+def serie(etablissement, debut, fin):
+    """Ventes jour par jour du `debut` au `fin` inclus (jours sans vente à zéro), pour les graphiques."""
+    ventes = {
+        v.jour: v for v in VenteJournaliere.objects.filter(etablissement=etablissement, jour__range=(debut, fin))
+    }
+    jours = (debut + datetime.timedelta(days=i) for i in range((fin - debut).days + 1))
+    return [ventes.get(jour) or VenteJournaliere(etablissement=etablissement, jour=jour) for jour in jours]
@@ -1,9 +1,11 @@
 from django.shortcuts import redirect, render,  get_object_or_404
-from . import models
+from . import models, pagination, search, ventes
 from customer import models as customer_models
 from django.contrib.auth.decorators import login_required
 import json
 from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 try:
     from cinetpay_sdk.s_d_k import Cinetpay
@@ -13,26 +15,133 @@ from cities_light.models import City
 
 from django.contrib import messages
 from .models import Produit, Favorite, Etablissement, CategorieProduit
-from customer.models import Commande
+from customer.checkout import CheckoutError, passer_commande
+from customer.stock import StockInsuffisant
+from base import images
+from website.cache import cache_anonymous_page
+from website.conditional import conditional_page, empreintes
 
 from django.core.paginator import Paginator
-from django.utils import timezone
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def _parse_prix(valeur):
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+def filtrer_produits(request, produits):
+    """Applique les filtres du catalogue (?q=, ?promo=1, ?prix_min=, ?prix_max=) en SQL."""
+    produits = produits.with_effective_price()
+    if request.GET.get('q'):
+        produits = search.filtrer(produits, request.GET['q'])
+    if request.GET.get('promo'):
+        produits = produits.en_promotion()
+    return produits.price_between(_parse_prix(request.GET.get('prix_min')), _parse_prix(request.GET.get('prix_max')))
+
+
+def _page_produits(request, produits):
+    """Filtre puis pagine par curseur (?tri=recent|prix|-prix|remise|pertinence, ?curseur=)."""
+    produits = filtrer_produits(request, produits)
+    tri = request.GET.get('tri') or ('pertinence' if request.GET.get('q') else None)
+    try:
+        return pagination.paginer(produits, tri, request.GET.get('curseur'))
+    except pagination.CurseurInvalide:
+        return pagination.paginer(produits, tri)
+
+
+def _produits_categorie(slug):
+    try:
+        categorie = models.CategorieProduit.objects.get(slug=slug)
+        return categorie, categorie.produit.all()
+    except models.CategorieProduit.DoesNotExist:
+        categorie = models.CategorieEtablissement.objects.get(slug=slug)
+        return categorie, categorie.produit_etab.all()
+
+
+def _datas_catalogue(request, page, categorie=None):
+    params = request.GET.copy()
+    params.pop('curseur', None)
+    params['tri'] = page.tri
+    if categorie is not None:
+        params['categorie'] = categorie.slug
+    images.precharger(produit.image for produit in page.produits)
+    return {
+        'produits': page.produits,
+        'categorie': categorie,
+        'tri': page.tri,
+        'suivant': page.suivant,
+        'suite_query': params.urlencode(),
+    }
+
+
+def _empreintes_catalogue():
+    # Tous les produits : un produit désactivé change aussi sa date_update
+    return empreintes(models.Produit.objects.all())
+
+
+def _empreintes_produit(slug):
+    produit = (
+        models.Produit.objects.filter(slug=slug)
+        .values_list('categorie_id', 'categorie__date_update', 'etablissement__date_update').first()
+    )
+    if produit is None:
+        return None
+    categorie_id, categorie_maj, etablissement_maj = produit
+    # Le produit et ses similaires sont dans sa catégorie
+    return empreintes(models.Produit.objects.filter(categorie_id=categorie_id)) + [
+        (1, categorie_maj), (1, etablissement_maj),
+    ]
+
+
+def _empreintes_categorie(slug):
+    for modele, champ in ((models.CategorieProduit, 'categorie'), (models.CategorieEtablissement, 'categorie_etab')):
+        categorie = modele.objects.filter(slug=slug).values_list('pk', 'date_update').first()
+        if categorie is not None:
+            return empreintes(models.Produit.objects.filter(**{champ: categorie[0]})) + [(1, categorie[1])]
+    return None
 
 
 # Create your views here.
+@cache_anonymous_page
+@conditional_page(_empreintes_catalogue)
 def shop(request):
+    page = _page_produits(request, models.Produit.objects.filter(status=True))
+    return render(request, 'shop.html', _datas_catalogue(request, page))
+
+
+@require_GET
+def shop_suite(request):
+    """Page suivante du catalogue, en fragments HTML (grille et liste) pour « Voir plus »."""
     produits = models.Produit.objects.filter(status=True)
-    datas = {
-        'produits' : produits
-    }
-    return render(request, 'shop.html', datas)
+    slug = request.GET.get('categorie')
+    if slug:
+        try:
+            _, produits = _produits_categorie(slug)
+        except models.CategorieEtablissement.DoesNotExist:
+            return JsonResponse({'message': 'Catégorie introuvable'}, status=404)
+    try:
+        page = pagination.paginer(filtrer_produits(request, produits), request.GET.get('tri'), request.GET.get('curseur'))
+    except pagination.CurseurInvalide:
+        return JsonResponse({'message': 'Curseur invalide'}, status=400)
+    images.precharger(produit.image for produit in page.produits)
+    datas = {'produits': page.produits}
+    return JsonResponse({
+        'grille': render_to_string('produits-grille.html', datas, request=request),
+        'liste': render_to_string('produits-liste.html', datas, request=request),
+        'suivant': page.suivant,
+    })
 
 
+@cache_anonymous_page
+@conditional_page(_empreintes_produit)
 def product_detail(request, slug):
-    produit = get_object_or_404(Produit, slug=slug)
-    produits = Produit.objects.filter(categorie=produit.categorie).exclude(id=produit.id)[:3]
+    produit = get_object_or_404(Produit.objects.with_effective_price(), slug=slug)
+    produits = Produit.objects.with_effective_price().filter(categorie=produit.categorie).exclude(id=produit.id)[:3]
+    images.precharger([produit.image, produit.image_2, produit.image_3] + [p.image for p in produits])
 
-    
     is_favorited = False
     if request.user.is_authenticated:
         is_favorited = Favorite.objects.filter(user=request.user, produit=produit).exists()
@@ -86,22 +195,16 @@ def paiement_success(request):
         return redirect('index')
 
 
+@cache_anonymous_page
+@conditional_page(_empreintes_categorie)
 def single(request, slug):
     try:
-        try:
-            categorie = models.CategorieProduit.objects.get(slug=slug)
-            produits = categorie.produit.all()
-        except:
-            categorie = models.CategorieEtablissement.objects.get(slug=slug)
-            produits = categorie.produit_etab.all()
-    except:
+        categorie, produits = _produits_categorie(slug)
+    except models.CategorieEtablissement.DoesNotExist:
         return redirect('shop')
 
-    datas = {
-        'produits' : produits,
-        'categorie' : categorie
-    }
-    return render(request, 'shop.html', datas)
+    page = _page_produits(request, produits)
+    return render(request, 'shop.html', _datas_catalogue(request, page, categorie))
 
 
 def post_paiement_details(request):
@@ -119,48 +222,18 @@ def post_paiement_details(request):
     _ = isSuccess
     if user and panier is not None and transaction_id is not None and notify_url is not None and return_url is not None :
         try:
-            panier = customer_models.Panier.objects.get(id=panier, customer=user.customer)
-        except:
-            panier = None
-
-        if panier:
-            data = {
-                'amount': 100,
-                'currency': "XOF",
-                'transaction_id': transaction_id,
-                'description': "TRANSACTION DESCRIPTION",
-                'return_url': notify_url,
-                'notify_url': return_url,
-                'customer_name': user.first_name,
-                'customer_surname': user.last_name,
-            }
-
-            try:
-
-                commande = customer_models.Commande()
-                commande.customer = request.user.customer
-                commande.payment_url = 'payment_url'
-                commande.id_paiment = transaction_id
-                commande.transaction_id = transaction_id
-                commande.api_response_id = 'api_response_id'
-                commande.payment_token = 'payment_token'
-                commande.prix_total = panier.total_with_coupon
-                commande.save()
-
-                for i in customer_models.ProduitPanier.objects.filter(panier=panier):
-                    i.panier = None
-                    i.commande = commande
-                    i.save()
-                isSuccess = True
-                message = "Commande validée"
-                panier.delete()
-
-            except Exception as _:
-                isSuccess = False
-                message = "Une erreur s'est produite, merci de rééssayer"
-        else:
+            passer_commande(user.customer, panier, transaction_id)
+            isSuccess = True
+            message = "Commande validée"
+        except StockInsuffisant:
+            isSuccess = False
+            message = "Stock insuffisant pour un des produits du panier"
+        except CheckoutError:
             isSuccess = False
             message = "Une erreur s'est produite"
+        except Exception as _:
+            isSuccess = False
+            message = "Une erreur s'est produite, merci de rééssayer"
     else:
         isSuccess = False
         message = "Une erreur s'est produite"
@@ -181,26 +254,20 @@ def dashboard(request):
     total_articles = Produit.objects.filter(etablissement=etablissement).count()
 
     
-    today = timezone.now().date()
-    commandes_aujourdhui = Commande.objects.filter(
-        produit_commande__produit__etablissement=etablissement,
-        date_add__date=today
-    ).distinct().count()
-
-    
-    total_commandes = Commande.objects.filter(produit_commande__produit__etablissement=etablissement).distinct().count()
+    # Compteurs lus dans le cumul journalier (shop.ventes), sans parcourir les commandes
+    resume = ventes.resume(etablissement)
 
     
-    derniers_articles = Produit.objects.filter(etablissement=etablissement).order_by("-date_add")[:5]
+    derniers_articles = Produit.objects.filter(etablissement=etablissement).order_by("-date_add", "-id")[:5]
 
     
-    dernieres_commandes = Commande.objects.filter(produit_commande__produit__etablissement=etablissement).distinct().order_by("-date_add")[:5]
+    dernieres_commandes = etablissement.sous_commandes.order_by("-date_add", "-pk")[:5]
 
     context = {
         "etablissement": etablissement,
         "total_articles": total_articles,
-        "commandes_aujourdhui": commandes_aujourdhui,
-        "total_commandes": total_commandes,
+        "commandes_aujourdhui": resume["commandes_aujourdhui"],
+        "total_commandes": resume["total_commandes"],
         "derniers_articles": derniers_articles,
         "dernieres_commandes": dernieres_commandes,
     }
@@ -257,7 +324,7 @@ def article_detail(request):
     category_filter = request.GET.get("category", "")
 
     if search_query:
-        articles = articles.filter(nom__icontains=search_query)
+        articles = search.filtrer(articles, search_query).order_by('-pertinence', '-id')
 
     if category_filter:
         articles = articles.filter(categorie__nom=category_filter)
@@ -324,32 +391,40 @@ def supprimer_article(request, article_id):
 @login_required
 def commande_reçu(request):
     etablissement = get_object_or_404(Etablissement, user=request.user)
-    commandes_list = Commande.objects.filter(produit_commande__produit__etablissement=etablissement).distinct().order_by('-date_add')
+    # Une sous-commande par commande et par établissement : parcours d'index, sans distinct()
+    commandes_list = customer_models.SousCommande.objects.filter(etablissement=etablissement)
 
     # 📌 Filtrage par client
     client = request.GET.get("client")
     if client:
-        commandes_list = commandes_list.filter(customer__user__first_name__icontains=client).order_by('-date_add')
+        commandes_list = commandes_list.filter(commande__customer__user__first_name__icontains=client)
 
     # 📌 Filtrage par produit
     produit = request.GET.get("produit")
     if produit:
-        commandes_list = commandes_list.filter(produit_commande__produit__nom__icontains=produit).order_by('-date_add')
+        commandes_list = commandes_list.filter(Exists(customer_models.ProduitPanier.objects.filter(
+            commande=OuterRef('commande_id'), produit__etablissement=etablissement, produit__nom__icontains=produit)))
 
     # 📌 Filtrage par statut
     status = request.GET.get("status")
     if status == "payée":
-        commandes_list = commandes_list.filter(status=True).order_by('-date_add')
+        commandes_list = commandes_list.filter(status=True)
     elif status == "attente":
-        commandes_list = commandes_list.filter(status=False).order_by('-date_add')
+        commandes_list = commandes_list.filter(status=False)
 
     # 📌 Filtrage par date
     date_min = request.GET.get("date_min")
     date_max = request.GET.get("date_max")
     if date_min:
-        commandes_list = commandes_list.filter(date_add__gte=date_min).order_by('-date_add')
+        commandes_list = commandes_list.filter(date_add__gte=date_min)
     if date_max:
-        commandes_list = commandes_list.filter(date_add__lte=date_max).order_by('-date_add')
+        commandes_list = commandes_list.filter(date_add__lte=date_max)
+
+    premier_produit = customer_models.ProduitPanier.objects.filter(
+        commande=OuterRef('commande_id'), produit__etablissement=OuterRef('etablissement_id'),
+    ).order_by('pk').values('produit__nom')[:1]
+    commandes_list = commandes_list.select_related('commande__customer__user') \
+        .annotate(premier_produit=Subquery(premier_produit)).order_by('-date_add', '-pk')
 
     paginator = Paginator(commandes_list, 25)
     page_number = request.GET.get("page")
@@ -361,9 +436,19 @@ def commande_reçu(request):
 @login_required
 def commande_reçu_detail(request, commande_id):
     etablissement = get_object_or_404(Etablissement, user=request.user)
-    commande = get_object_or_404(Commande, id=commande_id, produit_commande__produit__etablissement=etablissement)
-
-    return render(request, "commande-reçu-detail.html", {"commande": commande,"etablissement": etablissement,})
+    sous_commande = get_object_or_404(
+        customer_models.SousCommande.objects.select_related('commande__customer__user'),
+        commande_id=commande_id, etablissement=etablissement,
+    )
+    # Seuls les articles de l'établissement
+    lignes = customer_models.ProduitPanier.objects.filter(commande_id=commande_id, produit__etablissement=etablissement).au_prix_de_la_commande()
+
+    return render(request, "commande-reçu-detail.html", {
+        "commande": sous_commande.commande,
+        "sous_commande": sous_commande,
+        "lignes": lignes,
+        "etablissement": etablissement,
+    })
 
 
 @login_required(login_url='login')
@@ -0,0 +1,46 @@
+// Saisie semi-automatique des villes.
+// <input data-city-typeahead data-url="..." data-target="id-du-champ-cache" list="id-datalist">
+(function () {
+    function bind(input) {
+        var hidden = document.getElementById(input.dataset.target);
+        var list = document.getElementById(input.getAttribute('list'));
+        var choices = {};
+        var timer = null;
+
+        function select(id) {
+            hidden.value = id;
+            // Permet à v-model (Vue) de suivre le champ caché
+            hidden.dispatchEvent(new Event('input'));
+        }
+
+        input.addEventListener('input', function () {
+            var label = input.value;
+            if (choices[label] !== undefined) {
+                select(choices[label]);
+                return;
+            }
+            select('');
+            clearTimeout(timer);
+            if (label.trim().length < 2) {
+                return;
+            }
+            timer = setTimeout(function () {
+                fetch(input.dataset.url + '?q=' + encodeURIComponent(label))
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        list.innerHTML = '';
+                        choices = {};
+                        data.results.forEach(function (city) {
+                            var text = city.region ? city.name + ' (' + city.region + ')' : city.name;
+                            var option = document.createElement('option');
+                            option.value = text;
+                            list.appendChild(option);
+                            choices[text] = city.id;
+                        });
+                    });
+            }, 150);
+        });
+    }
+
+    document.querySelectorAll('[data-city-typeahead]').forEach(bind);
+})();
@@ -0,0 +1,31 @@
+// Bouton « Voir plus » du catalogue (pagination par curseur).
+// <a data-load-more data-url="..." data-curseur="...">
+(function () {
+    function bind(button) {
+        var grille = document.getElementById('produits-grille');
+        var liste = document.getElementById('produits-liste');
+        var loading = false;
+
+        button.addEventListener('click', function (event) {
+            event.preventDefault();
+            if (loading) {
+                return;
+            }
+            loading = true;
+            fetch(button.dataset.url + '&curseur=' + encodeURIComponent(button.dataset.curseur))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    grille.insertAdjacentHTML('beforeend', data.grille);
+                    liste.insertAdjacentHTML('beforeend', data.liste);
+                    if (data.suivant) {
+                        button.dataset.curseur = data.suivant;
+                    } else {
+                        button.parentNode.removeChild(button);
+                    }
+                })
+                .finally(function () { loading = false; });
+        });
+    }
+
+    document.querySelectorAll('[data-load-more]').forEach(bind);
+})();
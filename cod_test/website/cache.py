@@ -0,0 +1,148 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.timezone import localdate
+from django.utils.translation import get_language
+
+
+CHROME_VERSION_KEY = 'website:chrome:version'
+CHROME_TIMEOUT = 60 * 60 * 24
+
+PAGES_VERSION_KEY = 'website:pages:version'
+PAGE_TIMEOUT = 60 * 5
+
+# Durée de vie des tampons de version : leur expiration vaut invalidation, et borne le
+# retard d'un processus qui n'aurait qu'un cache local (CACHE_URL=locmem://)
+VERSION_TIMEOUT = 60 * 60
+
+_MISSING = object()
+
+# En-têtes gardés avec la page en cache (posés par website.conditional.conditional_page)
+PAGE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+# Copie locale au processus : {nom: (version, valeur)}
+_local = {}
+
+
+def _initial_version():
+    # Horodatage en millisecondes : une version recréée après éviction du
+    # cache ne peut pas retomber sur une version déjà utilisée.
+    return int(time.time() * 1000)
+
+
+def get_version(key, timeout=VERSION_TIMEOUT):
+    """Version courante de `key`, créée si besoin ; timeout=None pour un tampon sans expiration."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key, timeout=VERSION_TIMEOUT):
+    # Pas de cache.incr : hors Redis et locmem, il réécrit la clé sans sa durée de vie
+    version = max(_initial_version(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout)
+
+
+def get_chrome_version():
+    return get_version(CHROME_VERSION_KEY)
+
+
+def bump_chrome_version():
+    bump_version(CHROME_VERSION_KEY)
+
+
+def get_chrome(name, builder):
+    """Retourne la donnée `name` de l'habillage du site pour la version courante.
+
+    La valeur est cherchée dans la copie du processus, puis dans le cache
+    partagé, et n'est construite par `builder()` qu'en dernier recours.
+    """
+    version = get_chrome_version()
+    entry = _local.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    key = 'website:chrome:%s:%s' % (name, version)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = builder()
+        cache.set(key, value, CHROME_TIMEOUT)
+    _local[name] = (version, value)
+    return value
+
+
+def bump_pages_version():
+    bump_version(PAGES_VERSION_KEY)
+
+
+def _anonyme(request):
+    # Sans cookie de session, inutile de charger l'utilisateur (et la session) pour le savoir
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES or not request.user.is_authenticated
+
+
+def _page_key(request):
+    # Le jour en fait partie : les promotions commencent et finissent à minuit. CONDITIONAL_GET_VERSION
+    # aussi : le cache est partagé et survit au déploiement de nouveaux gabarits.
+    url = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'website:page:%s:%s:%s:%s:%s' % (
+        getattr(settings, 'CONDITIONAL_GET_VERSION', ''), get_version(PAGES_VERSION_KEY), get_language(),
+        localdate().isoformat(), url,
+    )
+
+
+def cache_anonymous_page(view):
+    """Met en cache la page entière pour les visiteurs anonymes (GET), par URL et langue.
+
+    La page est rendue avec request.page_cache : le mini-panier n'y figure pas et se charge
+    à part (customer.views.mini_panier). Le cache est invalidé par la sauvegarde des produits,
+    catégories et contenus du site (website.signals) ; une page contenant un jeton CSRF
+    n'est jamais mise en cache. ETag et Last-Modified sont gardés avec la page : une page
+    en cache répond aux GET conditionnels (304) sans requête.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not _anonyme(request):
+            return view(request, *args, **kwargs)
+
+        # Cookie CSRF des appels axios, que la page vienne du cache ou non
+        get_token(request)
+        key = _page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type, headers = cached
+            response = None
+            if 'ETag' in headers or 'Last-Modified' in headers:
+                response = get_conditional_response(
+                    request, etag=headers.get('ETag'),
+                    last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+                )
+            if response is None:
+                response = HttpResponse(content, content_type=content_type)
+            for header, value in headers.items():
+                response[header] = value
+            response['X-Page-Cache'] = 'hit'
+            return response
+
+        request.page_cache = True
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200 and not response.streaming and not response.cookies
+            and b'csrfmiddlewaretoken' not in response.content
+        ):
+            headers = {header: response[header] for header in PAGE_HEADERS if response.has_header(header)}
+            cache.set(
+                key, (response.content, response['Content-Type'], headers),
+                getattr(settings, 'PAGE_CACHE_TIMEOUT', PAGE_TIMEOUT),
+            )
+        response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
@@ -0,0 +1,55 @@
+import bisect
+import unicodedata
+
+from cities_light.models import City
+
+from .cache import get_version
+
+
+CITIES_VERSION_KEY = 'website:cities:version'
+# Sans expiration : reconstruire l'index coûte cher et les villes ne changent que par
+# les signaux de City et Region (website.signals), qui incrémentent le tampon
+CITIES_VERSION_TIMEOUT = None
+
+# Index du processus : (version, clés normalisées triées, entrées alignées)
+_index = None
+
+
+def normalize(value):
+    """Minuscules, sans accents ni tirets : « Grand-Bassam » -> « grand bassam »."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.lower().replace('-', ' ').replace("'", ' ').split())
+
+
+def _build_index():
+    entries = sorted(
+        (normalize(name), id, name, region or '')
+        for id, name, region in City.objects.values_list('id', 'name', 'region__name')
+    )
+    keys = [entry[0] for entry in entries]
+    return keys, entries
+
+
+def get_index():
+    global _index
+    version = get_version(CITIES_VERSION_KEY, CITIES_VERSION_TIMEOUT)
+    if _index is None or _index[0] != version:
+        keys, entries = _build_index()
+        _index = (version, keys, entries)
+    return _index
+
+
+def search(query, limit=10):
+    """Villes dont le nom commence par `query`, sans tenir compte des accents."""
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    _, keys, entries = get_index()
+    results = []
+    position = bisect.bisect_left(keys, prefix)
+    while position < len(keys) and keys[position].startswith(prefix) and len(results) < limit:
+        _, id, name, region = entries[position]
+        results.append({'id': id, 'name': name, 'region': region})
+        position += 1
+    return results
@@ -0,0 +1,89 @@
+import calendar
+import datetime
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Value
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from base.models import ImageDerivee
+
+from .cache import _anonyme, get_chrome_version
+
+
+def requete_empreinte(queryset, rang=0):
+    """SELECT rang, COUNT(id), MAX(date_update) des lignes de `queryset`, sans GROUP BY.
+
+    Avec un index (colonnes filtrées..., date_update), SQLite comme PostgreSQL
+    y répondent depuis l'index seul.
+    """
+    return (
+        queryset.order_by().annotate(_rang=Value(rang)).values('_rang')
+        .annotate(n=Count('pk'), m=Max('date_update')).values_list('_rang', 'n', 'm')
+    )
+
+
+def empreintes(*querysets):
+    """[(nombre de lignes, dernière date_update)] de chaque queryset, en une requête (UNION ALL).
+
+    Le nombre de lignes trahit les suppressions, que la date seule ne voit pas. Les rendus
+    d'images (base.ImageDerivee) s'y ajoutent toujours : les pages affichent leurs srcset.
+    """
+    querysets = querysets + (ImageDerivee.objects.all(),)
+    requetes = [requete_empreinte(queryset, rang) for rang, queryset in enumerate(querysets)]
+    lignes = requetes[0].union(*requetes[1:], all=True)
+    return [(n, m) for _, n, m in sorted(lignes, key=lambda ligne: ligne[0])]
+
+
+def _debut_du_jour():
+    # Les promotions commencent et finissent à minuit : une page n'est jamais plus vieille
+    return timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time()))
+
+
+def conditional_page(validateurs):
+    """GET conditionnel (ETag, Last-Modified) des pages du catalogue pour les visiteurs anonymes.
+
+    `validateurs(*args, **kwargs)` reçoit les arguments de la vue et renvoie la liste des
+    empreintes (voir empreintes()) des lignes affichées, ou None si la page n'existe pas.
+    L'ETag y ajoute la version de l'habillage, la langue, le jour et CONDITIONAL_GET_VERSION,
+    à changer quand les gabarits changent. Un 304 évite le rendu.
+
+    À placer sous cache_anonymous_page, qui garde ETag et Last-Modified avec la page : les
+    empreintes ne sont calculées qu'au rendu, pas quand la page vient du cache.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not _anonyme(request):
+                return view(request, *args, **kwargs)
+
+            lignes = validateurs(*args, **kwargs)
+            if lignes is None:
+                return view(request, *args, **kwargs)
+
+            dates = [date for _, date in lignes if date is not None]
+            last_modified = calendar.timegm(max(dates + [_debut_du_jour()]).utctimetuple())
+            etag = quote_etag(hashlib.md5(repr((
+                getattr(settings, 'CONDITIONAL_GET_VERSION', ''), get_chrome_version(), get_language(),
+                timezone.localdate().isoformat(), [(n, date and date.isoformat()) for n, date in lignes],
+            )).encode()).hexdigest())
+
+            # Cookie CSRF des appels axios, même sur un 304
+            get_token(request)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+            # Le navigateur revalide à chaque visite : la page reste à jour, le 304 ne coûte que les empreintes
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
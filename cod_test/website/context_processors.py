@@ -1,68 +1,57 @@
 from shop import models
 from . import models as config_models
-from customer import models as customer_models
-from django.contrib.sessions.models import Session
-from cities_light.models import City
+from . import cache as chrome_cache
+from customer import utils as customer_utils
+from django.utils.functional import SimpleLazyObject
 
 
-def categories(request):
-    cat = models.CategorieEtablissement.objects.filter(status=True)
-
-    return {'cat':cat}
+def _categories():
+    return list(models.CategorieEtablissement.objects.filter(status=True))
 
 
-def site_infos(request):
+def _site_infos():
     try:
-        infos = config_models.SiteInfo.objects.latest('date_add')
-    except:
-        infos = None
-    return {'infos':infos}
+        return config_models.SiteInfo.objects.latest('date_add')
+    except config_models.SiteInfo.DoesNotExist:
+        return None
 
 
-def cities(request):
+def _galeries():
+    return list(config_models.Galerie.objects.filter(status=True)[:6])
 
-    cities = City.objects.all()
 
-    return {'cities': cities}
+def _horaires():
+    return list(config_models.Horaire.objects.filter(status=True))
 
 
-def galeries(request):
-    galerie = config_models.Galerie.objects.filter(status=True)[:6]
+def _lazy_chrome(name, builder):
+    return SimpleLazyObject(lambda: chrome_cache.get_chrome(name, builder))
 
-    return {'galeries':galerie}
 
+def categories(request):
+    return {'cat': _lazy_chrome('categories', _categories)}
+
+
+def site_infos(request):
+    return {'infos': _lazy_chrome('site_infos', _site_infos)}
 
-def horaires(request):
-    horaire = config_models.Horaire.objects.filter(status=True)
 
-    return {'horaires':horaire}
+def galeries(request):
+    return {'galeries': _lazy_chrome('galeries', _galeries)}
+
+
+def horaires(request):
+    return {'horaires': _lazy_chrome('horaires', _horaires)}
 
 
 def cart(request):
-    carts = ""
-    try:
-        if not request.session.exists(request.session.session_key):
-            request.session.create()
-        session_id = Session.objects.get(session_key=request.session.session_key)
-        if request.user.is_authenticated:
-            try:
-                customer = customer_models.Customer.objects.get(user=request.user)
-                carts = customer_models.Panier.objects.get(customer=customer, session_id=session_id)
-            except Exception as e:
-
-                customer = customer_models.Customer.objects.get(user=request.user)
-                carts = customer_models.Panier()
-                carts.session_id = session_id
-                carts.customer = customer
-                carts.save()
-        else:
-            try:
-                carts = customer_models.Panier.objects.get(session_id=session_id)
-            except Exception as e:
-
-                carts = customer_models.Panier()
-                carts.session_id = session_id
-                carts.save()
-    except:
-        pass
-    return {'cart':carts}
\ No newline at end of file
+    if getattr(request, 'page_cache', False):
+        # Page servie à tous les visiteurs anonymes : pas de panier, le mini-panier se charge à part
+        return {'cart': None, 'cart_summary': None}
+    # Panier et résumé du mini-panier résolus paresseusement : aucune requête
+    # tant que le template ne les lit pas, et aucune écriture avant le premier
+    # ajout au panier (customer.views.add_to_cart).
+    return {
+        'cart': customer_utils.lazy_cart(request),
+        'cart_summary': customer_utils.lazy_cart_summary(request),
+    }
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_siteinfo_icon'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='about',
+            name='date_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='appreciation',
+            name='date_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='banniere',
+            name='date_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='partenaire',
+            name='date_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -46,7 +46,7 @@ class Banniere(models.Model):
     couverture = models.ImageField(upload_to="media/bannieres", null=True)
 
     date_add = models.DateTimeField(auto_now_add=True)
-    date_update = models.DateTimeField(auto_now=True)
+    date_update = models.DateTimeField(auto_now=True, db_index=True)
     status = models.BooleanField(default=False)
 
     def __str__(self):
@@ -61,7 +61,7 @@ class Appreciation(models.Model):
     role = models.CharField(max_length=254)
 
     date_add = models.DateTimeField(auto_now_add=True)
-    date_update = models.DateTimeField(auto_now=True)
+    date_update = models.DateTimeField(auto_now=True, db_index=True)
     status = models.BooleanField(default=False)
 
     def __str__(self):
@@ -76,7 +76,7 @@ class About(models.Model):
     image = models.ImageField(upload_to="media/bannieres", null=True)
 
     date_add = models.DateTimeField(auto_now_add=True)
-    date_update = models.DateTimeField(auto_now=True)
+    date_update = models.DateTimeField(auto_now=True, db_index=True)
     status = models.BooleanField(default=False)
 
     class Meta:
@@ -140,7 +140,7 @@ class Partenaire(models.Model):
     image = models.ImageField(upload_to="media/bannieres", null=True)
 
     date_add = models.DateTimeField(auto_now_add=True)
-    date_update = models.DateTimeField(auto_now=True)
+    date_update = models.DateTimeField(auto_now=True, db_index=True)
     status = models.BooleanField(default=False)
 
     def __str__(self):
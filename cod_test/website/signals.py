@@ -0,0 +1,60 @@
+from cities_light.models import City, Region
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from shop import models as shop_models
+from . import models
+from .cache import bump_chrome_version, bump_pages_version, bump_version
+from .cities import CITIES_VERSION_KEY, CITIES_VERSION_TIMEOUT
+
+
+CHROME_MODELS = (
+    shop_models.CategorieEtablissement,
+    models.SiteInfo,
+    models.Galerie,
+    models.Horaire,
+)
+
+
+def chrome_changed(sender, **kwargs):
+    bump_chrome_version()
+    # Seconde incrémentation après le commit : une page rendue entre la
+    # sauvegarde et le commit ne peut pas garder des données périmées en cache.
+    transaction.on_commit(bump_chrome_version)
+
+
+for model in CHROME_MODELS:
+    post_save.connect(chrome_changed, sender=model, dispatch_uid='chrome_save_%s' % model._meta.label_lower)
+    post_delete.connect(chrome_changed, sender=model, dispatch_uid='chrome_delete_%s' % model._meta.label_lower)
+
+
+# Modèles affichés par les pages mises en cache pour les visiteurs anonymes (cache_anonymous_page)
+PAGE_MODELS = (
+    shop_models.Produit,
+    shop_models.CategorieProduit,
+    shop_models.CategorieEtablissement,
+    shop_models.Etablissement,
+    apps.get_model('base', 'ImageDerivee'),
+    *apps.get_app_config('website').get_models(),
+)
+
+
+def pages_changed(sender, **kwargs):
+    bump_pages_version()
+    transaction.on_commit(bump_pages_version)
+
+
+for model in PAGE_MODELS:
+    post_save.connect(pages_changed, sender=model, dispatch_uid='pages_save_%s' % model._meta.label_lower)
+    post_delete.connect(pages_changed, sender=model, dispatch_uid='pages_delete_%s' % model._meta.label_lower)
+
+
+def cities_changed(sender, **kwargs):
+    bump_version(CITIES_VERSION_KEY, CITIES_VERSION_TIMEOUT)
+
+
+# L'index contient aussi le nom de la région de chaque ville
+for model in (City, Region):
+    post_save.connect(cities_changed, sender=model, dispatch_uid='cities_save_%s' % model._meta.label_lower)
+    post_delete.connect(cities_changed, sender=model, dispatch_uid='cities_delete_%s' % model._meta.label_lower)
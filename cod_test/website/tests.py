@@ -1,11 +1,17 @@
-from django.test import TestCase, RequestFactory
+import time
+
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.urls import reverse
+from cities_light.models import City, Country, Region
 
+from base.models import ImageDerivee
 from customer.models import Customer, Panier
-from website import context_processors, models
+from website import cities, context_processors, models
+from website.cache import VERSION_TIMEOUT, bump_chrome_version, bump_pages_version, get_chrome_version
 from website.models import SiteInfo, Galerie, Horaire
-from shop.models import CategorieEtablissement
+from shop.models import CategorieEtablissement, CategorieProduit, Etablissement, Produit
 from unittest.mock import patch, MagicMock
 
 # Create your tests here.
@@ -21,13 +27,17 @@ def _add_session_to_request(request):
 class WebsiteContextProcessorsTests(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
+        # Les données d'habillage sont mises en cache : repartir d'une version neuve
+        bump_chrome_version()
 
     # --- SiteInfo Tests ---
     def test_site_infos_returns_none_when_no_siteinfo(self):
         request = self.factory.get("/")
         ctx = context_processors.site_infos(request)
         self.assertIn("infos", ctx)
-        self.assertIsNone(ctx["infos"])
+        # SimpleLazyObject : la valeur résolue est None
+        ctx["infos"]._setup()
+        self.assertIsNone(ctx["infos"]._wrapped)
 
     def test_site_infos_returns_latest_siteinfo(self):
         SiteInfo.objects.create(
@@ -81,8 +91,8 @@ class WebsiteContextProcessorsTests(TestCase):
         ctx = context_processors.categories(request)
         
         self.assertIn("cat", ctx)
-        self.assertEqual(ctx["cat"].count(), 1)
-        self.assertEqual(ctx["cat"].first().nom, "Active")
+        self.assertEqual(len(ctx["cat"]), 1)
+        self.assertEqual(ctx["cat"][0].nom, "Active")
 
     def test_categories_returns_empty_when_none_active(self):
         CategorieEtablissement.objects.create(nom="Inactive", description="d", status=False)
@@ -90,7 +100,7 @@ class WebsiteContextProcessorsTests(TestCase):
         request = self.factory.get("/")
         ctx = context_processors.categories(request)
         
-        self.assertEqual(ctx["cat"].count(), 0)
+        self.assertEqual(len(ctx["cat"]), 0)
 
     # --- Galeries Tests ---
     def test_galeries_returns_max_6_items(self):
@@ -121,54 +131,234 @@ class WebsiteContextProcessorsTests(TestCase):
         ctx = context_processors.horaires(request)
         
         self.assertIn("horaires", ctx)
-        self.assertEqual(ctx["horaires"].count(), 1)
+        self.assertEqual(len(ctx["horaires"]), 1)
+
+    # --- Chrome cache Tests ---
+    def test_chrome_context_processors_are_cached(self):
+        Horaire.objects.create(titre="Lundi", description="9h-17h", status=True)
+        request = self.factory.get("/")
+
+        self.assertEqual(len(context_processors.horaires(request)["horaires"]), 1)
+        with self.assertNumQueries(0):
+            ctx = context_processors.horaires(request)
+            self.assertEqual(len(ctx["horaires"]), 1)
+
+    def test_chrome_context_processors_are_lazy(self):
+        request = self.factory.get("/")
+        with self.assertNumQueries(0):
+            context_processors.categories(request)
+            context_processors.site_infos(request)
+            context_processors.galeries(request)
+            context_processors.horaires(request)
+
+    def test_chrome_cache_invalidated_on_save_and_delete(self):
+        request = self.factory.get("/")
+        cat = CategorieEtablissement.objects.create(nom="Resto", description="d", status=True)
+        self.assertEqual(len(context_processors.categories(request)["cat"]), 1)
+
+        cat.nom = "Restaurant"
+        cat.save()
+        self.assertEqual(context_processors.categories(request)["cat"][0].nom, "Restaurant")
+
+        cat.delete()
+        self.assertEqual(len(context_processors.categories(request)["cat"]), 0)
+
+    def test_version_stamp_grows_and_expires(self):
+        avant = get_chrome_version()
+        bump_chrome_version()
+        bump_chrome_version()
+        self.assertGreaterEqual(get_chrome_version(), avant + 2)
+        # Expiré, le tampon repart de l'horloge : une version neuve, donc tout est invalidé
+        plus_tard = time.time() + VERSION_TIMEOUT + 1
+        with patch("time.time", return_value=plus_tard):
+            self.assertEqual(get_chrome_version(), int(plus_tard * 1000))
 
     # --- Cart Tests ---
-    def test_cart_context_processor_creates_cart_for_anonymous(self):
+    def test_cart_context_processor_is_lazy_and_write_free_for_anonymous(self):
         request = self.factory.get("/")
         request.user = AnonymousUser()
         _add_session_to_request(request)
 
-        ctx = context_processors.cart(request)
+        with self.assertNumQueries(0):
+            ctx = context_processors.cart(request)
         self.assertIn("cart", ctx)
-        self.assertIsInstance(ctx["cart"], Panier)
-        self.assertIsNotNone(ctx["cart"].id)
+        self.assertIn("cart_summary", ctx)
 
-    def test_cart_context_processor_creates_cart_for_authenticated_user(self):
+        # Aucune ligne Panier n'est créée à la lecture
+        self.assertFalse(ctx["cart"])
+        self.assertEqual(ctx["cart_summary"]["count"], 0)
+        self.assertEqual(Panier.objects.count(), 0)
+
+    def test_cart_context_processor_returns_existing_cart_for_authenticated_user(self):
         user = User.objects.create_user(username="u1", password="pass")
-        Customer.objects.create(user=user, adresse="addr", contact_1="01020304")
+        customer = Customer.objects.create(user=user, adresse="addr", contact_1="01020304")
 
         request = self.factory.get("/")
         request.user = user
         _add_session_to_request(request)
+        panier = Panier.objects.create(customer=customer, session_id_id=request.session.session_key)
 
         ctx = context_processors.cart(request)
-        self.assertIn("cart", ctx)
-        self.assertIsInstance(ctx["cart"], Panier)
+        self.assertEqual(ctx["cart"].id, panier.id)
         self.assertEqual(ctx["cart"].customer.user_id, user.id)
 
-    def test_cart_context_processor_handles_exception_gracefully(self):
-        """Tester que le processeur de panier retourne une chaîne vide en cas d'exception (comportement actuel)"""
+    def test_cart_context_processor_without_session(self):
+        """Sans session, le panier est vide et aucune requête n'est exécutée"""
         request = self.factory.get("/")
         request.user = AnonymousUser()
-        # Ne pas ajouter de session - cela causera une exception
-        
+
         ctx = context_processors.cart(request)
-        self.assertIn("cart", ctx)
-        # L'implémentation actuelle retourne "" en cas d'exception
-        self.assertEqual(ctx["cart"], "")
+        with self.assertNumQueries(0):
+            self.assertFalse(ctx["cart"])
+            self.assertEqual(ctx["cart_summary"]["lignes"], [])
 
-    # --- Cities Tests ---
-    @patch("website.context_processors.City")
-    def test_cities_returns_all_cities(self, mock_city):
-        mock_city.objects.all.return_value = ["Abidjan", "Bouaké"]
-        
+    def test_cart_summary_is_cached_until_cart_changes(self):
         request = self.factory.get("/")
-        ctx = context_processors.cities(request)
-        
-        self.assertIn("cities", ctx)
-        self.assertEqual(ctx["cities"], ["Abidjan", "Bouaké"])
+        request.user = AnonymousUser()
+        _add_session_to_request(request)
+        panier = Panier.objects.create(session_id_id=request.session.session_key)
+
+        self.assertEqual(context_processors.cart(request)["cart_summary"]["count"], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(context_processors.cart(request)["cart_summary"]["count"], 0)
+
+        panier.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(context_processors.cart(request)["cart_summary"]["panier_id"], panier.id)
+
+
+class WebsitePageCacheTests(TestCase):
+    def setUp(self):
+        bump_pages_version()
+        seller = User.objects.create_user(username="vendeur_cache", password="pass")
+        cat_etab = CategorieEtablissement.objects.create(nom="Resto", description="d")
+        self.cat_prod = CategorieProduit.objects.create(nom="Pizza", description="d", categorie=cat_etab)
+        self.etab = Etablissement.objects.create(
+            user=seller, nom="Etab", description="d", categorie=cat_etab,
+            nom_du_responsable="Kone", prenoms_duresponsable="Awa",
+            adresse="addr", pays="CI", contact_1="01020304", email="etab@example.com",
+        )
+        self.produit = Produit.objects.create(
+            nom="Margherita", description="d", description_deal="dd", prix=100,
+            categorie=self.cat_prod, etablissement=self.etab, super_deal=True,
+        )
+
+    def test_anonymous_page_is_served_from_cache(self):
+        url = reverse("product_detail", args=[self.produit.slug])
+        reponse = self.client.get(url)
+        self.assertEqual(reponse["X-Page-Cache"], "miss")
+
+        with self.assertNumQueries(0):
+            reponse = self.client.get(url)
+        self.assertEqual(reponse["X-Page-Cache"], "hit")
+        # Validateurs du GET conditionnel gardés avec la page (website.conditional)
+        self.assertTrue(reponse.has_header("ETag"))
+        self.assertTrue(reponse.has_header("Last-Modified"))
+        self.assertContains(reponse, "Margherita")
+        # Cookie CSRF posé même quand la page vient du cache (appels axios)
+        self.assertIn("csrftoken", reponse.cookies)
+        self.assertEqual(self.client.get(url + "?utm=1")["X-Page-Cache"], "miss")
+
+    def test_cached_page_holds_no_visitor_data(self):
+        self.client.post(
+            reverse("add_to_cart"), {"panier": None, "produit": self.produit.pk, "quantite": 2},
+            content_type="application/json",
+        )
+        panier = Panier.objects.get()
+
+        reponse = self.client.get(reverse("product_detail", args=[self.produit.slug]))
+        self.assertContains(reponse, 'data-mini-panier="%s"' % reverse("mini_panier"))
+        self.assertContains(reponse, "panier: ''")
+        self.assertNotContains(reponse, "csrfmiddlewaretoken")
+        self.assertNotContains(reponse, "Quantité : 2")
 
+        # Le mini-panier de la session se charge à part
+        mini = self.client.get(reverse("mini_panier"))
+        self.assertContains(mini, "Quantité : 2")
+        self.assertIn("no-cache", mini["Cache-Control"])
+        self.assertEqual(panier.produit_panier.count(), 1)
+
+    def test_saving_catalog_or_site_content_invalidates(self):
+        url = reverse("product_detail", args=[self.produit.slug])
+        self.client.get(url)
+
+        self.produit.nom = "Regina"
+        self.produit.save()
+        reponse = self.client.get(url)
+        self.assertEqual(reponse["X-Page-Cache"], "miss")
+        self.assertContains(reponse, "Regina")
+
+        self.client.get(url)
+        Horaire.objects.create(titre="Lundi", description="9h-17h", status=True)
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "miss")
+
+    def test_authenticated_users_are_not_cached(self):
+        self.client.force_login(User.objects.create_user(username="client_cache", password="pass"))
+        reponse = self.client.get(reverse("categorie", args=[self.cat_prod.slug]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotIn("X-Page-Cache", reponse)
+
+
+class WebsiteCitiesSearchTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(name="Côte d'Ivoire", code2="CI", code3="CIV", continent="AF", tld="ci")
+        lagunes = Region.objects.create(name="Lagunes", country=country)
+        comoe = Region.objects.create(name="Comoé", country=country)
+        self.abidjan = City.objects.create(name="Abidjan", country=country, region=lagunes)
+        self.abengourou = City.objects.create(name="Abengourou", country=country, region=comoe)
+        City.objects.create(name="Grand-Bassam", country=country, region=comoe)
+        City.objects.create(name="Éloka", country=country, region=lagunes)
+
+    def test_prefix_search_returns_matching_cities(self):
+        resp = self.client.get(reverse("cities_search"), {"q": "ab"})
+        self.assertEqual(resp.status_code, 200)
+        names = [c["name"] for c in resp.json()["results"]]
+        self.assertEqual(names, ["Abengourou", "Abidjan"])
+        self.assertEqual(resp.json()["results"][1], {"id": self.abidjan.id, "name": "Abidjan", "region": "Lagunes"})
+
+    def test_search_is_accent_and_hyphen_insensitive(self):
+        resp = self.client.get(reverse("cities_search"), {"q": "elo"})
+        self.assertEqual([c["name"] for c in resp.json()["results"]], ["Éloka"])
+        resp = self.client.get(reverse("cities_search"), {"q": "grand bas"})
+        self.assertEqual([c["name"] for c in resp.json()["results"]], ["Grand-Bassam"])
+
+    def test_empty_query_returns_no_results(self):
+        resp = self.client.get(reverse("cities_search"))
+        self.assertEqual(resp.json()["results"], [])
+
+    def test_search_sends_validators_and_honours_if_none_match(self):
+        url = reverse("cities_search")
+        resp = self.client.get(url, {"q": "ab"})
+        self.assertIn("max-age=3600", resp["Cache-Control"])
+        etag = resp["ETag"]
+
+        resp = self.client.get(url, {"q": "ab"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_index_is_rebuilt_when_cities_change(self):
+        url = reverse("cities_search")
+        etag = self.client.get(url, {"q": "ab"})["ETag"]
+        self.abengourou.delete()
+
+        resp = self.client.get(url, {"q": "ab"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c["name"] for c in resp.json()["results"]], ["Abidjan"])
+
+    def test_index_follows_region_changes_and_does_not_expire(self):
+        url = reverse("cities_search")
+        self.client.get(url, {"q": "abi"})
+        with patch("website.cities._build_index", wraps=cities._build_index) as reconstruire:
+            # Le tampon n'expire pas : une heure plus tard, l'index est toujours valable
+            with patch("time.time", return_value=time.time() + VERSION_TIMEOUT + 1):
+                self.client.get(url, {"q": "abi"})
+            self.assertEqual(reconstruire.call_count, 0)
+
+            lagunes = Region.objects.get(name="Lagunes")
+            lagunes.name = "Abidjan (district)"
+            lagunes.save()
+            resp = self.client.get(url, {"q": "abi"})
+        self.assertEqual(reconstruire.call_count, 1)
+        self.assertEqual(resp.json()["results"][0]["region"], "Abidjan (district)")
 
 class WebsiteModelsTests(TestCase):
     def test_site_info_str(self):
@@ -181,3 +371,83 @@ class WebsiteModelsTests(TestCase):
         self.assertEqual(str(banniere), "Banner")
 
 
+
+
+class WebsiteConditionalGetTests(TestCase):
+    def setUp(self):
+        bump_pages_version()
+        seller = User.objects.create_user(username="vendeur_etag", password="pass")
+        cat_etab = CategorieEtablissement.objects.create(nom="Resto", description="d")
+        self.cat_prod = CategorieProduit.objects.create(nom="Pizza", description="d", categorie=cat_etab)
+        self.etab = Etablissement.objects.create(
+            user=seller, nom="Etab", description="d", categorie=cat_etab,
+            nom_du_responsable="Kone", prenoms_duresponsable="Awa",
+            adresse="addr", pays="CI", contact_1="01020304", email="etab@example.com",
+        )
+        self.produit, self.autre = [
+            Produit.objects.create(
+                nom=nom, description="d", description_deal="dd", prix=100,
+                categorie=self.cat_prod, etablissement=self.etab, super_deal=True,
+            )
+            for nom in ("Margherita", "Calzone")
+        ]
+        self.url = reverse("product_detail", args=[self.produit.slug])
+
+    def test_revalidation_returns_304_without_rendering(self):
+        reponse = self.client.get(self.url)
+        self.assertIn("no-cache", reponse["Cache-Control"])
+        etag = reponse["ETag"]
+
+        # Page en cache : aucune requête
+        with self.assertNumQueries(0):
+            reponse = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse.content, b"")
+        self.assertEqual(reponse["ETag"], etag)
+        self.assertIn("csrftoken", reponse.cookies)
+
+        reponse = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=reponse["Last-Modified"])
+        self.assertEqual(reponse.status_code, 304)
+
+        # Cache vidé : seules les empreintes sont calculées, sans rendu
+        bump_pages_version()
+        with self.assertNumQueries(2):
+            reponse = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+
+    def test_catalog_pages_answer_304(self):
+        for url in (reverse("index"), reverse("shop"), reverse("categorie", args=[self.cat_prod.slug])):
+            etag = self.client.get(url)["ETag"]
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+
+    def test_changes_to_displayed_rows_change_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.autre.nom = "Regina"
+        self.autre.save()
+        reponse = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, "Regina")
+
+        # Une suppression ne change aucune date_update : le nombre de lignes la trahit
+        etag = reponse["ETag"]
+        self.autre.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Rendus d'images produits (generate_renditions) : la page gagne ses srcset
+        etag = self.client.get(self.url)["ETag"]
+        ImageDerivee.objects.create(original="produis/images/margherita.jpg", empreinte="e")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.url)["ETag"]
+        with override_settings(CONDITIONAL_GET_VERSION="2"):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authenticated_and_missing_pages_are_not_conditional(self):
+        self.assertEqual(self.client.get(reverse("product_detail", args=["inconnu"])).status_code, 404)
+
+        user = User.objects.create_user(username="visiteur_etag", password="pass")
+        self.client.force_login(user)
+        reponse = self.client.get(self.url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(reponse.status_code, 200)
+        self.assertFalse(reponse.has_header("ETag"))
@@ -5,4 +5,5 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('a-propos', views.about, name='about'),
+    path('villes', views.cities_search, name='cities_search'),
 ]
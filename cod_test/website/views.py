@@ -1,15 +1,37 @@
+import hashlib
+
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_GET
 from . import models
+from . import cities
 from shop import models as shop_models
+from base import images
+from .cache import cache_anonymous_page
+from .conditional import conditional_page, empreintes
+
+
+def _empreintes_accueil():
+    return empreintes(*(
+        modele.objects.all()
+        for modele in (shop_models.Produit, models.About, models.Partenaire, models.Banniere, models.Appreciation)
+    ))
 
 
 # Create your views here.
+@cache_anonymous_page
+@conditional_page(_empreintes_accueil)
 def index(request):
     about = models.About.objects.filter(status=True)[:1]
     partenaires = models.Partenaire.objects.filter(status=True)[:5]
     bannieres = models.Banniere.objects.filter(status=True)[:4]
     appreciations = models.Appreciation.objects.filter(status=True)
-    produits = shop_models.Produit.objects.filter(super_deal=True)[:3]
+    produits = shop_models.Produit.objects.filter(super_deal=True).order_by('-date_add', '-id')[:3]
+    images.precharger(
+        [b.couverture for b in bannieres] + [a.image for a in about]
+        + [p.image for p in produits] + [p.image for p in partenaires]
+    )
     datas = {
         'about': about,
         'partenaires': partenaires,
@@ -21,6 +43,7 @@ def index(request):
     return render(request, 'index.html', datas)
 
 
+@cache_anonymous_page
 def about(request):
     about = models.About.objects.filter(status=True)[:1]
     why_choose = models.WhyChooseUs.objects.filter(status=True)[:3]
@@ -29,4 +52,17 @@ def about(request):
         'why_choose': why_choose,
 
     }
-    return render(request, 'about-us.html', datas)
\ No newline at end of file
+    return render(request, 'about-us.html', datas)
+
+
+def _cities_etag(request):
+    query = cities.normalize(request.GET.get('q', ''))
+    version = cities.get_index()[0]
+    return '%s-%s' % (version, hashlib.md5(query.encode('utf-8')).hexdigest())
+
+
+@require_GET
+@cache_control(public=True, max_age=60 * 60)
+@etag(_cities_etag)
+def cities_search(request):
+    return JsonResponse({'results': cities.search(request.GET.get('q', ''))})